@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: COMSOL client startup paid once per model vs. once per session.
+
+"per model" runs every build in a fresh Python process that starts its own
+client, which is what calling create_h2storagemodel from separate scripts
+costs. "shared" starts one client and builds all models on it, removing each
+model afterwards.
+
+    python benchmarks/client_reuse.py --models 5 --cores 4 --dimension 2d
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BUILD = ("import sys; sys.path.insert(0, {root!r}); import hydrogen_storage as hs; "
+         "hs.number_of_cores = {cores}; hs.create_h2storagemodel({criterion!r}, {dimension!r})")
+
+
+def per_model(models, cores, criterion, dimension):
+    code = BUILD.format(root=ROOT, cores=cores, criterion=criterion, dimension=dimension)
+    times = []
+    for _ in range(models):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return 0.0, times
+
+
+def shared(models, cores, criterion, dimension):
+    import hydrogen_storage as hs
+    from comsol_backend import MphBackend
+    backend = MphBackend(cores=cores)
+    start = time.perf_counter()
+    backend.connect() # the only client start; entering the backend below reuses it
+    startup = time.perf_counter() - start
+    with backend:
+        times = []
+        for _ in range(models):
+            start = time.perf_counter()
+            handle = hs.create_h2storagemodel(criterion, dimension, backend=backend)
+            backend.remove(handle.model)
+            times.append(time.perf_counter() - start)
+    return startup, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--models", type=int, default=5)
+    parser.add_argument("--cores", type=int, default=4)
+    parser.add_argument("--criterion", default="mohr-coulomb")
+    parser.add_argument("--dimension", default="2d")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="h2storage_bench_"))
+    print(f"{'mode':<10}{'startup [s]':>12}{'per model [s]':>16}{'total [s]':>11}")
+    for name, run in (("per model", per_model), ("shared", shared)):
+        startup, times = run(args.models, args.cores, args.criterion, args.dimension)
+        total = startup + sum(times)
+        print(f"{name:<10}{startup:>12.1f}{total / args.models:>16.1f}{total:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
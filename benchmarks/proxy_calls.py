@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: Java proxy calls and wall time per build stage.
+
+Builds every criterion/dimension combination and prints the calls made
+through the model's java object and the wall time of each stage. Without
+--live the recording backend is used, which counts the calls exactly but
+does not measure round-trip latency; with --live (optionally --port/--host
+for a remote server) the builds run on COMSOL.
+
+    python benchmarks/proxy_calls.py --live --host cluster-node --port 2036
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hydrogen_storage as hs
+from comsol_backend import MphBackend, RecordingBackend
+from instrumentation import Trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--cores", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.live:
+        backend = MphBackend(cores=args.cores, host=args.host, port=args.port)
+    else:
+        backend = RecordingBackend()
+    with backend:
+        for dimension in ("2d", "2daxi", "3d"):
+            for criterion in ("hoek-brown", "mohr-coulomb"):
+                trace = Trace()
+                handle = hs.create_h2storagemodel(criterion, dimension, backend=backend,
+                                                  save=False, trace=trace)
+                backend.remove(handle.model)
+                print(f"\n{criterion} {dimension}: {trace.total('calls')} calls, "
+                      f"{trace.total():.2f} s")
+                for record in trace.records:
+                    print(f"  {record['stage']:<12}{record['calls']:>6} calls"
+                          f"{record['wall_s']:>9.3f} s")
+
+
+if __name__ == "__main__":
+    main()
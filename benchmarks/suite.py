@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite: build, mesh and solve times across dimensions, criteria and meshes.
+
+Every combination of dimension, criterion and mesh density (the default mesh
+refined by each ratio, see mesh_convergence.refine) is built and solved
+(std1, std2) with the chosen solver profile. Per stage the wall time, proxy
+calls, memory, elements and DOFs are recorded; with --repeat the fastest
+repetition counts. Each run is appended as one JSON line to the history
+file, together with the commit, host and backend. The history is local to
+the machine: benchmarks/history.jsonl by default, which git ignores, or the
+file given with --history.
+
+The run is compared with the median of the last --baseline runs with the
+same backend, host and solver profile: a stage that got slower by more than
+--threshold (and by more than --noise seconds), or a build that needs more
+proxy calls, is flagged and the exit status is 1. Without --live the recording backend is
+used, which checks the Python build layer (calls are exact, times are pure
+Python overhead); with --live the builds and solves run on COMSOL.
+
+    python benchmarks/suite.py --live --densities 1 1.5 2.25 --solver direct-fast
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hydrogen_storage as hs
+import solver_profiles
+from comsol_backend import MphBackend, RecordingBackend
+from instrumentation import Trace
+from mesh_convergence import refine
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+METRICS = ("wall_s", "calls", "python_mb", "server_mb", "elements", "dofs")
+
+
+def commit():
+    """Short hash of the checked out commit, or None outside a git work tree."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_case(backend, criterion, dimension, mesh, solver, live):
+    """Stage records of one build and solve; {stage: {metric: value}}."""
+    trace = Trace(dofs=live)
+    handle = hs.create_h2storagemodel(criterion, dimension, backend=backend, parameters=mesh,
+                                      save=False, trace=trace)
+    for study, profile in solver_profiles.normalize(solver).items():
+        handle.set_solver_profile(study, profile)
+    handle.solve("std1")
+    handle.solve("std2")
+    backend.remove(handle.model)
+    stages = {record["stage"]: {metric: record.get(metric) for metric in METRICS}
+              for record in trace.records}
+    stages["total"] = {"wall_s": trace.total(), "calls": trace.total("calls")}
+    return stages
+
+
+def fastest(repetitions):
+    """Per stage the record of the repetition with the smallest wall time."""
+    return {stage: min((stages[stage] for stages in repetitions), key=lambda record: record["wall_s"])
+            for stage in repetitions[0]}
+
+
+def load_history(path, backend, host, solver):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        runs = [json.loads(line) for line in file if line.strip()]
+    return [run for run in runs
+            if run["backend"] == backend and run["host"] == host and run["solver"] == solver]
+
+
+def regressions(cases, previous, threshold, noise):
+    """(case, stage, metric, baseline, value) that got worse than the median of ``previous``."""
+    flagged = []
+    for case, stages in cases.items():
+        for stage, record in stages.items():
+            for metric in ("wall_s", "calls"):
+                history = [run["cases"][case][stage][metric] for run in previous
+                           if stage in run["cases"].get(case, {})
+                           and run["cases"][case][stage].get(metric) is not None]
+                if not history or record.get(metric) is None:
+                    continue
+                baseline = float(np.median(history))
+                value = record[metric]
+                if metric == "calls":
+                    worse = value > baseline
+                else:
+                    worse = value > baseline*(1 + threshold) and value - baseline > noise
+                if worse:
+                    flagged.append((case, stage, metric, baseline, value))
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--cores", type=int, default=4)
+    parser.add_argument("--dimensions", nargs="+", default=["2d", "3d"])
+    parser.add_argument("--criteria", nargs="+", default=list(hs.CRITERIA))
+    parser.add_argument("--densities", nargs="+", type=float, default=[1.0, 1.5, 2.25],
+                        help="mesh refinement ratios relative to the default mesh")
+    parser.add_argument("--solver", default="default", help="solver profile of std1 and std2")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--history", default=HISTORY, help="history file, default benchmarks/history.jsonl")
+    parser.add_argument("--baseline", type=int, default=5, help="previous runs the median is taken over")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown flagged")
+    parser.add_argument("--noise", type=float, default=0.05, help="slowdowns below this [s] are ignored")
+    parser.add_argument("--no-record", action="store_true", help="do not append this run to the history")
+    args = parser.parse_args()
+
+    if args.live:
+        backend = MphBackend(cores=args.cores, host=args.host, port=args.port)
+    else:
+        backend = RecordingBackend()
+    base = hs.default_parameters()
+    cases = {}
+    with backend:
+        for dimension in args.dimensions:
+            for criterion in args.criteria:
+                for ratio in args.densities:
+                    mesh = refine(base, ratio) if ratio != 1 else {}
+                    case = f"{dimension}/{criterion}/x{ratio:g}"
+                    repetitions = [run_case(backend, criterion, dimension, mesh, args.solver, args.live)
+                                   for _ in range(args.repeat)]
+                    cases[case] = fastest(repetitions)
+                    total = cases[case]["total"]
+                    print(f"{case}: {total['wall_s']:.2f} s, {total['calls']} calls")
+
+    kind = "live" if args.live else "recorded"
+    host = args.host or platform.node()
+    previous = load_history(args.history, kind, host, args.solver)[-args.baseline:]
+    flagged = regressions(cases, previous, args.threshold, args.noise)
+    if not args.no_record:
+        run = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit(), "backend": kind,
+               "host": host, "solver": args.solver, "cases": cases}
+        with open(args.history, "a", encoding="utf-8") as file:
+            file.write(json.dumps(run) + "\n")
+    if not previous:
+        print(f"\nNo previous {kind} runs on {host} to compare with")
+    elif flagged:
+        print(f"\n{len(flagged)} regressions against the median of {len(previous)} runs:")
+        for case, stage, metric, baseline, value in flagged:
+            print(f"  {case} {stage} {metric}: {baseline:.4g} -> {value:.4g}")
+    else:
+        print(f"\nNo regressions against the median of {len(previous)} runs")
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: cost of the thermo-mechanical mode against the mechanical solve.
+
+For each criterion three runs are timed on COMSOL:
+
+* mechanical: std1 + std2 of the model built without heat transfer,
+* segregated: std1 + std2, then std3 (heat transfer only) and std4 (solid
+  only, reading T from std3), as built with thermal=True,
+* fully coupled: std4 re-run solving ht and solid together, the reference
+  the segregated setup is meant to avoid.
+
+Without --live the recording backend is used, which only checks the study
+setup; the times are meaningless then.
+
+    python benchmarks/thermal_coupling.py --live --dimension 2daxi
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hydrogen_storage as hs
+from comsol_backend import MphBackend, RecordingBackend
+from instrumentation import Trace
+
+
+def solve_times(handle, studies):
+    for study in studies:
+        handle.solve(study)
+    return {record["stage"][len("solve "):]: record["wall_s"]
+            for record in handle.trace.records if record["stage"].startswith("solve ")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--cores", type=int, default=4)
+    parser.add_argument("--dimension", default="2daxi")
+    args = parser.parse_args()
+
+    if args.live:
+        backend = MphBackend(cores=args.cores, host=args.host, port=args.port)
+    else:
+        backend = RecordingBackend()
+    with backend:
+        for criterion in ("hoek-brown", "mohr-coulomb"):
+            handle = hs.create_h2storagemodel(criterion, args.dimension, backend=backend,
+                                              save=False, trace=Trace())
+            mechanical = solve_times(handle, ("std1", "std2"))
+            backend.remove(handle.model)
+
+            handle = hs.create_h2storagemodel(criterion, args.dimension, backend=backend,
+                                              save=False, trace=Trace(), thermal=True)
+            segregated = solve_times(handle, ("std1", "std2", "std3", "std4"))
+            time = handle.java.study("std4").feature("time")
+            time.setSolveFor("/physics/ht", True)
+            time.set("usesol", "off")
+            handle.trace.records.clear()
+            coupled = solve_times(handle, ("std4",))
+            backend.remove(handle.model)
+
+            base = sum(mechanical.values())
+            print(f"\n{criterion} {args.dimension}")
+            print(f"  mechanical     {base:9.2f} s")
+            thermal = segregated["std3"] + segregated["std4"]
+            print(f"  segregated     {base + thermal:9.2f} s  (heat {segregated['std3']:.2f} s, "
+                  f"thermal stress {segregated['std4']:.2f} s)")
+            print(f"  fully coupled  {base + coupled['std4']:9.2f} s")
+            if args.live:
+                print(f"  segregated/mechanical {(base + thermal)/base:.2f}, "
+                      f"coupled/mechanical {(base + coupled['std4'])/base:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-cavern layouts and the minimum stable pillar width.
+
+create_h2storagemodel(criterion, "2d", caverns=N) builds N storages side by
+side, pillar_width apart, on the plane strain model. The row is symmetric
+about x=0, so only half of it is modelled, and only the region around the
+storages and pillars is meshed finely (pillar_elements across a pillar).
+
+A pillar is taken as stable while its core, the middle half of its width over
+the height of the storages, stays elastic: the largest equivalent plastic
+strain there is at most ``strain_limit``. Stability only grows with the
+width, so PillarSearch bisects between a width that fails and one that holds.
+Every step re-meshes and re-solves the same model, and a bracket narrowed to
+1/64 of its size takes 8 solves. Solved widths are kept in a JSON cache,
+keyed on the scenario, the solver profiles and the builder version, so an
+interrupted search, or one repeated with a finer tolerance or another strain
+limit, does not solve them again.
+
+    handle = hs.create_h2storagemodel("hoek-brown", "2d", parameters={"GSI": 45},
+                                      save=False, caverns=3)
+    width, rows = PillarSearch(handle, cache="pillars.json").run(10, 120, tolerance=2)
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+import extraction
+import hydrogen_storage as hs
+import model_cache
+import solver_profiles
+from staged_solve import StagedSolver
+
+
+def pillar_core(caverns):
+    """COMSOL expression that is 1 in the pillar cores of a layout of ``caverns`` and 0 elsewhere."""
+    across = " || ".join(f"abs(x-{centre:g}*cavern_spacing)<pillar_width/4"
+                         for centre in hs.pillar_centres(caverns))
+    return f"(({across}) && y<=storage_depth && y>=storage_depth-storage_height)"
+
+
+class PillarSearch:
+    """
+    Minimum stable pillar width for a built layout ``handle`` (see
+    create_h2storagemodel(..., caverns=N)); the other scenario parameters are
+    those of the handle. ``solver`` are solver profiles for StagedSolver.
+    """
+
+    def __init__(self, handle, strain_limit=0.0, cache=None, solver=None):
+        if handle.caverns < 2:
+            raise ValueError("The pillar search needs a layout of at least 2 caverns")
+        self.handle = handle
+        self.strain_limit = strain_limit
+        self.cache = cache
+        self.solver = solver
+        self.staged = StagedSolver(handle)
+        self.scenario = {name: handle.parameters[name] for name in hs.default_parameters()
+                         if name != "pillar_width"}
+        # strains depend on the solver profiles and the builder too, not only on the scenario
+        text = json.dumps([handle.criterion, handle.caverns, self.scenario, solver_profiles.normalize(solver),
+                           model_cache.code_version()], sort_keys=True)
+        self.key = hashlib.sha256(text.encode()).hexdigest()[:20]
+        self.strains = self._load() # pillar width -> largest plastic strain in the cores
+        self.solves = 0
+
+    def _load(self):
+        if self.cache is None or not os.path.exists(self.cache):
+            return {}
+        with open(self.cache, encoding="utf-8") as file:
+            entries = json.load(file).get(self.key, {})
+        return {float(width): strain for width, strain in entries.items()}
+
+    def _save(self):
+        data = {}
+        if os.path.exists(self.cache):
+            with open(self.cache, encoding="utf-8") as file:
+                data = json.load(file)
+        data[self.key] = {repr(width): strain for width, strain in sorted(self.strains.items())}
+        partial = f"{self.cache}.{os.getpid()}.partial"
+        with open(partial, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=1)
+        os.replace(partial, self.cache)
+
+    def _evaluate(self):
+        model = self.handle.model
+        if not hasattr(model, "evaluate"):  # recorded models hold no solution
+            return float("nan")
+        dataset = extraction.solution_dataset(self.handle)
+        values = model.evaluate(f"solid.epe*{pillar_core(self.handle.caverns)}", dataset=dataset)
+        return float(np.max(np.asarray(values)))
+
+    def core_strain(self, width):
+        """Largest plastic strain in the pillar cores at ``width`` [m], solved once per width."""
+        width = float(width)
+        if width not in self.strains:
+            print(f"Pillar width {width:g} m")
+            start = time.perf_counter()
+            self.staged.solve({**self.scenario, "pillar_width": width}, self.solver)
+            self.solves += 1
+            self.strains[width] = self._evaluate()
+            print(f"Core plastic strain {self.strains[width]:.3g} "
+                  f"({time.perf_counter() - start:.1f} s)")
+            if self.cache is not None:
+                self._save()
+        return self.strains[width]
+
+    def stable(self, width):
+        return self.core_strain(width) <= self.strain_limit
+
+    def rows(self):
+        """One row per solved width, narrowest first."""
+        return [{"pillar_width": width, "core_plastic_strain": strain,
+                 "stable": strain <= self.strain_limit}
+                for width, strain in sorted(self.strains.items())]
+
+    def run(self, low, high, tolerance=1.0):
+        """
+        Minimum stable width in [low, high] to within ``tolerance`` [m].
+        Returns (width, rows); width is None if even ``high`` is unstable.
+        """
+        if not self.stable(high):
+            width = None
+        elif self.stable(low):
+            width = low
+        else:
+            while high - low > tolerance:
+                middle = 0.5*(low + high)
+                if self.stable(middle):
+                    high = middle
+                else:
+                    low = middle
+            width = high
+        if width is None:
+            print(f"No stable pillar width up to {high:g} m ({self.solves} solves)")
+        else:
+            print(f"Minimum stable pillar width {width:g} m ({self.solves} solves)")
+        return width, self.rows()
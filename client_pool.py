@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of long-lived COMSOL clients for running many model builds.
+
+mph allows a single client per Python process, so the pool keeps one worker
+process per client. Each worker starts its own COMSOL server and client once,
+runs any number of tasks on it, clears the models after every task and stops
+the server when the pool is closed.
+"""
+
+import atexit
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from comsol_backend import MphBackend
+
+#############################
+# Worker process state
+#############################
+_backend = None
+_server = None
+
+
+def _start_worker(cores, backend_factory, pids):
+    global _backend, _server
+    pids.put(os.getpid())
+    if backend_factory is not None:
+        _backend = backend_factory()
+    else:
+        import mph
+        _server = mph.Server(cores=cores)
+        _backend = MphBackend(cores=cores, port=_server.port)
+        _backend.connect()
+    atexit.register(_stop_worker)
+
+
+def _stop_worker():
+    global _backend, _server
+    if _backend is not None:
+        _backend.close()
+        _backend = None
+    if _server is not None:
+        _server.stop()
+        _server = None
+
+
+def _run(task, *args, **kwargs):
+    try:
+        return task(_backend, *args, **kwargs)
+    finally:
+        _backend.clear()
+
+
+def _kill_tree(pid):
+    """Kill a worker process and the COMSOL server it started (needs psutil for the server)."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            for child in psutil.Process(pid).children(recursive=True):
+                child.kill()
+        except psutil.Error:
+            pass
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def cores_per_client(workers):
+    """An even share of the machine's cores for each of ``workers`` clients."""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _ping(delay):
+    time.sleep(delay)
+    return multiprocessing.current_process().pid
+
+#############################
+# Pool
+#############################
+class ClientPool:
+    """
+    Hand out builds to ``size`` COMSOL clients with ``cores`` cores each.
+
+    A task is a picklable function called as ``task(backend, *args)`` in a
+    worker, where ``backend`` can be passed to create_h2storagemodel. Pass a
+    ``backend_factory`` (e.g. RecordingBackend) to run without COMSOL.
+    """
+
+    def __init__(self, size=1, cores=4, backend_factory=None):
+        self.size = size
+        self.cores = cores
+        self.started = False
+        self.pids = []
+        context = multiprocessing.get_context("spawn")
+        self._pids = context.SimpleQueue() # each worker reports its pid here when it starts
+        self.executor = ProcessPoolExecutor(
+            max_workers=size, mp_context=context,
+            initializer=_start_worker, initargs=(cores, backend_factory, self._pids))
+
+    def start(self):
+        """Start all clients now instead of on first use; returns the time taken."""
+        start = time.perf_counter()
+        pings = [self.executor.submit(_ping, 0.2) for _ in range(self.size)]
+        for ping in pings:
+            ping.result()
+        self.started = True
+        return time.perf_counter() - start
+
+    def _worker_pids(self):
+        """Process ids of the workers started so far."""
+        while not self._pids.empty():
+            self.pids.append(self._pids.get())
+        return self.pids
+
+    def submit(self, task, *args, **kwargs):
+        return self.executor.submit(_run, task, *args, **kwargs)
+
+    def map(self, task, *iterables):
+        return self.executor.map(partial(_run, task), *iterables)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def terminate(self):
+        """
+        Kill the workers and their servers without waiting for running tasks,
+        e.g. after a solve timed out. The pool cannot be used afterwards.
+        """
+        for pid in self._worker_pids():
+            _kill_tree(pid)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
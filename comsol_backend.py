@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+Model backends for the hydrogen storage builder.
+
+MphBackend hands out live COMSOL models through mph. RecordingBackend hands
+out in-process stand-ins whose ``java`` attribute records every call made by
+the builder, so a model can be built, timed and compared without a COMSOL
+server, and later replayed into a live model.
+"""
+
+import json
+import os
+
+#############################
+# Live COMSOL backend
+#############################
+class MphBackend:
+    """
+    Create models on one COMSOL client that is started once and reused.
+
+    Without a port the client is started in-process with mph.start, otherwise
+    it connects to a running COMSOL server on host:port. Models can be removed
+    between builds with remove() or clear() so the client stays lean.
+    """
+
+    model_suffix = ".mph"
+
+    def __init__(self, cores=4, host=None, port=None, client=None):
+        self.cores = cores
+        self.host = host
+        self.port = port
+        self.client = client
+
+    def connect(self):
+        if self.client is None:
+            import mph
+            if self.port is None:
+                self.client = mph.start(cores=self.cores)
+            else:
+                self.client = mph.Client(cores=self.cores, host=self.host or "localhost", port=self.port)
+        return self.client
+
+    def create(self, name):
+        return self.connect().create(name)
+
+    def load(self, path):
+        return self.connect().load(path)
+
+    def remove(self, model):
+        if self.client is not None:
+            self.client.remove(model)
+
+    def clear(self):
+        if self.client is not None:
+            self.client.clear()
+
+    def close(self):
+        if self.client is None:
+            return
+        self.client.clear()
+        if self.port is not None:
+            self.client.disconnect()
+        self.client = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_shared_backend = None
+
+
+def shared_backend(cores=4):
+    """
+    Return the process-wide MphBackend, starting it on first use.
+
+    mph allows one client per Python process, so every build in the process
+    shares it. ``cores`` only takes effect when the client is first started.
+    """
+    global _shared_backend
+    if _shared_backend is None:
+        _shared_backend = MphBackend(cores=cores)
+    return _shared_backend
+
+#############################
+# Recording backend
+#############################
+# Calls that change the model. Every other call only navigates the tree.
+MUTATORS = {"create", "set", "setIndex", "label", "descr", "named", "init",
+            "run", "setSolveFor", "remove", "active", "axisymmetric", "attach",
+            "createAutoSequence"}
+
+
+def _canonical(steps):
+    """Map raw navigation steps to a path of (kind, tag) pairs."""
+    path = []
+    for name, args in steps:
+        if name == "group" and not args:  # param().group() is param()
+            continue
+        path.append((name, str(args[0]) if args else ""))
+    return tuple(path)
+
+
+def _is_sequence(path):
+    """True if path ends in a work plane geometry, which acts as a node."""
+    return (len(path) >= 2 and path[-1] == ("geom", "")
+            and path[-2][0] == "feature")
+
+
+def _plain(value):
+    if isinstance(value, (tuple, list)):
+        return [_plain(v) for v in value]
+    return value
+
+
+def path_to_str(path):
+    return "/".join(f"{kind}[{tag}]" if tag else kind for kind, tag in path)
+
+
+class _RecordingProxy:
+    """Stand-in for a JPype proxy of one COMSOL model node."""
+
+    __slots__ = ("_recorder", "_steps")
+
+    def __init__(self, recorder, steps):
+        self._recorder = recorder
+        self._steps = steps
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args):
+            return self._recorder.call(self._steps, name, args)
+        return call
+
+    def __repr__(self):
+        return f"<recorded {path_to_str(_canonical(self._steps)) or 'model'}>"
+
+
+class Recorder:
+    """Node tree and ordered call log built from proxy calls."""
+
+    def __init__(self):
+        self.tree = self.new_node()
+        self.log = []
+        self.proxy_calls = 0
+
+    @staticmethod
+    def new_node(node_type=None, args=()):
+        return {"type": node_type, "args": _plain(list(args)), "label": None,
+                "properties": {}, "descriptions": {}, "children": {}}
+
+    def node(self, path):
+        node = self.tree
+        for kind, tag in path:
+            node = node["children"].setdefault(kind, {}).setdefault(tag, self.new_node())
+        return node
+
+    def call(self, steps, name, args):
+        self.proxy_calls += 1
+        path = _canonical(steps)
+        container = bool(path) and path[-1][1] == "" and not _is_sequence(path)
+        if name == "tags" and container:  # e.g. sol().tags()
+            return list(self.node(path[:-1])["children"].get(path[-1][0], {}))
+        if name not in MUTATORS and len(args) <= 1:
+            return _RecordingProxy(self, steps + ((name, args),))
+        self.log.append((steps, name, args))
+        if name == "create":
+            return self._create(steps, path, args)
+        if name == "remove" and container:  # e.g. sol().remove("sol1")
+            self.node(path[:-1])["children"].get(path[-1][0], {}).pop(str(args[0]), None)
+            return _RecordingProxy(self, steps)
+        self._apply(self.node(path), path, name, args)
+        return _RecordingProxy(self, steps)
+
+    def _create(self, steps, path, args):
+        tag = str(args[0])
+        node_type = args[1] if len(args) > 1 else None
+        if path and path[-1][1] == "" and not _is_sequence(path):
+            # container().create(tag, ...) e.g. geom().create("geom1", 3)
+            kind = path[-1][0]
+            parent_steps = tuple(s for s in steps if s != ("group", ()))[:-1]
+        else:
+            # node.create(tag, ...) adds a feature, e.g. geom("geom1").create(...)
+            kind = "feature"
+            parent_steps = steps
+        parent = self.node(_canonical(parent_steps))
+        parent["children"].setdefault(kind, {})[tag] = self.new_node(node_type, args[2:])
+        return _RecordingProxy(self, parent_steps + ((kind, (tag,)),))
+
+    def _apply(self, node, path, name, args):
+        props = node["properties"]
+        kind = path[-1][0] if path else ""
+        if name == "label":
+            node["label"] = args[0]
+        elif name == "descr":
+            node["descriptions"][args[0]] = args[1]
+        elif name == "set" and kind != "selection" and len(args) >= 2:
+            props[args[0]] = _plain(args[1])
+            if len(args) == 3 and kind == "param":
+                node["descriptions"][args[0]] = args[2]
+            elif len(args) > 2:
+                props[args[0]] = _plain(list(args[1:]))
+        elif name == "setIndex":
+            value = props.setdefault(args[0], [])
+            index = args[2:]
+            for depth, i in enumerate(index):
+                last = depth == len(index) - 1
+                while len(value) <= i:
+                    value.append(None if last else [])
+                if last:
+                    value[i] = _plain(args[1])
+                else:
+                    if not isinstance(value[i], list):
+                        value[i] = []
+                    value = value[i]
+        elif name == "setSolveFor":
+            props.setdefault("solvefor", {})[args[0]] = args[1]
+        elif name == "run":
+            props["runs"] = props.get("runs", 0) + 1
+        elif name == "remove" and kind == "param":  # param("par2").remove("GSI")
+            props.pop(str(args[0]), None)
+            node["descriptions"].pop(str(args[0]), None)
+        elif name == "remove":
+            node["children"].get("feature", {}).pop(str(args[0]), None)
+        else:  # selection set/named/init/geom, active
+            props[name] = _plain(args[0] if len(args) == 1 else list(args))
+
+
+class RecordedModel:
+    """Stand-in for mph.Model that records instead of talking to COMSOL."""
+
+    def __init__(self, name):
+        self._name = name
+        self.recorder = Recorder()
+        self.java = _RecordingProxy(self.recorder, ())
+        self.saved = []
+
+    def name(self):
+        return self._name
+
+    @property
+    def tree(self):
+        return self.recorder.tree
+
+    @property
+    def log(self):
+        return self.recorder.log
+
+    def solve(self, study=None):
+        self.recorder.log.append(((), "solve", (study,)))
+
+    def save(self, path=None):
+        path = str(path or self._name)
+        if not os.path.splitext(path)[1]:
+            path += ".json"
+        self.saved.append(path)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=1)
+
+    def to_dict(self):
+        return {"name": self._name, "tree": self.tree,
+                "log": [[_plain(steps), name, _plain(args)]
+                        for steps, name, args in self.log]}
+
+
+class RecordingBackend:
+    """Create RecordedModel instances; no COMSOL server is needed."""
+
+    model_suffix = ".json"
+
+    def __init__(self):
+        self.models = []
+
+    def create(self, name):
+        model = RecordedModel(name)
+        self.models.append(model)
+        return model
+
+    def load(self, path):
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        model = self.create(data["name"])
+        model.recorder.tree = data["tree"]
+        model.recorder.log = [(tuple((step, tuple(args)) for step, args in steps), name, tuple(args))
+                              for steps, name, args in data["log"]]
+        return model
+
+    def remove(self, model):
+        self.models.remove(model)
+
+    def clear(self):
+        self.models.clear()
+
+    def close(self):
+        self.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+#############################
+# Replay and comparison
+#############################
+def replay(log, java):
+    """
+    Replay a recorded call log into a live model, e.g. ``pymodel.java``.
+
+    Node handles are resolved once per path and reused, so the replay costs
+    one proxy call per recorded mutation plus one per distinct node, instead
+    of re-walking the tree from the model root on every call.
+    """
+    handles = {(): java}
+    for steps, name, args in log:
+        steps = tuple((step, tuple(step_args)) for step, step_args in steps)
+        if name == "solve":
+            continue
+        handle = handles.get(steps)
+        if handle is None:
+            depth = max(i for i in range(len(steps) + 1) if steps[:i] in handles)
+            handle = handles[steps[:depth]]
+            for i in range(depth, len(steps)):
+                step, step_args = steps[i]
+                handle = getattr(handle, step)(*step_args)
+                if step_args:  # containers like selection() are not cached
+                    handles[steps[:i + 1]] = handle
+        getattr(handle, name)(*(tuple(a) if isinstance(a, list) else a for a in args))
+
+
+def diff_trees(a, b, path=()):
+    """List (path, field, value_a, value_b) for every difference between trees."""
+    diffs = []
+    where = path_to_str(path)
+    for field in ("type", "args", "label"):
+        if a.get(field) != b.get(field):
+            diffs.append((where, field, a.get(field), b.get(field)))
+    for field in ("properties", "descriptions"):
+        pa, pb = a.get(field, {}), b.get(field, {})
+        for key in sorted(set(pa) | set(pb), key=str):
+            if pa.get(key) != pb.get(key):
+                diffs.append((where, f"{field}.{key}", pa.get(key), pb.get(key)))
+    ca, cb = a.get("children", {}), b.get("children", {})
+    for kind in sorted(set(ca) | set(cb)):
+        ka, kb = ca.get(kind, {}), cb.get(kind, {})
+        for tag in sorted(set(ka) | set(kb)):
+            if tag not in ka or tag not in kb:
+                diffs.append((path_to_str(path + ((kind, tag),)), "node",
+                              tag in ka or None, tag in kb or None))
+            else:
+                diffs.extend(diff_trees(ka[tag], kb[tag], path + ((kind, tag),)))
+    return diffs
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Cyclic pressurization: injection/withdrawal schedules solved as load steps.
+
+A schedule is a sequence of (time [h], internal pressure [bar]) steps, e.g.
+daily cycles from cycle_schedule() or a CSV file with time_h,pressure_bar
+columns. The steps are solved quasi-statically on the excavated model (the
+plastic models are rate independent, so only the load path matters): every
+chunk of steps is one Stationary study with an auxiliary continuation sweep
+over int_pressure, so each step starts from the previous one and carries its
+plastic state on. Two studies, cyc1 and cyc2, take turns, each starting from
+the last step of the other, so the model never holds more than two chunks of
+solutions however many cycles are run.
+
+After each chunk the boundary fields of its steps are appended to raw
+float64 files in the output directory and a per-step summary to steps.csv;
+load_history() maps them back without reading them into memory.
+
+    times, pressures = cycle_schedule(40, 180, cycles=1000)
+    CyclicStudy(handle).run(times, pressures, "cycles_site_a")
+"""
+
+import csv
+import json
+import os
+
+import numpy as np
+
+import extraction
+
+# Stored per step on the storage boundary: name -> expression
+CYCLIC_FIELDS = {
+    "mises": "solid.mises",
+    "disp": "solid.disp",
+    "epe": "solid.epe",
+    "lining_stress": extraction.LINING_STRESS,
+}
+
+STUDIES = ("cyc1", "cyc2") # std3/std4 are the thermal studies
+
+#############################
+# Schedules
+#############################
+def cycle_schedule(p_min, p_max, cycles, steps_per_cycle=8, period=24.0):
+    """
+    Times [h] and pressures [bar] of ``cycles`` sinusoidal cycles between
+    ``p_min`` and ``p_max`` that start from ``p_min`` at t=0, sampled
+    ``steps_per_cycle`` times per cycle. t=0 itself is not a sample, the
+    first one is at period/steps_per_cycle; the last one ends the last cycle
+    at ``p_min``.
+    """
+    steps = cycles*steps_per_cycle
+    times = np.arange(1, steps + 1)*period/steps_per_cycle
+    pressures = p_min + (p_max - p_min)*0.5*(1 - np.cos(2*np.pi*times/period))
+    return times, pressures
+
+
+def load_schedule(path):
+    """Times and pressures from a CSV file with time_h and pressure_bar columns."""
+    with open(path, newline="", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    return (np.array([float(row["time_h"]) for row in rows]),
+            np.array([float(row["pressure_bar"]) for row in rows]))
+
+#############################
+# History files
+#############################
+class HistoryWriter:
+    """Append per-step boundary fields and a steps.csv summary to ``directory``."""
+
+    def __init__(self, directory, names):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.names = list(names)
+        self.steps = 0
+        self.points = None
+        self._summary = open(os.path.join(directory, "steps.csv"), "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._summary)
+        self._writer.writerow(["step", "time_h", "pressure_bar"]
+                              + [f"max_{name}" for name in self.names])
+        self._fields = {name: open(os.path.join(directory, f"{name}.f64"), "wb")
+                        for name in self.names}
+
+    def write(self, times, pressures, arrays=None, coordinates=None):
+        """Append one chunk; ``arrays`` maps names to (steps, points) arrays."""
+        if coordinates is not None and self.points is None:
+            self.points = len(coordinates[0])
+            np.save(os.path.join(self.directory, "coordinates.npy"), np.asarray(coordinates))
+        for i, (time, pressure) in enumerate(zip(times, pressures)):
+            if arrays:
+                maxima = [float(np.nanmax(arrays[name][i])) for name in self.names]
+            else: # no fields (recorded models), the columns stay readable by load_history
+                maxima = [np.nan]*len(self.names)
+            self._writer.writerow([self.steps + i, time, pressure] + maxima)
+        if arrays:
+            for name in self.names:
+                np.ascontiguousarray(arrays[name], dtype="<f8").tofile(self._fields[name])
+                self._fields[name].flush()
+        self._summary.flush()
+        self.steps += len(times)
+
+    def close(self):
+        self._summary.close()
+        for file in self._fields.values():
+            file.close()
+        with open(os.path.join(self.directory, "history.json"), "w", encoding="utf-8") as file:
+            json.dump({"steps": self.steps, "points": self.points, "fields": self.names}, file)
+
+
+def load_history(directory):
+    """
+    (steps, fields): the steps.csv columns as arrays and each field as a
+    read-only memory map of shape (steps, points).
+    """
+    with open(os.path.join(directory, "history.json"), encoding="utf-8") as file:
+        meta = json.load(file)
+    table = np.genfromtxt(os.path.join(directory, "steps.csv"), delimiter=",", names=True)
+    steps = {name: np.atleast_1d(table[name]) for name in table.dtype.names}
+    fields = {}
+    if meta["points"]:
+        for name in meta["fields"]:
+            fields[name] = np.memmap(os.path.join(directory, f"{name}.f64"), dtype="<f8", mode="r",
+                                     shape=(meta["steps"], meta["points"]))
+    return steps, fields
+
+#############################
+# Load stepping
+#############################
+class CyclicStudy:
+    """
+    Solve a pressure schedule on a built H2StorageModel in chunks of
+    ``chunk`` steps. ``jacobian`` is the Jacobian update of the nonlinear
+    solver: "once" per step reuses one factorization for all Newton
+    iterations of a step, "onevery" refactorizes every iteration.
+    """
+
+    def __init__(self, handle, chunk=48, fields=None, selection="storage_outer_bnd", jacobian="once"):
+        self.handle = handle
+        self.chunk = chunk
+        self.fields = CYCLIC_FIELDS if fields is None else fields
+        self.selection = selection
+        self.jacobian = jacobian
+        self._ready = False
+
+    def _setup(self):
+        """
+        Create cyc1/cyc2 and their solver sequences sol_cyc1/sol_cyc2 once;
+        a model that has them already (e.g. a saved or cached one) reuses them.
+        """
+        java = self.handle.java
+        studies, solutions = list(java.study().tags()), list(java.sol().tags())
+        for study in STUDIES:
+            if study in studies and f"sol_{study}" in solutions:
+                java.sol(f"sol_{study}").feature("s1").feature("fc1").set("jtech", self.jacobian)
+                continue
+            std = java.study().create(study)
+            std.label(f"Study: Cyclic load steps ({study})")
+            stat = std.create("stat", "Stationary")
+            stat.setSolveFor("/physics/solid", True)
+            stat.set("useparam", "on")
+            stat.set("pname", ("int_pressure",))
+            stat.set("punit", ("bar",))
+            stat.set("pcontinuationmode", "manual")
+            stat.set("pcontinuation", "int_pressure")
+            stat.set("useinitsol", "on")
+            stat.set("initmethod", "sol")
+            stat.set("initstudy", "std2")
+            stat.set("solnum", "auto")
+            sol = java.sol().create(f"sol_{study}")
+            sol.study(study)
+            sol.attach(study)
+            sol.createAutoSequence(study)
+            sol.feature("s1").feature("fc1").set("jtech", self.jacobian)
+        self._ready = True
+
+    def _evaluate(self, study, steps):
+        model = self.handle.model
+        dataset = extraction.solution_dataset(self.handle, self.selection, f"sol_{study}")
+        coordinates = extraction.COORDINATES[self.handle.model_dimension]
+        names = list(self.fields)
+        expressions = [extraction.expression(self.fields[name], self.handle.model_dimension, self.handle.caverns)
+                       for name in names]
+        values = model.evaluate(coordinates + expressions, dataset=dataset)
+        # points outside the side wall of the wall metrics are NaN
+        values = [np.where(np.asarray(value) <= extraction.NO_POINT, np.nan, value).reshape(steps, -1)
+                  for value in values]
+        coordinates = [value[0] for value in values[:len(coordinates)]]
+        return dict(zip(names, values[len(coordinates):])), coordinates
+
+    def run(self, times, pressures, directory, solve_excavation=True):
+        """
+        Solve the schedule and write its history to ``directory``; returns the
+        number of steps. With ``solve_excavation`` std1 and std2 are solved
+        first, otherwise they must be solved already.
+        """
+        if not self._ready:
+            self._setup()
+        if solve_excavation:
+            self.handle.solve("std1")
+            self.handle.solve("std2")
+        java = self.handle.java
+        writer = HistoryWriter(directory, self.fields)
+        try:
+            for number, first in enumerate(range(0, len(pressures), self.chunk)):
+                chunk_times = times[first:first + self.chunk]
+                chunk_pressures = pressures[first:first + self.chunk]
+                study = STUDIES[number % 2]
+                stat = java.study(study).feature("stat")
+                stat.set("plistarr", (" ".join(f"{p:g}" for p in chunk_pressures),))
+                if number:
+                    stat.set("initstudy", STUDIES[(number - 1) % 2])
+                    stat.set("solnum", "last")
+                print(f"Solving steps {first}-{first + len(chunk_pressures) - 1} ({study})...", end=" ")
+                self.handle.solve(study)
+                print("Done")
+                if hasattr(self.handle.model, "evaluate"):  # recorded models hold no solution
+                    arrays, coordinates = self._evaluate(study, len(chunk_pressures))
+                    writer.write(chunk_times, chunk_pressures, arrays, coordinates)
+                else:
+                    writer.write(chunk_times, chunk_pressures)
+        finally:
+            writer.close()
+        return writer.steps
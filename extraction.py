@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Extract result fields on the builder's named selections and write them to disk.
+
+For each selection a Solution dataset restricted to it is added to the model
+once ("all" is the whole model, see postprocess.FIELDS); the configured
+expressions and the node coordinates are then evaluated on it and written
+per scenario to ``<scenario>.npz``, or with ``format="parquet"`` (which needs
+pyarrow) to ``<scenario>.<selection>.parquet``. Afterwards the model can be
+removed from the client, so only these arrays are kept across a sweep.
+"""
+
+import os
+
+import numpy as np
+
+import hydrogen_storage as hs
+
+# Selection name (see hydrogen_storage.RESULT_SELECTIONS, or "all") -> expressions;
+# "{displacement}" stands for all displacement components of the model
+# (hydrogen_storage.DISPLACEMENT), other placeholders are filled in by expression()
+DEFAULT_FIELDS = {
+    "storage_outer_bnd": ["solid.mises", "solid.epe", "solid.disp", "solid.sp1", "solid.sp3", "{displacement}",
+                          # stresses of the lining, the ThinLayer tl1 of solid on this boundary
+                          "solid.tl1.mises", "solid.tl1.sl11", "solid.tl1.sl22", "solid.tl1.sl33"],
+}
+
+# Node coordinates written with the fields of each model dimension
+COORDINATES = {"2d": ["x", "y"], "2daxi": ["r", "z"], "3d": ["x", "y", "z"]}
+
+# Result expressions shared by parameter_sweep.DEFAULT_OUTPUTS, cyclic.CYCLIC_FIELDS and
+# postprocess.COMSOL_METRICS; their placeholders are filled in by expression(). The wall
+# metrics only count the straight side wall between the top and bottom arcs, other
+# points evaluate to NO_POINT so a max over the storage boundary skips them.
+NO_POINT = -1e30
+SIDE_WALL = "{vertical}>=storage_depth-storage_height+arc_length && {vertical}<=storage_depth-arc_length"
+# Inward radial displacement of the side wall, m
+WALL_CONVERGENCE = f"if({SIDE_WALL}, -{{radial_displacement}}, {NO_POINT:g})"
+# Hoop stress of the lining on the side wall, E_lining*u_r/r, MPa; tension is positive
+LINING_STRESS = f"if({SIDE_WALL}, E_lining*{{radial_displacement}}/({{radius}})/1[MPa], {NO_POINT:g})"
+# Extent of the plastic zone beyond the wall, m
+PLASTIC_ZONE = "(solid.epe>0)*({radius}-storage_radius)"
+
+
+def _nearest_axis(caverns):
+    """COMSOL expression of the x of the storage axis nearest to a point of a 2D layout."""
+    centres = hs.cavern_centres(caverns)
+    axis = f"{centres[-1]:g}*cavern_spacing"
+    for left, right in reversed(list(zip(centres, centres[1:]))):
+        axis = f"if(x<{(left + right)/2:g}*cavern_spacing, {left:g}*cavern_spacing, {axis})"
+    return axis
+
+
+def expression(template, dimension, caverns=1, **names):
+    """
+    COMSOL expression of ``template`` on a ``dimension`` model of ``caverns``
+    storages: {radius} is the distance from the (nearest) storage axis and
+    {radial_displacement} the displacement away from it, {vertical} the
+    vertical coordinate and {vertical_displacement} its displacement
+    component; ``names`` fill in further placeholders.
+    """
+    if caverns == 1:
+        radius, radial = hs.RADIAL_COORDINATE[dimension], hs.RADIAL_DISPLACEMENT[dimension]
+    else:
+        axis = _nearest_axis(caverns)
+        radius, radial = f"abs(x-{axis})", f"u*sign(x-{axis})"
+    return template.format(radius=radius, radial_displacement=radial, vertical=COORDINATES[dimension][-1],
+                           vertical_displacement=hs.VERTICAL_DISPLACEMENT[dimension], **names)
+
+
+def _expressions(templates, dimension):
+    """Expressions of field ``templates`` with "{displacement}" expanded to its components."""
+    expressions = []
+    for template in templates:
+        if template == "{displacement}":
+            expressions += hs.DISPLACEMENT[dimension]
+        else:
+            expressions.append(expression(template, dimension))
+    return expressions
+
+
+def solution_dataset(handle, selection=None, solution="sol2"):
+    """
+    Label of the Solution dataset on ``selection`` (the whole model if None),
+    created on first use.
+    """
+    name = selection or "all"
+    dataset_tag = f"dset_{name}_{solution}"
+    label = f"Extraction {name} ({solution})"
+    datasets = handle.java.result().dataset()
+    if dataset_tag not in list(datasets.tags()):
+        datasets.create(dataset_tag, "Solution")
+        dataset = handle.java.result().dataset(dataset_tag)
+        dataset.label(label)
+        dataset.set("solution", solution)
+        if selection is not None:
+            tag, dimension = hs.RESULT_SELECTIONS[handle.model_dimension][selection]
+            dataset.selection().geom("geom1", dimension)
+            dataset.selection().named(tag)
+    return label
+
+
+def evaluate_fields(handle, fields=None, solution="sol2"):
+    """Dict of "<selection>/<expression>" -> array, including node coordinates."""
+    fields = DEFAULT_FIELDS if fields is None else fields
+    dimension = handle.model_dimension
+    arrays = {}
+    for selection, expressions in fields.items():
+        dataset = solution_dataset(handle, None if selection == "all" else selection, solution)
+        names = COORDINATES[dimension] + _expressions(expressions, dimension)
+        values = handle.model.evaluate(names, dataset=dataset)
+        for name, value in zip(names, values):
+            arrays[f"{selection}/{name}"] = np.asarray(value)
+    return arrays
+
+
+def write_fields(arrays, directory, scenario, format="npz"):
+    """Write one scenario's arrays; returns the written paths."""
+    os.makedirs(directory, exist_ok=True)
+    if format == "npz":
+        path = os.path.join(directory, f"{scenario}.npz")
+        np.savez_compressed(path, **arrays)
+        return [path]
+    if format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        paths = []
+        for selection in sorted({key.split("/", 1)[0] for key in arrays}):
+            columns = {key.split("/", 1)[1]: np.ravel(value) for key, value in arrays.items()
+                       if key.startswith(selection + "/")}
+            path = os.path.join(directory, f"{scenario}.{selection}.parquet")
+            pq.write_table(pa.table(columns), path)
+            paths.append(path)
+        return paths
+    raise ValueError(f"Unknown format: {format}")
+
+
+def extract(handle, directory, scenario, fields=None, format="npz", solution="sol2",
+            backend=None):
+    """
+    Evaluate ``fields`` on a solved model and write them for ``scenario``.
+    With ``backend`` the model is removed from its client afterwards.
+    """
+    paths = write_fields(evaluate_fields(handle, fields, solution), directory, scenario, format)
+    if backend is not None:
+        backend.remove(handle.model)
+    return paths
+
+
+def load_fields(path):
+    """Read back a scenario written in npz format as a dict of arrays."""
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
@@ -8,9 +8,12 @@ Created on Wed Jun 12 13:11:28 2024
 #############################
 # HYDROGEN STORAGE Model
 #############################
-import mph
 import math
+import numbers
 import numpy as np
+import solver_profiles
+from comsol_backend import shared_backend
+from instrumentation import Trace
 
 ################################
 # MODEL PARAMETERS
@@ -25,6 +28,12 @@ storage_height = 55 # meters
 storage_depth = -100 # meters depth of storage roof
 arc_length = 15 # arc length in y-axis meters
 
+#########################################################################################################
+#LAYOUT - multi-cavern mode only (create_h2storagemodel(..., caverns=N))
+#########################################################################################################
+pillar_width = 50 # meters of rock between neighbouring storages
+pillar_elements = 12 # elements across the pillar in the finely meshed region of interest
+
 #################################
 #ROCK PROPERTIES
 #################################
@@ -32,6 +41,14 @@ k_rock = 2.96 # W/(m*K)
 rho_rock = 2500 # kg/m^3
 cp_rock = 725 # J/(kg*K)
 
+#########################################################################################################
+#THERMAL PROPERTIES - thermo-mechanical mode only (create_h2storagemodel(..., thermal=True))
+#########################################################################################################
+thermal_expansion_rock = 8e-6 # 1/K linear thermal expansion coefficient of rock
+rock_temperature = 15 # degC in-situ rock temperature, also the strain reference temperature
+gas_temperature_rise = 40 # K wall temperature rise from compression heating during injection
+injection_time = 12 # h duration of the injection
+
 #########################################################################################################
 #MECHANICAL PROPERTIES - Hoek - Brown -criterion 
 #########################################################################################################
@@ -41,8 +58,14 @@ poissons_ratio = 0.25
 GSI = 75 #
 D_hoek = 0.1 # 0 Undistrbed in-situ rock mass... - 1 very disturbed rock mass
 m_i = 32 #Granite from Hoek and Marinos 2000. Constant values for intact rock from table.
-m_hoek = m_i*math.exp((GSI-100)/(28*14*D_hoek))
-s_hoek = math.exp((GSI-100)/(9-3*D_hoek))
+
+def hoek_brown_constants(GSI, D_hoek, m_i):
+    """Rock mass constants m_hoek and s_hoek of the Hoek-Brown criterion (scalars or arrays)."""
+    m_hoek = m_i*np.exp((GSI-100)/(28*14*D_hoek))
+    s_hoek = np.exp((GSI-100)/(9-3*D_hoek))
+    return m_hoek, s_hoek
+
+m_hoek, s_hoek = hoek_brown_constants(GSI, D_hoek, m_i)
 
 #########################################################################################################
 #MECHANICAL PROPERTIES Rock mass - Mohr-Colomb -criterion !! 
@@ -66,162 +89,474 @@ number_of_elements = 25 #number of elements at storage edge
 max_element_size = 20 # m
 max_element_growth_rate = 1.1 #maximum growth rate of elements
 
-def create_h2storagemodel(criterion, model_dimension) :#h2_params, model
-    client = mph.start(cores=4)
-    pymodel = client.create('hydrogen_storage_model')
-    h2storage = pymodel.java
-    h2storage.component().create("comp1", True)
-    if model_dimension == "2d":
-        h2storage.component("comp1").geom().create("geom1", 2)
-    elif model_dimension == "3d":
-        h2storage.component("comp1").geom().create("geom1", 3)
-        
-    h2storage.component("comp1").mesh().create("mesh1")
-    
-    print("Setting up parameters...", end=" ")
-    
-    h2storage.param().group().create("par1")
-    ##Set up model geometry parameters and internal pressure of hydrogen storage
-    h2storage.param("par1").label("Model_geometry_parameters")
-    h2storage.param("par1").set("W_model", f"{model_width}"+"[m]")
-    h2storage.param("par1").set("H_model", f"{model_height}"+"[m]")
-    h2storage.param("par1").set("storage_diameter", f"{storage_diameter}"+"[m]")
-    h2storage.param("par1").set("storage_radius", f"({storage_diameter}/2)"+"[m]")
-    h2storage.param("par1").set("storage_height", f"{storage_height}"+"[m]")
-    h2storage.param("par1").set("storage_depth", f"{storage_depth}"+"[m]")
-    h2storage.param("par1").set("arc_length", f"{arc_length}"+"[m]")
-    h2storage.param("par1").set("int_pressure", f"{internal_pressure}"+"[bar]")
-    h2storage.param("par1").descr("int_pressure", "Storage internal pressure due to pressurization")
-    
-    ##Set up model mechanical parameters for rock mass
+##############################################
+#COMSOL client
+##############################################
+number_of_cores = 4 # cores of the COMSOL client, started once and reused by every build
+
+##############################################
+#Scenario parameters
+##############################################
+# "2d" plane strain section, "2daxi" axisymmetric section revolved about x=0,
+# "3d" quarter block with the revolved storage
+MODEL_DIMENSIONS = ("2d", "2daxi", "3d")
+
+# Yield criterion -> (rock mass property groups of mat1, plasticity feature of lemm1)
+CRITERION_NODES = {
+    "hoek-brown": (("HoekBrown", "YieldStressParameters"), "rock1"),
+    "mohr-coulomb": (("MohrCoulomb",), "soil1"),
+}
+CRITERIA = tuple(CRITERION_NODES)
+
+# The axisymmetric model replaces the 3D quarter model when the far boundary,
+# a cylinder of radius W_model instead of the quarter block's square sides, is
+# at least this many storage diameters away
+AXISYMMETRIC_MIN_SPAN = 2.5
+
+def default_parameters():
+    """Scenario inputs of create_h2storagemodel, taken from the module globals above."""
+    return {
+        "model_width": model_width, "model_height": model_height,
+        "storage_diameter": storage_diameter, "storage_height": storage_height,
+        "storage_depth": storage_depth, "arc_length": arc_length,
+        "pillar_width": pillar_width, "pillar_elements": pillar_elements,
+        "rho_rock": rho_rock, "k_rock": k_rock, "cp_rock": cp_rock,
+        "thermal_expansion_rock": thermal_expansion_rock, "rock_temperature": rock_temperature,
+        "gas_temperature_rise": gas_temperature_rise, "injection_time": injection_time,
+        "compressive_strength": compressive_strength, "youngs_modulus": youngs_modulus,
+        "poissons_ratio": poissons_ratio, "GSI": GSI, "D_hoek": D_hoek, "m_i": m_i,
+        "cohesion": cohesion, "friction_angle": friction_angle,
+        "youngs_modulus_lining": youngs_modulus_lining, "rho_lining": rho_lining,
+        "poissons_ratio_lining": poissons_ratio_lining,
+        "lining_thickness": lining_thickness, "internal_pressure": internal_pressure,
+        "number_of_elements": number_of_elements, "max_element_size": max_element_size,
+        "max_element_growth_rate": max_element_growth_rate,
+    }
+
+def scenario_parameters(parameters=None):
+    """Defaults updated with ``parameters``, plus the derived Hoek-Brown constants."""
+    p = default_parameters()
+    if parameters:
+        unknown = set(parameters) - set(p)
+        if unknown:
+            raise ValueError(f"Unknown scenario parameters: {', '.join(sorted(unknown))}")
+        p.update(parameters)
+    p["m_hoek"], p["s_hoek"] = hoek_brown_constants(p["GSI"], p["D_hoek"], p["m_i"])
+    return p
+
+def axisymmetric_valid(parameters=None):
+    """
+    True when the 2D-axisymmetric model gives the 3D answer for a scenario.
+    The storage is a solid of revolution and the in-situ state is gravity
+    with roller sides, so the horizontal stresses are isotropic; what is left
+    is the shape of the far boundary.
+    """
+    p = scenario_parameters(parameters)
+    return p["model_width"] >= AXISYMMETRIC_MIN_SPAN*p["storage_diameter"]
+
+def solve_dimension(model_dimension, parameters=None):
+    """The cheapest model dimension giving the answer of ``model_dimension``."""
+    if model_dimension == "3d" and axisymmetric_valid(parameters):
+        return "2daxi"
+    return model_dimension
+
+# Scenario parameter -> (parameter group, COMSOL parameter, unit, criterion it applies to)
+COMSOL_PARAMETERS = {
+    "model_width": ("par1", "W_model", "m", None),
+    "model_height": ("par1", "H_model", "m", None),
+    "storage_diameter": ("par1", "storage_diameter", "m", None),
+    "storage_height": ("par1", "storage_height", "m", None),
+    "storage_depth": ("par1", "storage_depth", "m", None),
+    "arc_length": ("par1", "arc_length", "m", None),
+    "pillar_width": ("par1", "pillar_width", "m", None),
+    "internal_pressure": ("par1", "int_pressure", "bar", None),
+    "rho_rock": ("par2", "rho_rock", "kg/m^3", None),
+    "compressive_strength": ("par2", "sigma_ci", "MPa", "hoek-brown"),
+    "youngs_modulus": ("par2", "E_rock", "GPa", None),
+    "poissons_ratio": ("par2", "v_rock", None, None),
+    "GSI": ("par2", "GSI", None, "hoek-brown"),
+    "D_hoek": ("par2", "D_hoek", None, "hoek-brown"),
+    "m_i": ("par2", "m_i", None, "hoek-brown"),
+    "m_hoek": ("par2", "m_hoek", None, "hoek-brown"),
+    "s_hoek": ("par2", "s_hoek", None, "hoek-brown"),
+    "cohesion": ("par2", "c_rock", "MPa", "mohr-coulomb"),
+    "friction_angle": ("par2", "phi_rock", "deg", "mohr-coulomb"),
+    "rho_lining": ("par3", "rho_lining", "kg/m^3", None),
+    "youngs_modulus_lining": ("par3", "E_lining", "GPa", None),
+    "poissons_ratio_lining": ("par3", "v_lining", None, None),
+    "lining_thickness": ("par3", "l_thickness", "cm", None),
+    "number_of_elements": ("par4", "num_elem", None, None),
+    "max_element_size": ("par4", "max_elem", None, None),
+    "max_element_growth_rate": ("par4", "max_growth", None, None),
+    "pillar_elements": ("par4", "pillar_elem", None, None),
+    "k_rock": ("par5", "k_rock", "W/(m*K)", None),
+    "cp_rock": ("par5", "cp_rock", "J/(kg*K)", None),
+    "thermal_expansion_rock": ("par5", "alpha_rock", "1/K", None),
+    "rock_temperature": ("par5", "T_rock", "degC", None),
+    "gas_temperature_rise": ("par5", "dT_gas", "K", None),
+    "injection_time": ("par5", "t_injection", "h", None),
+}
+GEOMETRY_PARAMETERS = {"model_width", "model_height", "storage_diameter", "storage_height",
+                       "storage_depth", "arc_length", "pillar_width"}
+MESH_PARAMETERS = {"number_of_elements", "max_element_size", "max_element_growth_rate",
+                   "pillar_elements"}
+LAYOUT_PARAMETERS = {"pillar_width", "pillar_elements"}
+THERMAL_PARAMETERS = {"k_rock", "cp_rock", "thermal_expansion_rock", "rock_temperature",
+                      "gas_temperature_rise", "injection_time"}
+
+def comsol_parameter_values(p, criterion, names=None, thermal=False, caverns=1):
+    """(group, COMSOL parameter, expression) for scenario parameters ``names`` of ``p``."""
+    values = []
+    for name in (COMSOL_PARAMETERS if names is None else names):
+        group, comsol_name, unit, applies_to = COMSOL_PARAMETERS[name]
+        if applies_to not in (None, criterion) or (name in THERMAL_PARAMETERS and not thermal):
+            continue
+        if name in LAYOUT_PARAMETERS and caverns == 1:
+            continue
+        values.append((group, comsol_name, f"{p[name]}[{unit}]" if unit else f"{p[name]}"))
+        if name == "storage_diameter":
+            values.append(("par1", "storage_radius", f"({p[name]}/2)[m]"))
+        if name == "pillar_width":
+            values.append(("par1", "cavern_spacing", "storage_diameter+pillar_width"))
+    return values
+
+def cavern_centres(caverns):
+    """
+    Storage axes of a layout of ``caverns`` in multiples of cavern_spacing
+    from the symmetry axis x=0: an odd count has its middle storage on the
+    axis, an even count the middle pillar.
+    """
+    first = 0.0 if caverns % 2 else 0.5
+    return [first + i for i in range((caverns + 1)//2)]
+
+def pillar_centres(caverns):
+    """Pillar mid-lines of a layout of ``caverns`` in multiples of cavern_spacing."""
+    return ([] if caverns % 2 else [0.0]) + [x + 0.5 for x in cavern_centres(caverns)[:-1]]
+
+# Named selections created by the builder: name -> (selection tag, entity dimension)
+RESULT_SELECTIONS = {
+    "2d": {"storage_outer_bnd": ("geom1_csel3_bnd", 1), "h2storage": ("geom1_csel2_dom", 2)},
+    "2daxi": {"storage_outer_bnd": ("geom1_csel3_bnd", 1), "h2storage": ("geom1_csel2_dom", 2)},
+    "3d": {"storage_outer_bnd": ("geom1_csel5_bnd", 2), "h2storage": ("geom1_csel4_dom", 3)},
+}
+
+# Distance from the storage axis as a COMSOL expression
+RADIAL_COORDINATE = {"2d": "x", "2daxi": "r", "3d": "sqrt(x^2+y^2)"}
+
+# Displacement away from the storage axis as a COMSOL expression
+RADIAL_DISPLACEMENT = {"2d": "u", "2daxi": "u", "3d": "(x*u+y*v)/sqrt(x^2+y^2)"}
+
+# Displacement component along the vertical axis (y in 2D, z in 2daxi and 3D)
+VERTICAL_DISPLACEMENT = {"2d": "v", "2daxi": "w", "3d": "w"}
+
+# Displacement components of each model dimension
+DISPLACEMENT = {"2d": ["u", "v"], "2daxi": ["u", "w"], "3d": ["u", "v", "w"]}
+
+class H2StorageModel:
+    """
+    Handle to a built hydrogen storage model.
+
+    update() changes scenario parameters in place and re-solves; geometry and
+    mesh are only rebuilt when a geometric or mesh parameter actually changed.
+    """
+
+    def __init__(self, pymodel, criterion, model_dimension, parameters, trace=None, java=None,
+                 thermal=False, caverns=1):
+        self.model = pymodel
+        self.trace = Trace() if trace is None else trace
+        self.java = self.trace.wrap(pymodel.java) if java is None else java
+        self.criterion = criterion
+        self.model_dimension = model_dimension
+        self.parameters = parameters
+        self.thermal = thermal
+        self.caverns = caverns
+        self.solver_profiles = {} # study -> profile set with set_solver_profile()
+
+    def update(self, solve=True, **changes):
+        """Set scenario parameters, rebuild what they affect and re-solve; returns the changed names."""
+        inputs = {name: self.parameters[name] for name in default_parameters()}
+        inputs.update(changes)
+        p = scenario_parameters(inputs)
+        self.trace.begin("update")
+        changed = [name for name in COMSOL_PARAMETERS if p[name] != self.parameters[name]]
+        for group, name, expression in comsol_parameter_values(p, self.criterion, changed, self.thermal,
+                                                               self.caverns):
+            self.java.param(group).set(name, expression)
+        self.parameters = p
+        changed = set(changed)
+        if self.caverns == 1:
+            changed -= LAYOUT_PARAMETERS # not in the model
+        if changed & GEOMETRY_PARAMETERS:
+            self.java.component("comp1").geom("geom1").run()
+        if changed & (GEOMETRY_PARAMETERS | MESH_PARAMETERS):
+            self.java.component("comp1").mesh("mesh1").run()
+            self.trace.counts["elements"] = self.element_count()
+        self.trace.end()
+        if solve:
+            self.solve()
+        return changed
+
+    def solve(self, study=None):
+        """Solve all studies in order, or only the study with tag ``study`` (e.g. "std2")."""
+        self.trace.begin(f"solve {study or 'all'}")
+        if study is None:
+            self.model.solve()
+        else:
+            self.java.study(study).run()
+        if self.trace.dofs:
+            self.trace.counts["dofs"] = self.degrees_of_freedom("sol1" if study == "std1" else "sol2")
+        self.trace.end()
+
+    def set_criterion(self, criterion):
+        """
+        Switch the yield criterion in place: the rock mass property groups,
+        the Rocks/SoilModel feature and the criterion parameters of par2.
+        Geometry and mesh are kept. Returns True if it changed, which
+        invalidates the solutions.
+        """
+        if criterion not in CRITERIA:
+            raise ValueError(f"criterion must be one of {CRITERIA}, got {criterion!r}")
+        if criterion == self.criterion:
+            return False
+        comp1 = self.java.component("comp1")
+        mat1 = comp1.material("mat1")
+        lemm1 = comp1.physics("solid").feature("lemm1")
+        groups, feature = CRITERION_NODES[self.criterion]
+        for group in groups:
+            mat1.propertyGroup().remove(group)
+        lemm1.feature().remove(feature)
+        param = self.java.param("par2")
+        for name, (_, comsol_name, _, applies_to) in COMSOL_PARAMETERS.items():
+            if applies_to == self.criterion:
+                param.remove(comsol_name)
+        names = [name for name, entry in COMSOL_PARAMETERS.items() if entry[3] == criterion]
+        for _, name, expression in comsol_parameter_values(self.parameters, criterion, names):
+            if name in PARAMETER_DESCRIPTIONS:
+                param.set(name, expression, PARAMETER_DESCRIPTIONS[name])
+            else:
+                param.set(name, expression)
+        param.label(PARAMETER_GROUP_LABELS["par2"][criterion])
+        _rock_criterion_material(mat1, criterion)
+        _rock_criterion_feature(lemm1, criterion, 3 if self.model_dimension == "3d" else 2)
+        self.criterion = criterion
+        return True
+
+    def set_solver_profile(self, study, profile):
+        """
+        Configure the solver of ``study`` with a profile of solver_profiles.py;
+        returns True if it changed, which drops the study's solution.
+        """
+        if self.solver_profiles.get(study, "default") == profile:
+            return False
+        solver_profiles.apply(self.java, study, profile)
+        self.solver_profiles[study] = profile
+        return True
+
+    def element_count(self):
+        """Number of mesh elements, or None for models without a mesh (e.g. recorded)."""
+        count = self.java.component("comp1").mesh("mesh1").getNumElem()
+        return int(count) if isinstance(count, numbers.Integral) else None
+
+    def degrees_of_freedom(self, solution="sol2"):
+        """Length of the solution vector; it is transferred from the server to count it."""
+        u = self.java.sol(solution).getU()
+        return len(u) if hasattr(u, "__len__") else None
+
+    def save(self, path=None):
+        self.model.save(path)
+
+PARAMETER_GROUP_LABELS = {
+    "par1": "Model_geometry_parameters",
+    "par2": {"hoek-brown": "Rock mass Hoek-Brown_criterion_parameters",
+             "mohr-coulomb": "Rock mass Mohr-Coulomb_criterion_parameters"},
+    "par3": "Lining mechanical parameters",
+    "par4": "Mesh_parameters",
+    "par5": "Thermal_parameters",
+}
+PARAMETER_DESCRIPTIONS = {
+    "int_pressure": "Storage internal pressure due to pressurization",
+    "rho_rock": "Density of rock",
+    "sigma_ci": "Uniaxial compressive strength UCS",
+    "E_rock": "Young's Modulus of rock",
+    "v_rock": "Poisson's ratio of rock",
+    "GSI": "Geological Strength Index",
+    "D_hoek": "Disturbance factor",
+    "m_i": "Intact rock constant",
+    "m_hoek": "Reduced value of intact rock constant",
+    "c_rock": "cohesion of rock",
+    "phi_rock": "friction angle of rock",
+    "rho_lining": "Density of lining",
+    "E_lining": "Young's Modulus lining",
+    "v_lining": "Poisson's ratio lining",
+    "num_elem": "Numer of elements at storage boundary multiplied by 3",
+    "max_elem": "Maximum element size in the rock mass",
+    "max_growth": "Maximum element growth rate in the rock mass",
+    "k_rock": "Thermal conductivity of rock",
+    "cp_rock": "Heat capacity of rock",
+    "alpha_rock": "Thermal expansion coefficient of rock",
+    "T_rock": "In-situ rock temperature",
+    "dT_gas": "Storage wall temperature rise during injection",
+    "t_injection": "Duration of injection",
+    "pillar_width": "Width of the rock pillar between neighbouring storages",
+    "cavern_spacing": "Distance between neighbouring storage axes",
+    "pillar_elem": "Number of elements across the pillar in the region of interest",
+}
+
+def _rock_criterion_material(mat1, criterion):
+    """Property groups of the rock mass yield criterion."""
     if criterion == "hoek-brown":
-        h2storage.param().group().create("par2")
-        h2storage.param("par2").label("Rock mass Hoek-Brown_criterion_parameters")
-        h2storage.param("par2").set("rho_rock", f"{rho_rock}"+"[kg/m^3]")
-        h2storage.param("par2").descr("rho_rock", "Density of rock")
-        h2storage.param("par2").set("sigma_ci", f"{compressive_strength}"+"[MPa]")
-        h2storage.param("par2").descr("sigma_ci", "Uniaxial compressive strength UCS")
-        h2storage.param("par2").set("E_rock", f"{youngs_modulus}"+"[GPa]")
-        h2storage.param("par2").descr("E_rock", "Young's Modulus of rock")
-        h2storage.param("par2").set("v_rock", f"{poissons_ratio}")
-        h2storage.param("par2").descr("v_rock", "Poisson's ratio of rock")
-        h2storage.param("par2").set("GSI", f"{GSI}")
-        h2storage.param("par2").descr("GSI", "Geological Strength Index")
-        h2storage.param("par2").set("GSI", f"{GSI}")
-        h2storage.param("par2").descr("GSI", "Geological Strength Index")
-        h2storage.param("par2").set("D_hoek", f"{D_hoek}")
-        h2storage.param("par2").descr("D_hoek", "Disturbance factor")
-        h2storage.param("par2").set("m_i", f"{m_i}")
-        h2storage.param("par2").descr("m_i", "Intact rock constant")
-        h2storage.param("par2").set("m_hoek", f"{m_hoek}")
-        h2storage.param("par2").descr("m_hoek", "Reduced value of intact rock constant")
-        h2storage.param("par2").set("s_hoek", f"{s_hoek}")
+        hoek_brown = mat1.propertyGroup().create("HoekBrown", "Hoek_Brown")
+        yield_stress = mat1.propertyGroup().create("YieldStressParameters", "Yield_stress_parameters")
+        hoek_brown.set("sHB", "s_hoek")
+        hoek_brown.set("mHB", "m_hoek")
+        yield_stress.set("sigmauc", "sigma_ci")
+    elif criterion == "mohr-coulomb":
+        mohr_coulomb = mat1.propertyGroup().create("MohrCoulomb", "Mohr_Coulomb_criterion")
+        mohr_coulomb.set("cohesion", "c_rock")
+        mohr_coulomb.set("internalphi", "phi_rock")
 
+def _rock_criterion_feature(lemm1, criterion, dmn):
+    """Plasticity feature of the rock mass yield criterion."""
+    if criterion == "hoek-brown":
+        rock1 = lemm1.create("rock1", "Rocks", dmn) #Rock mass Hoek-Brown criteria
+        rock1.label("Rock mass - Hoek-Brown")
     elif criterion == "mohr-coulomb":
-        h2storage.param().group().create("par2")
-        h2storage.param("par2").label("Rock mass Mohr-Coulomb_criterion_parameters")
-        h2storage.param("par2").set("rho_rock", f"{rho_rock}"+"[kg/m^3]")
-        h2storage.param("par2").set("E_rock", f"{youngs_modulus}"+"[GPa]")
-        h2storage.param("par2").descr("E_rock", "Young's Modulus of rock")
-        h2storage.param("par2").set("v_rock", f"{poissons_ratio}")
-        h2storage.param("par2").descr("v_rock", "Poisson's ratio of rock")
-        h2storage.param("par2").set("c_rock", f"{cohesion}"+"[MPa]")
-        h2storage.param("par2").descr("c_rock", "cohesion of rock")
-        h2storage.param("par2").set("phi_rock", f"{friction_angle}"+"[deg]")
-        h2storage.param("par2").descr("phi_rock", "friction angle of rock")
-        
-    ##Set up model mechanical parameters for lining
-    h2storage.param().group().create("par3")
-    h2storage.param("par3").label("Lining mechanical parameters")
-    h2storage.param("par3").set("rho_lining", f"{rho_lining}"+"[kg/m^3]")
-    h2storage.param("par3").descr("rho_lining", "Density of lining")
-    h2storage.param("par3").set("E_lining", f"{youngs_modulus_lining}"+"[GPa]")
-    h2storage.param("par3").descr("E_lining", "Young's Modulus lining")
-    h2storage.param("par3").set("v_lining", f"{poissons_ratio_lining}")
-    h2storage.param("par3").descr("v_lining", "Poisson's ratio lining")
-    h2storage.param("par3").set("l_thickness", f"{lining_thickness}"+"[cm]")
-    ## Mesh parameters
-    h2storage.param().group().create("par4")
-    h2storage.param("par4").label("Mesh_parameters")
-    h2storage.param("par4").set("num_elem", f"{number_of_elements}")
-    h2storage.param("par4").descr("num_elem", "Numer of elements at storage boundary multiplied by 3")
-    h2storage.param("par4").set("max_elem", f"{max_element_size}")
-    h2storage.param("par4").descr("num_elem", "Maximum element size in the rock mass")
-    h2storage.param("par4").set("max_growth", f"{max_element_growth_rate}")
-    h2storage.param("par4").descr("max_growth", "Maximum element growth rate in the rock mass")
+        soil1 = lemm1.create("soil1", "SoilModel", dmn)
+        soil1.set("YieldCriterion", "MohrCoulomb")
+        soil1.label("Rock mass - Mohr-Coulomb")
+
+def _box_selection(geom, tag, label, entitydim, bounds, condition, contributeto=None):
+    """Create a BoxSelection; ``bounds`` maps xmin/xmax/... to expressions."""
+    box = geom.create(tag, "BoxSelection")
+    box.label(label)
+    box.set("entitydim", f"{entitydim}")
+    for name, value in bounds.items():
+        box.set(name, value)
+    box.set("condition", condition)
+    if contributeto is not None:
+        box.set("contributeto", contributeto)
+    return box
+
+def _storage_profile(geom, rectangle):
+    """Storage rectangle ``rectangle`` with quadratic Bezier top and bottom arcs, converted to a solid."""
+    r = geom.create(rectangle, "Rectangle")
+    r.label("Storage")
+    r.set("size", ("storage_radius", "storage_height")) # set up storage dimensions
+    r.set("pos", ("0", "storage_depth-storage_height")) # set up rock mass position. Depth of storage is the top part the storage
+    qb1 = geom.create("qb1", "QuadraticBezier") # set up arc in the top of the storage
+    qb1.label("Top_arc - quadratic bézier")
+    qb1.set("p", (("0", "storage_radius", "storage_radius"), # whole control polygon in one call
+                  ("storage_depth", "storage_depth", "storage_depth-arc_length")))
+    qb2 = geom.create("qb2", "QuadraticBezier") # set up arc in the bottom of the storage
+    qb2.label("Bottom_arc - quadratic bézier")
+    qb2.set("p", (("0", "storage_radius", "storage_radius"),
+                  ("storage_depth-storage_height", "storage_depth-storage_height", "storage_depth-storage_height+arc_length")))
+    csol1 = geom.create("csol1", "ConvertToSolid") # Convert_intersection_of_arcs_and_rectangle_to_domain
+    csol1.label("intersection_arcs_rectangle_to_domain")
+    csol1.selection("input").set("qb1", "qb2", rectangle) #arcs + storage rectangle
+
+def _storage_polygon(geom, tag, centre):
+    """Whole storage with its axis at x=``centre``: the shape of _storage_profile mirrored, as one solid."""
+    top, bottom = "storage_depth", "storage_depth-storage_height"
+    left, right = f"{centre}-storage_radius", f"{centre}+storage_radius"
+    bp = geom.create(tag, "BezierPolygon")
+    bp.label(f"Storage at x={centre}")
+    bp.set("type", "solid")
+    bp.set("degree", (2, 1, 2, 2, 1, 2)) # top arc, wall, bottom arc, bottom arc, wall, top arc
+    bp.set("p", ((centre, right, right, right, right, centre, left, left, left, left, centre),
+                 (top, top, f"{top}-arc_length", f"{bottom}+arc_length", bottom, bottom, bottom,
+                  f"{bottom}+arc_length", f"{top}-arc_length", top, top)))
+    bp.set("w", ("1",)*16)
+    return bp
+
+def create_h2storagemodel(criterion, model_dimension, backend=None, parameters=None, save=True, trace=None,
+                          thermal=False, caverns=1) :#h2_params, model
+    """
+    Build the model. With ``thermal`` heat transfer is added and coupled to
+    solid through thermal expansion: std3 solves the wall heating during
+    injection and std4 the stresses it causes (see the studies below).
+    ``caverns`` > 1 builds a row of storages pillar_width apart on the 2D
+    model, symmetric about x=0 (see cavern_layout.py).
+    """
+    if model_dimension not in MODEL_DIMENSIONS:
+        raise ValueError(f"model_dimension must be one of {MODEL_DIMENSIONS}, got {model_dimension!r}")
+    if caverns < 1 or (caverns > 1 and model_dimension != "2d"):
+        raise ValueError(f"Layouts of {caverns} caverns are built on the 2d model only")
+    planar = model_dimension in ("2d", "2daxi")
+    if backend is None:
+        backend = shared_backend(number_of_cores)
+    if trace is None:
+        trace = Trace()
+    p = scenario_parameters(parameters)
+    trace.begin("create")
+    pymodel = backend.create('hydrogen_storage_model')
+    h2storage = trace.wrap(pymodel.java)
+    # Node handles are looked up once and reused below, so every property set
+    # is a single call instead of a walk from the model root.
+    comp1 = h2storage.component().create("comp1", True)
+    if planar:
+        geom1 = comp1.geom().create("geom1", 2)
+        if model_dimension == "2daxi":
+            geom1.axisymmetric(True) # x becomes r, the symmetry edge x=0 the axis
+    elif model_dimension == "3d":
+        geom1 = comp1.geom().create("geom1", 3)
+
+    mesh1 = comp1.mesh().create("mesh1")
+
+    print("Setting up parameters...", end=" ")
+    trace.begin("parameters")
+    ##Set up model geometry, rock mass, lining and mesh parameters, one call per parameter
+    groups = {}
+    for group, name, expression in comsol_parameter_values(p, criterion, thermal=thermal, caverns=caverns):
+        groups.setdefault(group, []).append((name, expression))
+    for group, label in PARAMETER_GROUP_LABELS.items():
+        if group not in groups:
+            continue
+        param = h2storage.param().group().create(group)
+        param.label(label[criterion] if isinstance(label, dict) else label)
+        for name, expression in groups[group]:
+            if name in PARAMETER_DESCRIPTIONS:
+                param.set(name, expression, PARAMETER_DESCRIPTIONS[name])
+            else:
+                param.set(name, expression)
     print("Done")
-    
+
     ##################################################################################
     #Set up geometry and selections
     ##################################################################################
     print("Creating geometry...", end=" ")
-    
+    trace.begin("geometry")
+
     ##Geometry if model 2-dimensional#############
-    if model_dimension == "2d":
-        h2storage.component("comp1").geom("geom1").create("r1", "Rectangle") # set up rock mass geometry
-        h2storage.component("comp1").geom("geom1").feature("r1").label("Rock_mass")
-        h2storage.component("comp1").geom("geom1").create("r2", "Rectangle") # set up storage geometry
-        h2storage.component("comp1").geom("geom1").feature("r2").label("Storage")
-        h2storage.component("comp1").geom("geom1").feature("r1").set("size", ("W_model", "H_model")) # set up rock mass dimensions
-        h2storage.component("comp1").geom("geom1").feature("r1").set("pos", ("0", "-H_model")) # set up rock mass position. 0-point surface 
-        h2storage.component("comp1").geom("geom1").feature("r2").set("size", ("storage_radius", "storage_height")) # set up storage dimensions
-        h2storage.component("comp1").geom("geom1").feature("r2").set("pos", ("0", "storage_depth-storage_height")) # set up rock mass position. Depth of storage is the top part the storage
-        h2storage.component("comp1").geom("geom1").create("qb1", "QuadraticBezier") # set up arc in the top of the storage
-        h2storage.component("comp1").geom("geom1").feature("qb1").label("Top_arc - quadratic b\u00e9zier")
-        h2storage.component("comp1").geom("geom1").feature("qb1").setIndex("p", "0", 0, 0)
-        h2storage.component("comp1").geom("geom1").feature("qb1").setIndex("p", "storage_radius", 0, 1)
-        h2storage.component("comp1").geom("geom1").feature("qb1").setIndex("p", "storage_radius", 0, 2)
-        h2storage.component("comp1").geom("geom1").feature("qb1").setIndex("p", "storage_depth", 1, 0)
-        h2storage.component("comp1").geom("geom1").feature("qb1").setIndex("p", "storage_depth", 1, 1)
-        h2storage.component("comp1").geom("geom1").feature("qb1").setIndex("p", "storage_depth-arc_length", 1, 2)        
-        h2storage.component("comp1").geom("geom1").create("qb2", "QuadraticBezier") # set up arc in the bottom of the storage
-        h2storage.component("comp1").geom("geom1").feature("qb2").label("Bottom_arc - quadratic b\u00e9zier")
-        h2storage.component("comp1").geom("geom1").feature("qb2").setIndex("p", "0", 0, 0)
-        h2storage.component("comp1").geom("geom1").feature("qb2").setIndex("p", "storage_radius", 0, 1)
-        h2storage.component("comp1").geom("geom1").feature("qb2").setIndex("p", "storage_radius", 0, 2)
-        h2storage.component("comp1").geom("geom1").feature("qb2").setIndex("p", "storage_depth-storage_height", 1, 0)
-        h2storage.component("comp1").geom("geom1").feature("qb2").setIndex("p", "storage_depth-storage_height", 1, 1)
-        h2storage.component("comp1").geom("geom1").feature("qb2").setIndex("p", "storage_depth-storage_height+arc_length", 1, 2)  
-        h2storage.component("comp1").geom("geom1").create("csol1", "ConvertToSolid") # Convert_intersection_of_arcs_and_rectangle_to_domain
-        h2storage.component("comp1").geom("geom1").feature("csol1").label("intersection_arcs_rectangle_to_domain")
-        h2storage.component("comp1").geom("geom1").feature("csol1").selection("input").set("qb1", "qb2", "r2") #arcs + storage rectangle
-    
+    # Layouts keep W_model between the outermost storage axis and the far boundary
+    outer = cavern_centres(caverns)[-1]
+    width = f"W_model+{outer:g}*cavern_spacing" if caverns > 1 else "W_model"
+    on_axis = caverns % 2 == 1 # a storage on the symmetry axis is modelled as a half
+    if planar:
+        r1 = geom1.create("r1", "Rectangle") # set up rock mass geometry
+        r1.label("Rock_mass")
+        r1.set("size", (width, "H_model")) # set up rock mass dimensions
+        r1.set("pos", ("0", "-H_model")) # set up rock mass position. 0-point surface
+        if on_axis:
+            _storage_profile(geom1, "r2")
+        profile = geom1
+
     ##Geometry if model 3-dimensional#############
     elif model_dimension == "3d":
-        h2storage.component("comp1").geom("geom1").create("blk1", "Block") # set up rock mass geometry
-        h2storage.component("comp1").geom("geom1").feature("blk1").label("Rock_mass")
-        h2storage.component("comp1").geom("geom1").feature("blk1").set("size", ("W_model", "W_model", "H_model"))
-        h2storage.component("comp1").geom("geom1").feature("blk1").set("pos", ("0", "0", "-H_model"))
-        h2storage.component("comp1").geom("geom1").create("wp1", "WorkPlane") # set up storage geometry
-        h2storage.component("comp1").geom("geom1").feature("wp1").set("quickplane", "xz")
-        h2storage.component("comp1").geom("geom1").feature("wp1").label("Work Plane for creating storage geom.")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().create("r1", "Rectangle")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("r1").label("Storage")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("r1").set("size", ("storage_radius", "storage_height")) # set up storage dimensions
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("r1").set("pos", ("0", "storage_depth-storage_height")) # set up rock mass position. Depth of storage is the top part the storage
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().create("qb1", "QuadraticBezier") # set up arc in the top of the storage
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb1").label("Top_arc - quadratic b\u00e9zier")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb1").setIndex("p", "0", 0, 0)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb1").setIndex("p", "storage_radius", 0, 1)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb1").setIndex("p", "storage_radius", 0, 2)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb1").setIndex("p", "storage_depth", 1, 0)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb1").setIndex("p", "storage_depth", 1, 1)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb1").setIndex("p", "storage_depth-arc_length", 1, 2)      
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().create("qb2", "QuadraticBezier") # set up arc in the bottom of the storage
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb2").label("Bottom_arc - quadratic b\u00e9zier")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb2").setIndex("p", "0", 0, 0)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb2").setIndex("p", "storage_radius", 0, 1)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb2").setIndex("p", "storage_radius", 0, 2)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb2").setIndex("p", "storage_depth-storage_height", 1, 0)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb2").setIndex("p", "storage_depth-storage_height", 1, 1)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("qb2").setIndex("p", "storage_depth-storage_height+arc_length", 1, 2)  
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().create("csol1", "ConvertToSolid") # Convert_intersection_of_arcs_and_rectangle_to_domain
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("csol1").label("intersection_arcs_rectangle_to_domain")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("csol1").selection("input").set("qb1", "qb2", "r1") #arcs + storage rectangle
+        blk1 = geom1.create("blk1", "Block") # set up rock mass geometry
+        blk1.label("Rock_mass")
+        blk1.set("size", ("W_model", "W_model", "H_model"))
+        blk1.set("pos", ("0", "0", "-H_model"))
+        wp1 = geom1.create("wp1", "WorkPlane") # set up storage geometry
+        wp1.set("quickplane", "xz")
+        wp1.label("Work Plane for creating storage geom.")
+        profile = wp1.geom()
+        _storage_profile(profile, "r1")
 
     ##################################################################################
     #Set up selections for creating storage geometry
     ##################################################################################
+    trace.begin("selections") # includes building the geometry sequence
     bnd_2d = 1 #select boundary
     dmn_2d = 2 #select domain
     bnd_3d = 2
@@ -230,59 +565,28 @@ def create_h2storagemodel(criterion, model_dimension) :#h2_params, model
     create_bottom_arc = "boxsel2"
     arc_sel = "csel1"
     ####Geometry if model 2-dimensional#############
-    if model_dimension == "2d":
-        h2storage.component("comp1").geom("geom1").selection().create("csel1", "CumulativeSelection")
-        h2storage.component("comp1").geom("geom1").selection().create("csel2", "CumulativeSelection")
-        h2storage.component("comp1").geom("geom1").selection().create("csel3", "CumulativeSelection")
-        ##################################################################################
-        h2storage.component("comp1").geom("geom1").create(create_top_arc, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature(create_top_arc).label("top_arc_selection")
-        h2storage.component("comp1").geom("geom1").feature(create_top_arc).set("entitydim", f"{dmn_2d}")
-        h2storage.component("comp1").geom("geom1").feature(create_top_arc).set("xmin", "storage_radius")
-        h2storage.component("comp1").geom("geom1").feature(create_top_arc).set("xmax", "storage_radius")
-        h2storage.component("comp1").geom("geom1").feature(create_top_arc).set("ymin", "storage_depth")
-        h2storage.component("comp1").geom("geom1").feature(create_top_arc).set("ymax", "storage_depth")
-        h2storage.component("comp1").geom("geom1").feature(create_top_arc).set("condition", "somevertex")
-        h2storage.component("comp1").geom("geom1").feature(create_top_arc).set("contributeto", arc_sel)
-        h2storage.component("comp1").geom("geom1").create(create_bottom_arc, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature(create_bottom_arc).label("bottom_arc_selection")
-        h2storage.component("comp1").geom("geom1").feature(create_bottom_arc).set("entitydim", f"{dmn_2d}")
-        h2storage.component("comp1").geom("geom1").feature(create_bottom_arc).set("xmin", "storage_radius")
-        h2storage.component("comp1").geom("geom1").feature(create_bottom_arc).set("xmax", "storage_radius")
-        h2storage.component("comp1").geom("geom1").feature(create_bottom_arc).set("ymin", "storage_depth-storage_height")
-        h2storage.component("comp1").geom("geom1").feature(create_bottom_arc).set("ymax", "storage_depth-storage_height")
-        h2storage.component("comp1").geom("geom1").feature(create_bottom_arc).set("condition", "somevertex")
-        h2storage.component("comp1").geom("geom1").feature(create_bottom_arc).set("contributeto", arc_sel)
-    
+    if planar:
+        geom1.selection().create("csel1", "CumulativeSelection")
+        geom1.selection().create("csel2", "CumulativeSelection")
+        geom1.selection().create("csel3", "CumulativeSelection")
+
     ####Geometry if model 3-dimensional#############
     elif model_dimension == "3d":
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().selection().create(arc_sel , "CumulativeSelection")
-        h2storage.component("comp1").geom("geom1").selection().create(arc_sel, "CumulativeSelection")
-        h2storage.component("comp1").geom("geom1").selection(arc_sel).label("arc_sel") 
-        
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().create(create_top_arc, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_top_arc).label("top_arc_selection")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_top_arc).set("entitydim", f"{dmn_2d}")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_top_arc).set("xmin", "storage_radius")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_top_arc).set("xmax", "storage_radius")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_top_arc).set("ymin", "storage_depth")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_top_arc).set("ymax", "storage_depth")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_top_arc).set("condition", "somevertex")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_top_arc).set("contributeto", arc_sel)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().create(create_bottom_arc, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_bottom_arc).label("bottom_arc_selection")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_bottom_arc).set("entitydim", f"{dmn_2d}")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_bottom_arc).set("xmin", "storage_radius")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_bottom_arc).set("xmax", "storage_radius")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_bottom_arc).set("ymin", "storage_depth-storage_height")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_bottom_arc).set("ymax", "storage_depth-storage_height")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_bottom_arc).set("condition", "somevertex")
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature(create_bottom_arc).set("contributeto", arc_sel)
-        
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().create("del1", "Delete") # delete rectangle edges for arc shape
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("del1").selection("input").init(dmn_2d)
-        h2storage.component("comp1").geom("geom1").feature("wp1").geom().feature("del1").selection("input").named(arc_sel)
-    
+        profile.selection().create(arc_sel , "CumulativeSelection")
+        geom1.selection().create(arc_sel, "CumulativeSelection").label("arc_sel")
+    ##################################################################################
+    if on_axis:
+        _box_selection(profile, create_top_arc, "top_arc_selection", dmn_2d,
+                       {"xmin": "storage_radius", "xmax": "storage_radius",
+                        "ymin": "storage_depth", "ymax": "storage_depth"}, "somevertex", arc_sel)
+        _box_selection(profile, create_bottom_arc, "bottom_arc_selection", dmn_2d,
+                       {"xmin": "storage_radius", "xmax": "storage_radius",
+                        "ymin": "storage_depth-storage_height", "ymax": "storage_depth-storage_height"}, "somevertex", arc_sel)
+    if model_dimension == "3d":
+        del1 = profile.create("del1", "Delete") # delete rectangle edges for arc shape
+        del1.selection("input").init(dmn_2d)
+        del1.selection("input").named(arc_sel)
+
     ###################################################
     # Set up selections for boundary conditions
     ###################################################
@@ -292,6 +596,7 @@ def create_h2storagemodel(criterion, model_dimension) :#h2_params, model
     bottom_bnd_2d = "boxsel5"
     h2storage_sel_2d = "csel2"
     storage_outer_bnd_2d = "csel3"
+    roi_2d = "boxsel6" # layouts: pillars and storages, meshed finely
     ##3Dimensional
     symmetry_bnd1 = "boxsel3"
     symmetry_bnd2 = "boxsel4"
@@ -302,303 +607,292 @@ def create_h2storagemodel(criterion, model_dimension) :#h2_params, model
     bottom_bnd_3d = "boxsel7"
     h2storage_sel_3d = "csel4"
     storage_outer_bnd_3d = "csel5"
-    
-    if model_dimension == "2d":
-        h2storage.component("comp1").geom("geom1").create(symmetry_bnd, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd).label("symmetry_bnd_selection")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd).set("entitydim", f"{bnd_2d}")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd).set("xmin", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd).set("xmax", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd).set("ymin", "-H_model")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd).set("ymax", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd).set("condition", "inside")
-        h2storage.component("comp1").geom("geom1").create(faraway_bnd, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd).label("faraway_bnd_selection")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd).set("entitydim", f"{bnd_2d}")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd).set("xmin", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd).set("xmax", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd).set("ymin", "-H_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd).set("ymax", "0")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd).set("condition", "inside")
-        h2storage.component("comp1").geom("geom1").create(bottom_bnd_2d, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_2d).label("bottom_bnd_selection")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_2d).set("entitydim", f"{bnd_2d}")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_2d).set("xmin", "0")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_2d).set("xmax", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_2d).set("ymin", "-H_model")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_2d).set("ymax", "-H_model")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_2d).set("condition", "inside")
-        
+
+    if planar:
+        _box_selection(geom1, symmetry_bnd, "symmetry_bnd_selection", bnd_2d,
+                       {"xmin": "0", "xmax": "0", "ymin": "-H_model", "ymax": "0"}, "inside")
+        _box_selection(geom1, faraway_bnd, "faraway_bnd_selection", bnd_2d,
+                       {"xmin": width, "xmax": width, "ymin": "-H_model", "ymax": "0"}, "inside")
+        _box_selection(geom1, bottom_bnd_2d, "bottom_bnd_selection", bnd_2d,
+                       {"xmin": "0", "xmax": width, "ymin": "-H_model", "ymax": "-H_model"}, "inside")
+
         ##Delete rectangle edges around arc
-        h2storage.component("comp1").geom("geom1").create("del1", "Delete") # delete rectangle edges for arc shape
-        h2storage.component("comp1").geom("geom1").feature("del1").selection("input").init(dmn_2d)
-        h2storage.component("comp1").geom("geom1").feature("del1").selection("input").named(arc_sel)
-        h2storage.component("comp1").geom("geom1").feature("del1").set("contributeto", h2storage_sel_2d)
-        h2storage.component("comp1").geom("geom1").selection(h2storage_sel_2d).label("h2storage_sel")
-        h2storage.component("comp1").geom("geom1").feature("del1").set("selresult", "on")
-        h2storage.component("comp1").geom("geom1").feature("del1").set("color", "10")
-
-        h2storage.component("comp1").geom("geom1").create("difsel1", "DifferenceSelection")
-        h2storage.component("comp1").geom("geom1").feature("difsel1").set("entitydim", f"{bnd_2d}")
-        h2storage.component("comp1").geom("geom1").feature("difsel1").set("add", h2storage_sel_2d)
-        h2storage.component("comp1").geom("geom1").feature("difsel1").set("subtract", symmetry_bnd)
-        h2storage.component("comp1").geom("geom1").selection(storage_outer_bnd_2d).label("storage_outer_bnd")
-        h2storage.component("comp1").geom("geom1").feature("difsel1").set("contributeto", storage_outer_bnd_2d)
-        h2storage.component("comp1").geom("geom1").run()
-    
+        if on_axis:
+            del1 = geom1.create("del1", "Delete") # delete rectangle edges for arc shape
+            del1.selection("input").init(dmn_2d)
+            del1.selection("input").named(arc_sel)
+            del1.set("contributeto", h2storage_sel_2d)
+            del1.set("selresult", "on")
+            del1.set("color", "10")
+        geom1.selection(h2storage_sel_2d).label("h2storage_sel")
+
+        ##Further storages of a layout and the region of interest around them
+        for i, centre in enumerate(cavern_centres(caverns)[1 if on_axis else 0:], 1):
+            bp = _storage_polygon(geom1, f"bp{i}", f"{centre:g}*cavern_spacing")
+            bp.set("contributeto", h2storage_sel_2d)
+            bp.set("selresult", "on")
+        if caverns > 1:
+            roi = geom1.create("r3", "Rectangle")
+            roi.label("Region of interest")
+            roi_right = f"{outer:g}*cavern_spacing+storage_radius+pillar_width/2"
+            roi_bottom = "storage_depth-storage_height-pillar_width/2"
+            roi.set("size", (roi_right, f"min(0,storage_depth+pillar_width/2)-({roi_bottom})"))
+            roi.set("pos", ("0", roi_bottom))
+            _box_selection(geom1, roi_2d, "region_of_interest_selection", dmn_2d,
+                           {"xmin": "0", "xmax": roi_right, "ymin": roi_bottom,
+                            "ymax": "min(0,storage_depth+pillar_width/2)"}, "inside")
+
+        difsel1 = geom1.create("difsel1", "DifferenceSelection")
+        difsel1.set("entitydim", f"{bnd_2d}")
+        difsel1.set("add", h2storage_sel_2d)
+        difsel1.set("subtract", symmetry_bnd)
+        geom1.selection(storage_outer_bnd_2d).label("storage_outer_bnd")
+        difsel1.set("contributeto", storage_outer_bnd_2d)
+        geom1.run()
+
     elif model_dimension == "3d":
-        #################################################    
+        #################################################
         ###set up 3D storage and selections for 3D model#
         #################################################
-        
-        h2storage.component("comp1").geom("geom1").selection().create(symmetry_bnd_sel, "CumulativeSelection")
-        h2storage.component("comp1").geom("geom1").selection(symmetry_bnd_sel).label("symmetry_bnd_sel")
-        h2storage.component("comp1").geom("geom1").selection().create(faraway_bnd_sel, "CumulativeSelection")
-        h2storage.component("comp1").geom("geom1").selection(faraway_bnd_sel).label("faraway_bnd_sel")
-        h2storage.component("comp1").geom("geom1").selection().create(h2storage_sel_3d, "CumulativeSelection")
-        h2storage.component("comp1").geom("geom1").selection(h2storage_sel_3d).label("h2storage_sel")
-        h2storage.component("comp1").geom("geom1").selection().create(storage_outer_bnd_3d, "CumulativeSelection")
-        h2storage.component("comp1").geom("geom1").selection(storage_outer_bnd_3d).label("storage_outer_bnd")
-        
+
+        geom1.selection().create(symmetry_bnd_sel, "CumulativeSelection").label("symmetry_bnd_sel")
+        geom1.selection().create(faraway_bnd_sel, "CumulativeSelection").label("faraway_bnd_sel")
+        geom1.selection().create(h2storage_sel_3d, "CumulativeSelection").label("h2storage_sel")
+        geom1.selection().create(storage_outer_bnd_3d, "CumulativeSelection").label("storage_outer_bnd")
+
         ##Create storage geometry 1/4 symmetry##########
-        h2storage.component("comp1").geom("geom1").feature().create("rev1", "Revolve")
-        h2storage.component("comp1").geom("geom1").feature("rev1").label("3D_storage [1/4]")
-        h2storage.component("comp1").geom("geom1").feature("rev1").set("workplane", "wp1") ### Create 3d storage, symmetry 1/4
-        h2storage.component("comp1").geom("geom1").feature("rev1").selection("input").set("wp1")
-        h2storage.component("comp1").geom("geom1").feature("rev1").set("angtype", "specang")
-        h2storage.component("comp1").geom("geom1").feature("rev1").set("angle2", "90")
-        h2storage.component("comp1").geom("geom1").feature("rev1").set("selresult", "on")
-        h2storage.component("comp1").geom("geom1").feature("rev1").set("contributeto", h2storage_sel_3d)
-        
-        h2storage.component("comp1").geom("geom1").create(symmetry_bnd1, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd1).label("symmetry_bnd_selection_xaxis")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd1).set("entitydim", f"{bnd_3d}")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd1).set("xmin", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd1).set("xmax", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd1).set("ymin", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd1).set("ymax", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd1).set("zmin", "-H_model")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd1).set("zmax", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd1).set("condition", "inside")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd1).set("contributeto", symmetry_bnd_sel)
-        
-        h2storage.component("comp1").geom("geom1").create(symmetry_bnd2, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd2).label("symmetry_bnd_selection_yaxis")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd2).set("entitydim", f"{bnd_3d}")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd2).set("xmin", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd2).set("xmax", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd2).set("ymin", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd2).set("ymax", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd2).set("zmin", "-H_model")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd2).set("zmax", "0")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd2).set("condition", "inside")
-        h2storage.component("comp1").geom("geom1").feature(symmetry_bnd2).set("contributeto", symmetry_bnd_sel)
-        
-        h2storage.component("comp1").geom("geom1").create(faraway_bnd1, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd1).label("faraway_bnd_selection_xaxis")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd1).set("entitydim", f"{bnd_3d}")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd1).set("xmin", "0")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd1).set("xmax", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd1).set("ymin", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd1).set("ymax", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd1).set("zmin", "-H_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd1).set("zmax", "0")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd1).set("condition", "inside")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd1).set("contributeto", faraway_bnd_sel)
-        
-        h2storage.component("comp1").geom("geom1").create(faraway_bnd2, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd2).label("faraway_bnd_selection_yaxis")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd2).set("entitydim", f"{bnd_3d}")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd2).set("xmin", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd2).set("xmax", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd2).set("ymin", "0")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd2).set("ymax", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd2).set("zmin", "-H_model")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd2).set("zmax", "0")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd2).set("condition", "inside")
-        h2storage.component("comp1").geom("geom1").feature(faraway_bnd2).set("contributeto", faraway_bnd_sel)
-        
-        h2storage.component("comp1").geom("geom1").create(bottom_bnd_3d, "BoxSelection")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_3d).label("bottom_bnd_selection")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_3d).set("entitydim", f"{bnd_3d}")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_3d).set("xmin", "0")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_3d).set("xmax", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_3d).set("ymin", "0")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_3d).set("ymax", "W_model")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_3d).set("zmin", "-H_model")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_3d).set("zmax", "-H_model")
-        h2storage.component("comp1").geom("geom1").feature(bottom_bnd_3d).set("condition", "inside")
-
-        h2storage.component("comp1").geom("geom1").create("difsel1", "DifferenceSelection")
-        h2storage.component("comp1").geom("geom1").feature("difsel1").set("entitydim", f"{bnd_3d}")
-        h2storage.component("comp1").geom("geom1").feature("difsel1").set("add", h2storage_sel_3d)
-        h2storage.component("comp1").geom("geom1").feature("difsel1").set("subtract", symmetry_bnd_sel)
-        h2storage.component("comp1").geom("geom1").feature("difsel1").set("contributeto", storage_outer_bnd_3d)
-        h2storage.component("comp1").geom("geom1").run()
+        rev1 = geom1.feature().create("rev1", "Revolve")
+        rev1.label("3D_storage [1/4]")
+        rev1.set("workplane", "wp1") ### Create 3d storage, symmetry 1/4
+        rev1.selection("input").set("wp1")
+        rev1.set("angtype", "specang")
+        rev1.set("angle2", "90")
+        rev1.set("selresult", "on")
+        rev1.set("contributeto", h2storage_sel_3d)
+
+        _box_selection(geom1, symmetry_bnd1, "symmetry_bnd_selection_xaxis", bnd_3d,
+                       {"xmin": "0", "xmax": "W_model", "ymin": "0", "ymax": "0", "zmin": "-H_model", "zmax": "0"},
+                       "inside", symmetry_bnd_sel)
+        _box_selection(geom1, symmetry_bnd2, "symmetry_bnd_selection_yaxis", bnd_3d,
+                       {"xmin": "0", "xmax": "0", "ymin": "0", "ymax": "W_model", "zmin": "-H_model", "zmax": "0"},
+                       "inside", symmetry_bnd_sel)
+        _box_selection(geom1, faraway_bnd1, "faraway_bnd_selection_xaxis", bnd_3d,
+                       {"xmin": "0", "xmax": "W_model", "ymin": "W_model", "ymax": "W_model", "zmin": "-H_model", "zmax": "0"},
+                       "inside", faraway_bnd_sel)
+        _box_selection(geom1, faraway_bnd2, "faraway_bnd_selection_yaxis", bnd_3d,
+                       {"xmin": "W_model", "xmax": "W_model", "ymin": "0", "ymax": "W_model", "zmin": "-H_model", "zmax": "0"},
+                       "inside", faraway_bnd_sel)
+        _box_selection(geom1, bottom_bnd_3d, "bottom_bnd_selection", bnd_3d,
+                       {"xmin": "0", "xmax": "W_model", "ymin": "0", "ymax": "W_model", "zmin": "-H_model", "zmax": "-H_model"},
+                       "inside")
+
+        difsel1 = geom1.create("difsel1", "DifferenceSelection")
+        difsel1.set("entitydim", f"{bnd_3d}")
+        difsel1.set("add", h2storage_sel_3d)
+        difsel1.set("subtract", symmetry_bnd_sel)
+        difsel1.set("contributeto", storage_outer_bnd_3d)
+        geom1.run()
 
     print("Done")
     ##################################################################################
     #Set up material properties
     ##################################################################################
     print("Creating material...", end=" ")
+    trace.begin("materials")
     ################################
     # Rock mass material properties
     ################################
-    if criterion == "hoek-brown":
-        h2storage.component("comp1").material().create("mat1", "Common")
-        h2storage.component("comp1").material("mat1").label("Rock mass")
-        h2storage.component("comp1").material("mat1").propertyGroup().create("Enu", "Young's_modulus_and_Poisson's_ratio")
-        h2storage.component("comp1").material("mat1").propertyGroup().create("HoekBrown", "Hoek_Brown")
-        h2storage.component("comp1").material("mat1").propertyGroup().create("YieldStressParameters", "Yield_stress_parameters")
-        h2storage.component("comp1").material("mat1").propertyGroup("Enu").set("E", "E_rock")
-        h2storage.component("comp1").material("mat1").propertyGroup("Enu").set("nu", "v_rock")
-        h2storage.component("comp1").material("mat1").propertyGroup("def").set("density", "rho_rock")
-        h2storage.component("comp1").material("mat1").propertyGroup("HoekBrown").set("sHB", "s_hoek")
-        h2storage.component("comp1").material("mat1").propertyGroup("HoekBrown").set("mHB", "m_hoek")
-        h2storage.component("comp1").material("mat1").propertyGroup("YieldStressParameters").set("sigmauc", "sigma_ci")
-    elif criterion == "mohr-coulomb":
-        h2storage.component("comp1").material().create("mat1", "Common")
-        h2storage.component("comp1").material("mat1").label("Rock mass")
-        h2storage.component("comp1").material("mat1").propertyGroup().create("Enu", "Young's_modulus_and_Poisson's_ratio")
-        h2storage.component("comp1").material("mat1").propertyGroup().create("MohrCoulomb", "Mohr_Coulomb_criterion")
-        h2storage.component("comp1").material("mat1").propertyGroup("Enu").set("E", "E_rock")
-        h2storage.component("comp1").material("mat1").propertyGroup("Enu").set("nu", "v_rock")
-        h2storage.component("comp1").material("mat1").propertyGroup("def").set("density", "rho_rock")
-        h2storage.component("comp1").material("mat1").propertyGroup("MohrCoulomb").set("cohesion", "c_rock")
-        h2storage.component("comp1").material("mat1").propertyGroup("MohrCoulomb").set("internalphi", "phi_rock")
+    mat1 = comp1.material().create("mat1", "Common")
+    mat1.label("Rock mass")
+    enu = mat1.propertyGroup().create("Enu", "Young's_modulus_and_Poisson's_ratio")
+    enu.set("E", "E_rock")
+    enu.set("nu", "v_rock")
+    mat1.propertyGroup("def").set("density", "rho_rock")
+    if thermal:
+        mat1.propertyGroup("def").set("thermalconductivity", ("k_rock", "0", "0", "0", "k_rock", "0", "0", "0", "k_rock"))
+        mat1.propertyGroup("def").set("heatcapacity", "cp_rock")
+        mat1.propertyGroup("def").set("thermalexpansioncoefficient", ("alpha_rock", "0", "0", "0", "alpha_rock", "0", "0", "0", "alpha_rock"))
+    _rock_criterion_material(mat1, criterion)
     ##############################
     #Lining material properties
     ##############################
-    h2storage.component("comp1").material().create("mat2", "Common")
-    h2storage.component("comp1").material("mat2").label("Lining")
-    h2storage.component("comp1").material("mat2").set("family", "concrete")
-    if model_dimension == "2d":
-        h2storage.component("comp1").material("mat2").selection().geom("geom1", bnd_2d)
-        h2storage.component("comp1").material("mat2").selection().named(f"geom1_{storage_outer_bnd_2d}_bnd")
+    mat2 = comp1.material().create("mat2", "Common")
+    mat2.label("Lining")
+    mat2.set("family", "concrete")
+    if planar:
+        mat2.selection().geom("geom1", bnd_2d)
+        mat2.selection().named(f"geom1_{storage_outer_bnd_2d}_bnd")
     elif model_dimension == "3d":
-        h2storage.component("comp1").material("mat2").selection().geom("geom1", bnd_3d)
-        h2storage.component("comp1").material("mat2").selection().named(f"geom1_{storage_outer_bnd_3d}_bnd")
-    h2storage.component("comp1").material("mat2").propertyGroup().create("Enu", "Young's_modulus_and_Poisson's_ratio")
-    h2storage.component("comp1").material("mat2").propertyGroup("Enu").set("E", "E_lining")
-    h2storage.component("comp1").material("mat2").propertyGroup("Enu").set("nu", "v_lining")
-    h2storage.component("comp1").material("mat2").propertyGroup("def").set("density", "rho_lining")
+        mat2.selection().geom("geom1", bnd_3d)
+        mat2.selection().named(f"geom1_{storage_outer_bnd_3d}_bnd")
+    enu = mat2.propertyGroup().create("Enu", "Young's_modulus_and_Poisson's_ratio")
+    enu.set("E", "E_lining")
+    enu.set("nu", "v_lining")
+    mat2.propertyGroup("def").set("density", "rho_lining")
     print("Done")
-    
+
     ##################################################################################
     #Set up physics
     ##################################################################################
     print("Setting up physics solid mechanics...", end=" ")
-    h2storage.component("comp1").physics().create("solid", "SolidMechanics", "geom1") # Set up solid mechanics physics
-    if model_dimension == "2d":
-        if criterion == "hoek-brown":
-            h2storage.component("comp1").physics("solid").feature("lemm1").create("rock1", "Rocks", dmn_2d) #Rock mass Hoek-Brown criteria    
-            h2storage.component("comp1").physics("solid").feature("lemm1").feature("rock1").label("Rock mass - Hoek-Brown")
-        elif criterion == "mohr-coulomb":
-            h2storage.component("comp1").physics("solid").feature("lemm1").create("soil1", "SoilModel", dmn_2d)
-            h2storage.component("comp1").physics("solid").feature("lemm1").feature("soil1").set("YieldCriterion", "MohrCoulomb")
-            h2storage.component("comp1").physics("solid").feature("lemm1").feature("soil1").label("Rock mass - Mohr-Coulomb")
-        h2storage.component("comp1").physics("solid").feature("lemm1").create("iss1", "InitialStressandStrain", dmn_2d)
-        h2storage.component("comp1").physics("solid").feature("lemm1").create("act1", "Activation", dmn_2d)
-        h2storage.component("comp1").physics("solid").create("roll1", "Roller", bnd_2d)  # Boundary condition for outer edge - no displacement in x-directio
-        h2storage.component("comp1").physics("solid").feature("lemm1").feature("act1").selection().named(f"geom1_{h2storage_sel_2d}_dom")
-        h2storage.component("comp1").physics("solid").feature("roll1").selection().named(f"geom1_{faraway_bnd}")
-        h2storage.component("comp1").physics("solid").create("fix1", "Fixed", bnd_2d)  # Boundary condition for bottom edge - no displacement
-        h2storage.component("comp1").physics("solid").feature("fix1").selection().named(f"geom1_{bottom_bnd_2d}")
-        h2storage.component("comp1").physics("solid").create("sym1", "SymmetrySolid", bnd_2d) # symmetry boundary condition 
-        h2storage.component("comp1").physics("solid").feature("sym1").selection().named(f"geom1_{symmetry_bnd}")
-        h2storage.component("comp1").physics("solid").create("bndl1", "BoundaryLoad", bnd_2d) # load boundary condition for storage once hydrogen storage is pressurizated  
-        h2storage.component("comp1").physics("solid").feature("bndl1").selection().named(f"geom1_{storage_outer_bnd_2d}_bnd")
-        h2storage.component("comp1").physics("solid").create("tl1", "ThinLayer", bnd_2d) #create lining boundary layer at the storage boundary
-        h2storage.component("comp1").physics("solid").feature("tl1").selection().named(f"geom1_{storage_outer_bnd_2d}_bnd")
+    trace.begin("physics")
+    solid = comp1.physics().create("solid", "SolidMechanics", "geom1") # Set up solid mechanics physics
+    lemm1 = solid.feature("lemm1")
+    if planar:
+        bnd, dmn = bnd_2d, dmn_2d
+        h2storage_dom = f"geom1_{h2storage_sel_2d}_dom"
+        faraway_bnd_named = f"geom1_{faraway_bnd}"
+        bottom_bnd_named = f"geom1_{bottom_bnd_2d}"
+        symmetry_bnd_named = f"geom1_{symmetry_bnd}"
+        storage_bnd_named = f"geom1_{storage_outer_bnd_2d}_bnd"
     elif model_dimension == "3d":
-        if criterion == "hoek-brown":
-            h2storage.component("comp1").physics("solid").feature("lemm1").create("rock1", "Rocks", dmn_3d) #Rock mass Hoek-Brown criteria    
-            h2storage.component("comp1").physics("solid").feature("lemm1").feature("rock1").label("Rock mass - Hoek-Brown")
-        elif criterion == "mohr-coulomb":
-            h2storage.component("comp1").physics("solid").feature("lemm1").create("soil1", "SoilModel", dmn_3d)
-            h2storage.component("comp1").physics("solid").feature("lemm1").feature("soil1").set("YieldCriterion", "MohrCoulomb")
-            h2storage.component("comp1").physics("solid").feature("lemm1").feature("soil1").label("Rock mass - Mohr-Coulomb")
-        h2storage.component("comp1").physics("solid").feature("lemm1").create("iss1", "InitialStressandStrain", dmn_3d)
-        h2storage.component("comp1").physics("solid").feature("lemm1").create("act1", "Activation", dmn_3d)
-        h2storage.component("comp1").physics("solid").feature("lemm1").feature("act1").selection().named(f"geom1_{h2storage_sel_3d}_dom")
-        h2storage.component("comp1").physics("solid").create("roll1", "Roller", bnd_3d)  # Boundary condition for outer edge - no displacement in x-directio
-        h2storage.component("comp1").physics("solid").feature("roll1").selection().named(f"geom1_{faraway_bnd_sel}_bnd")    
-        h2storage.component("comp1").physics("solid").create("fix1", "Fixed", bnd_3d)  # Boundary condition for bottom edge - no displacement
-        h2storage.component("comp1").physics("solid").feature("fix1").selection().named(f"geom1_{bottom_bnd_3d}")
-        h2storage.component("comp1").physics("solid").create("sym1", "SymmetrySolid", bnd_3d) # symmetry boundary condition 
-        h2storage.component("comp1").physics("solid").feature("sym1").selection().named(f"geom1_{symmetry_bnd_sel}_bnd")
-        h2storage.component("comp1").physics("solid").create("bndl1", "BoundaryLoad", bnd_3d) # load boundary condition for storage once hydrogen storage is pressurizated  
-        h2storage.component("comp1").physics("solid").feature("bndl1").selection().named(f"geom1_{storage_outer_bnd_3d}_bnd")
-        h2storage.component("comp1").physics("solid").create("tl1", "ThinLayer", bnd_3d) #create lining boundary layer at the storage boundary
-        h2storage.component("comp1").physics("solid").feature("tl1").selection().named(f"geom1_{storage_outer_bnd_3d}_bnd")
-        h2storage.component("comp1").physics("solid").prop("ShapeProperty").set("order_displacement", 1)
-    h2storage.component("comp1").physics("solid").feature("lemm1").feature("iss1").set("Sil", ("withsol('sol1', solid.sx)", "withsol('sol1', solid.sxy)", "withsol('sol1', solid.sxz)", "withsol('sol1', solid.sxy)", "withsol('sol1', solid.sy)", "withsol('sol1', solid.syz)", "withsol('sol1', solid.sxz)", "withsol('sol1', solid.syz)", "withsol('sol1', solid.sz)"))
-    h2storage.component("comp1").physics("solid").create("gacc1", "GravityAcceleration", -1)
-    h2storage.component("comp1").physics("solid").feature("bndl1").label("Storage internal pressure load") #Normal load
-    h2storage.component("comp1").physics("solid").feature("bndl1").set("LoadType", "FollowerPressure")
-    h2storage.component("comp1").physics("solid").feature("bndl1").set("FollowerPressure", "-int_pressure")
-    h2storage.component("comp1").physics("solid").feature("tl1").label("Lining_boundary_condition") # Lining layer by boundary condition
-    h2storage.component("comp1").physics("solid").feature("tl1").set("lth", "l_thickness")
-    
+        bnd, dmn = bnd_3d, dmn_3d
+        h2storage_dom = f"geom1_{h2storage_sel_3d}_dom"
+        faraway_bnd_named = f"geom1_{faraway_bnd_sel}_bnd"
+        bottom_bnd_named = f"geom1_{bottom_bnd_3d}"
+        symmetry_bnd_named = f"geom1_{symmetry_bnd_sel}_bnd"
+        storage_bnd_named = f"geom1_{storage_outer_bnd_3d}_bnd"
+    _rock_criterion_feature(lemm1, criterion, dmn)
+    iss1 = lemm1.create("iss1", "InitialStressandStrain", dmn)
+    lemm1.create("act1", "Activation", dmn).selection().named(h2storage_dom)
+    solid.create("roll1", "Roller", bnd).selection().named(faraway_bnd_named)  # Boundary condition for outer edge - no displacement in x-directio
+    solid.create("fix1", "Fixed", bnd).selection().named(bottom_bnd_named)  # Boundary condition for bottom edge - no displacement
+    if model_dimension != "2daxi": # the axis needs no boundary condition
+        solid.create("sym1", "SymmetrySolid", bnd).selection().named(symmetry_bnd_named) # symmetry boundary condition
+    bndl1 = solid.create("bndl1", "BoundaryLoad", bnd) # load boundary condition for storage once hydrogen storage is pressurizated
+    bndl1.selection().named(storage_bnd_named)
+    tl1 = solid.create("tl1", "ThinLayer", bnd) #create lining boundary layer at the storage boundary
+    tl1.selection().named(storage_bnd_named)
+    if model_dimension == "3d":
+        solid.prop("ShapeProperty").set("order_displacement", 1)
+    if model_dimension == "2daxi": # cylindrical components r, phi, z; the shear terms with phi vanish
+        iss1.set("Sil", ("withsol('sol1', solid.sr)", "0", "withsol('sol1', solid.srz)", "0", "withsol('sol1', solid.sphi)", "0", "withsol('sol1', solid.srz)", "0", "withsol('sol1', solid.sz)"))
+    else:
+        iss1.set("Sil", ("withsol('sol1', solid.sx)", "withsol('sol1', solid.sxy)", "withsol('sol1', solid.sxz)", "withsol('sol1', solid.sxy)", "withsol('sol1', solid.sy)", "withsol('sol1', solid.syz)", "withsol('sol1', solid.sxz)", "withsol('sol1', solid.syz)", "withsol('sol1', solid.sz)"))
+    solid.create("gacc1", "GravityAcceleration", -1)
+    bndl1.label("Storage internal pressure load") #Normal load
+    bndl1.set("LoadType", "FollowerPressure")
+    bndl1.set("FollowerPressure", "-int_pressure")
+    tl1.label("Lining_boundary_condition") # Lining layer by boundary condition
+    tl1.set("lth", "l_thickness")
+    if thermal:
+        ##Heat transfer in the rock, heated from the storage wall during injection
+        ht = comp1.physics().create("ht", "HeatTransfer", "geom1")
+        ht.feature("init1").set("Tinit", "T_rock")
+        temp1 = ht.create("temp1", "TemperatureBoundary", bnd)
+        temp1.label("Storage wall temperature during injection")
+        temp1.selection().named(storage_bnd_named)
+        temp1.set("T0", "T_rock+dT_gas")
+        te1 = comp1.multiphysics().create("te1", "ThermalExpansion", dmn) # thermal strain in solid from ht
+        te1.set("Heat_physics", "ht")
+        te1.set("Solid_physics", "solid")
+        te1.set("Tref", "T_rock")
+        solid.prop("StructuralTransientBehavior").set("StructuralTransientBehavior", "Quasistatic")
+
     print("Done")
     ##################################################################################
     #Set up mesh
     ##################################################################################
     print("Setting up mesh...", end=" ")
-    if model_dimension == "2d":
-        h2storage.component("comp1").mesh("mesh1").create("edg1", "Edge")
-        h2storage.component("comp1").mesh("mesh1").feature("edg1").selection().named(f"geom1_{storage_outer_bnd_2d}_bnd")
-        h2storage.component("comp1").mesh("mesh1").feature("edg1").create("dis1", "Distribution")
-        h2storage.component("comp1").mesh("mesh1").feature("edg1").feature("dis1").set("numelem", "num_elem")
-        h2storage.component("comp1").mesh("mesh1").create("ftri1", "FreeTri")
-        h2storage.component("comp1").mesh("mesh1").feature("ftri1").create("size1", "Size")
-        h2storage.component("comp1").mesh("mesh1").feature("ftri1").feature("size1").set("custom", "on")
-        h2storage.component("comp1").mesh("mesh1").feature("ftri1").feature("size1").set("hmaxactive", "on")
-        h2storage.component("comp1").mesh("mesh1").feature("ftri1").feature("size1").set("hmax", "max_elem")
-        h2storage.component("comp1").mesh("mesh1").feature("ftri1").feature("size1").set("hgradactive", "on")
-        h2storage.component("comp1").mesh("mesh1").feature("ftri1").feature("size1").set("hgrad", "max_growth")
-        h2storage.component("comp1").mesh("mesh1").run()
+    trace.begin("mesh")
+    if planar:
+        edg1 = mesh1.create("edg1", "Edge")
+        edg1.selection().named(f"geom1_{storage_outer_bnd_2d}_bnd")
+        edg1.create("dis1", "Distribution").set("numelem", "num_elem")
+        ftri1 = mesh1.create("ftri1", "FreeTri")
+        size1 = ftri1.create("size1", "Size")
+        size1.set("custom", "on")
+        size1.set("hmaxactive", "on")
+        size1.set("hmax", "max_elem")
+        size1.set("hgradactive", "on")
+        size1.set("hgrad", "max_growth")
+        if caverns > 1: # fine only around the pillars; max_elem and the growth rate elsewhere
+            size2 = ftri1.create("size2", "Size")
+            size2.selection().geom("geom1", dmn_2d)
+            size2.selection().named(f"geom1_{roi_2d}")
+            size2.set("custom", "on")
+            size2.set("hmaxactive", "on")
+            size2.set("hmax", "pillar_width/pillar_elem")
+        mesh1.run()
+        count = mesh1.getNumElem()
+        trace.counts["elements"] = int(count) if isinstance(count, numbers.Integral) else None
     elif model_dimension == "3d":
-        h2storage.component("comp1").mesh("mesh1").create("edg1", "Edge");
-        h2storage.component("comp1").mesh("mesh1").feature("edg1").selection().named(f"geom1_{h2storage_sel_3d}_edg")
-        h2storage.component("comp1").mesh("mesh1").feature("edg1").create("dis1", "Distribution")
-        h2storage.component("comp1").mesh("mesh1").feature("edg1").feature("dis1").set("numelem", "num_elem")
-        h2storage.component("comp1").mesh("mesh1").create("ftet1", "FreeTet")
-        h2storage.component("comp1").mesh("mesh1").feature("ftet1").selection().geom("geom1", dmn_3d)
-        h2storage.component("comp1").mesh("mesh1").feature("ftet1").selection().named(f"geom1_{h2storage_sel_3d}_dom")
-        h2storage.component("comp1").mesh("mesh1").feature("ftet1").create("size1", "Size")
-        h2storage.component("comp1").mesh("mesh1").feature("ftet1").feature("size1").set("custom", "on")
-        h2storage.component("comp1").mesh("mesh1").feature("ftet1").feature("size1").set("hgradactive", "on")
-        h2storage.component("comp1").mesh("mesh1").feature("ftet1").feature("size1").set("hgrad", "max_growth")
-        h2storage.component("comp1").mesh("mesh1").create("ftet2", "FreeTet")
-        h2storage.component("comp1").mesh("mesh1").feature("ftet2").create("size1", "Size")
-        h2storage.component("comp1").mesh("mesh1").feature("ftet2").feature("size1").set("custom", "on");
-        h2storage.component("comp1").mesh("mesh1").feature("ftet2").feature("size1").set("hmaxactive", "on")
-        h2storage.component("comp1").mesh("mesh1").feature("ftet2").feature("size1").set("hmax", "max_elem")
-        h2storage.component("comp1").mesh("mesh1").feature("ftet2").feature("size1").set("hgradactive", "on")
-        h2storage.component("comp1").mesh("mesh1").feature("ftet2").feature("size1").set("hgrad", "max_growth")
+        edg1 = mesh1.create("edg1", "Edge")
+        edg1.selection().named(f"geom1_{h2storage_sel_3d}_edg")
+        edg1.create("dis1", "Distribution").set("numelem", "num_elem")
+        ftet1 = mesh1.create("ftet1", "FreeTet")
+        ftet1.selection().geom("geom1", dmn_3d)
+        ftet1.selection().named(f"geom1_{h2storage_sel_3d}_dom")
+        size1 = ftet1.create("size1", "Size")
+        size1.set("custom", "on")
+        size1.set("hgradactive", "on")
+        size1.set("hgrad", "max_growth")
+        size1 = mesh1.create("ftet2", "FreeTet").create("size1", "Size")
+        size1.set("custom", "on")
+        size1.set("hmaxactive", "on")
+        size1.set("hmax", "max_elem")
+        size1.set("hgradactive", "on")
+        size1.set("hgrad", "max_growth")
     print("Done")
     ##################################################################################
     #Create study
     ##################################################################################
     ##Initial condition before storage excavation
     print("Setting up study...", end=" ")
-    h2storage.study().create("std1")
-    h2storage.study("std1").create("stat", "Stationary")
-    h2storage.study("std1").label("Study: Before h2storage excavation")
-    h2storage.study("std1").feature("stat").setSolveFor("/physics/solid", True)
-    h2storage.study("std1").feature("stat").set("useadvanceddisable", "on")
-    h2storage.study("std1").feature("stat").set("disabledphysics", ("solid/lemm1/iss1", "solid/lemm1/act1", "solid/bndl1", "solid/tl1"))
+    trace.begin("studies")
+    std1 = h2storage.study().create("std1")
+    std1.label("Study: Before h2storage excavation")
+    stat = std1.create("stat", "Stationary")
+    stat.setSolveFor("/physics/solid", True)
+    stat.set("useadvanceddisable", "on")
+    stat.set("disabledphysics", ("solid/lemm1/iss1", "solid/lemm1/act1", "solid/bndl1", "solid/tl1"))
+    if thermal: # T stays at its initial value T_rock, so there is no thermal strain
+        stat.setSolveFor("/physics/ht", False)
 
     ##After storage excavation
-    h2storage.study().create("std2")
-    h2storage.study("std2").create("stat", "Stationary")
-    h2storage.study("std2").label("Study: After h2storage excavation")
-    h2storage.study("std2").feature("stat").setSolveFor("/physics/solid", True)
-    if model_dimension == "2d":
-        pymodel.save('2d_h2storage_model')
-    elif model_dimension == "3d":
-        pymodel.save('3d_h2storage_model')
+    std2 = h2storage.study().create("std2")
+    std2.label("Study: After h2storage excavation")
+    stat = std2.create("stat", "Stationary")
+    stat.setSolveFor("/physics/solid", True)
+    stat.set("useinitsol", "on") # start from the in-situ solution sol1 of std1
+    stat.set("initmethod", "sol")
+    stat.set("initstudy", "std1")
+    stat.set("solnum", "auto")
+    if thermal:
+        stat.setSolveFor("/physics/ht", False)
+
+        ##Segregated thermo-mechanics: the coupling is one way (T -> thermal strain),
+        ##so heat transfer is solved on its own first and solid then reads T from it
+        std3 = h2storage.study().create("std3")
+        std3.label("Study: Wall heating during injection")
+        time = std3.create("time", "Transient")
+        time.setSolveFor("/physics/solid", False)
+        time.setSolveFor("/physics/ht", True)
+        time.set("tunit", "h")
+        time.set("tlist", "range(0,t_injection/12,t_injection)")
+
+        std4 = h2storage.study().create("std4")
+        std4.label("Study: Thermal stress during injection")
+        time = std4.create("time", "Transient")
+        time.setSolveFor("/physics/solid", True)
+        time.setSolveFor("/physics/ht", False)
+        time.set("tunit", "h")
+        time.set("tlist", "range(0,t_injection/12,t_injection)")
+        time.set("useinitsol", "on") # start from the excavated state of std2
+        time.set("initmethod", "sol")
+        time.set("initstudy", "std2")
+        time.set("solnum", "auto")
+        time.set("usesol", "on") # temperature history from std3
+        time.set("notsolmethod", "sol")
+        time.set("notstudy", "std3")
+        time.set("notsolnum", "auto")
+    if save:
+        trace.begin("save")
+        pymodel.save(f'{model_dimension}_thermal_h2storage_model' if thermal else f'{model_dimension}_h2storage_model')
+    trace.end()
     print("Done")
-    
-h2_storage_model = create_h2storagemodel("mohr-coulomb", "3d")
+    return H2StorageModel(pymodel, criterion, model_dimension, p, trace=trace, java=h2storage,
+                          thermal=thermal, caverns=caverns)
+
+if __name__ == "__main__":
+    h2_storage_model = create_h2storagemodel("mohr-coulomb", "3d")
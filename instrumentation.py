@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Resource measurements and stage traces for model builds and solves.
+"""
+
+import csv
+import json
+import logging
+import os
+import resource
+import threading
+import time
+
+
+def process_memory():
+    """
+    Resident memory [MB] of this process and its children, which include a
+    COMSOL server started by mph. Without psutil this falls back to the peak
+    resident memory of this process alone.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+    process = psutil.Process(os.getpid())
+    total = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total/2**20
+
+
+class MemorySampler:
+    """Context manager recording the peak of process_memory() while it is open."""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, process_memory())
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self.peak = process_memory()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, process_memory())
+
+
+def python_memory():
+    """Resident memory [MB] of this Python process."""
+    try:
+        import psutil
+    except ImportError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+    return psutil.Process(os.getpid()).memory_info().rss/2**20
+
+
+def server_memory():
+    """Resident memory [MB] of child processes (a local COMSOL server), or None without psutil."""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    total = 0
+    for child in psutil.Process(os.getpid()).children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total/2**20
+
+#############################
+# Stage trace
+#############################
+class CountingProxy:
+    """Wrap a model's ``java`` object and count every call made through it."""
+
+    __slots__ = ("_target", "_trace")
+
+    def __init__(self, target, trace):
+        self._target = target
+        self._trace = trace
+
+    def __getattr__(self, name):
+        method = getattr(self._target, name)
+        trace = self._trace
+
+        def call(*args):
+            trace.calls += 1
+            result = method(*args)
+            if _is_node(result):
+                return CountingProxy(result, trace)
+            return result
+        return call
+
+
+def _is_node(value):
+    name = type(value).__name__
+    return name.startswith("com.comsol") or name == "_RecordingProxy"
+
+
+def logging_hook(logger, level=logging.INFO):
+    """Hook that logs each finished stage record to ``logger``."""
+    def hook(record):
+        logger.log(level, "%(stage)s: %(wall_s).3f s, %(calls)d calls", record)
+    return hook
+
+
+class Trace:
+    """
+    Timing, call-count and memory records for the stages of a model's life.
+
+    begin(stage) closes the open stage and opens the next one, end() closes
+    it. Every closed stage appends a record with wall time, number of calls
+    through the wrapped java object, Python and server memory and any counts
+    stored in ``trace.counts`` meanwhile; ``hook`` is called with each record.
+    With ``dofs`` solves also count degrees of freedom, which transfers the
+    solution vector from the server.
+    """
+
+    def __init__(self, hook=None, dofs=False):
+        self.hook = hook
+        self.dofs = dofs
+        self.records = []
+        self.calls = 0
+        self.counts = {}
+        self._open = None
+
+    def wrap(self, java):
+        return CountingProxy(java, self)
+
+    def begin(self, stage):
+        self.end()
+        self.counts = {}
+        self._open = (stage, time.perf_counter(), self.calls)
+
+    def end(self):
+        if self._open is None:
+            return
+        stage, start, calls = self._open
+        self._open = None
+        record = {"stage": stage, "wall_s": time.perf_counter() - start,
+                  "calls": self.calls - calls, "python_mb": python_memory(),
+                  "server_mb": server_memory()}
+        record.update(self.counts)
+        self.records.append(record)
+        if self.hook is not None:
+            self.hook(record)
+
+    def total(self, field="wall_s"):
+        return sum(record.get(field) or 0 for record in self.records)
+
+    def to_json(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.records, file, indent=1)
+
+    def to_csv(self, path):
+        columns = []
+        for record in self.records:
+            columns.extend(key for key in record if key not in columns)
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(self.records)
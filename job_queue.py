@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Asynchronous job queue with a persistent SQLite job store.
+
+Every scenario is a job in the store, keyed by its criterion, dimension,
+solver profiles and complete parameter set. JobQueue hands pending jobs to COMSOL clients in
+batches that share geometry, mesh and in-situ state (see scenarios.plan),
+times out and retries failing batches and records every finished scenario
+in the store as soon as it comes back. An interrupted sweep (crash,
+pre-emption, Ctrl+C) is resumed by running it again on the same store:
+finished scenarios are skipped and jobs left "running" are queued again.
+
+    python scenarios.py site_a.yaml --store site_a.sqlite --workers 4 --timeout 7200
+"""
+
+import asyncio
+import csv
+import hashlib
+import json
+import sqlite3
+import time
+
+import hydrogen_storage as hs
+import solver_profiles
+from client_pool import ClientPool, cores_per_client
+from parameter_sweep import result_columns, solve_group
+from scenarios import deduplicate, plan
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    position INTEGER UNIQUE,
+    name TEXT,
+    criterion TEXT,
+    dimension TEXT,
+    parameters TEXT,
+    solver TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    updated REAL
+)
+"""
+
+
+def job_key(criterion, dimension, parameters, solver=None):
+    """Key of a scenario in the job store, independent of how its parameters were given."""
+    p = hs.scenario_parameters(parameters)
+    key = [criterion, dimension, p]
+    profiles = {study: profile for study, profile in solver_profiles.normalize(solver).items()
+                if profile != "default"}
+    if profiles:  # keys of stores written before solver profiles stay valid
+        key.append(profiles)
+    text = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:20]
+
+#############################
+# Job store
+#############################
+class JobStore:
+    """
+    Jobs and their results in an SQLite file. A job is pending, running,
+    done or failed (out of retries); ``attempts`` counts failed attempts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(jobs)")]
+        if "solver" not in columns:
+            self.connection.execute("ALTER TABLE jobs ADD COLUMN solver TEXT")
+        self.connection.commit()
+
+    def add(self, scenarios, names=None):
+        """
+        Add scenarios as returned by scenarios.validate(); jobs already in the
+        store keep their state. Returns the number of new jobs.
+        """
+        added = 0
+        with self.connection:
+            position = self.connection.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM jobs").fetchone()[0]
+            for i, scenario in enumerate(scenarios):
+                name = "; ".join(names[i]) if names is not None else scenario["name"]
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO jobs (key, position, name, criterion, dimension,"
+                    " parameters, solver, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_key(scenario["criterion"], scenario["dimension"], scenario["parameters"],
+                             scenario.get("solver")),
+                     position, name, scenario["criterion"], scenario["dimension"],
+                     json.dumps(scenario["parameters"]), json.dumps(scenario.get("solver")),
+                     time.time()))
+                if cursor.rowcount:
+                    added += 1
+                    position += 1
+        return added
+
+    def reset_running(self):
+        """Queue jobs again that were running when the previous run stopped."""
+        with self.connection:
+            return self.connection.execute(
+                "UPDATE jobs SET status = 'pending' WHERE status = 'running'").rowcount
+
+    def pending(self):
+        rows = self.connection.execute(
+            "SELECT * FROM jobs WHERE status = 'pending' ORDER BY position")
+        return [{"key": row["key"], "position": row["position"], "name": row["name"],
+                 "criterion": row["criterion"], "dimension": row["dimension"],
+                 "parameters": json.loads(row["parameters"]),
+                 "solver": solver_profiles.normalize(json.loads(row["solver"] or "null"))}
+                for row in rows]
+
+    def counts(self):
+        rows = self.connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return dict(rows.fetchall())
+
+    def mark_running(self, keys):
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE jobs SET status = 'running', updated = ? WHERE key = ?",
+                [(time.time(), key) for key in keys])
+
+    def finish(self, key, row):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = 'done', error = NULL, result = ?, updated = ? WHERE key = ?",
+                (json.dumps(row), time.time(), key))
+
+    def fail(self, key, error, retries, row=None):
+        """Record a failed attempt; the job is queued again until ``retries`` are used up."""
+        with self.connection:
+            attempts = self.connection.execute(
+                "SELECT attempts FROM jobs WHERE key = ?", (key,)).fetchone()[0] + 1
+            status = "pending" if attempts <= retries else "failed"
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, error = ?, result = ?, updated = ?"
+                " WHERE key = ?",
+                (status, attempts, error, json.dumps(row) if row else None, time.time(), key))
+        return status
+
+    def results(self):
+        """Result rows of all finished and failed jobs in scenario order."""
+        rows = []
+        for job in self.connection.execute(
+                "SELECT * FROM jobs WHERE status IN ('done', 'failed') ORDER BY position"):
+            row = json.loads(job["result"]) if job["result"] else {
+                "index": job["position"], "criterion": job["criterion"],
+                "dimension": job["dimension"],
+                **hs.scenario_parameters(json.loads(job["parameters"]))}
+            row.update(name=job["name"], status=job["status"], attempts=job["attempts"])
+            if job["status"] == "failed":
+                row["error"] = job["error"]
+            rows.append(row)
+        return rows
+
+    def export(self, path, outputs=None):
+        """Write results() to the CSV file ``path``."""
+        columns = ["name"] + result_columns(outputs) + ["attempts"]
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(self.results())
+
+    def close(self):
+        self.connection.close()
+
+#############################
+# Scheduler
+#############################
+class JobQueue:
+    """
+    Run the pending jobs of ``store`` on ``workers`` COMSOL clients.
+
+    A batch holds up to ``batch`` scenarios of one geometry/mesh group and is
+    given ``timeout`` seconds per scenario. If it times out or its client
+    dies, the client is killed and restarted and the unfinished jobs of the
+    batch are queued again one by one, so a single bad scenario cannot take
+    its neighbours down twice. A job is given up after ``retries`` failed
+    attempts.
+    """
+
+    def __init__(self, store, workers=1, cores=None, retries=2, timeout=None, batch=8,
+                 outputs=None, backend_factory=None, fields_directory=None, fields=None,
+                 template_directory=None, index=None, format="npz"):
+        self.store = store
+        self.workers = workers
+        self.cores = cores or cores_per_client(workers)
+        self.retries = retries
+        self.timeout = timeout
+        self.batch = batch
+        self.outputs = outputs
+        self.backend_factory = backend_factory
+        self.fields_directory = fields_directory
+        self.fields = fields
+        self.template_directory = template_directory
+        self.index = index
+        self.format = format
+        self.solved = 0
+        self.start = None
+
+    def batches(self, jobs):
+        """(criterion, dimension, jobs) batches in reuse order."""
+        batches = []
+        for criterion, dimension, group in plan(jobs, self.workers):
+            group = [jobs[item[0]] for item in group]
+            for first in range(0, len(group), self.batch):
+                batches.append((criterion, dimension, group[first:first + self.batch]))
+        return batches
+
+    def throughput(self):
+        """Scenarios solved per hour in this run."""
+        elapsed = time.perf_counter() - self.start
+        return 3600*self.solved/elapsed if elapsed > 0 else 0.0
+
+    def _progress(self, row, status):
+        counts = self.store.counts()
+        finished = counts.get("done", 0) + counts.get("failed", 0)
+        rate = self.throughput()
+        remaining = sum(counts.values()) - finished
+        eta = f", {remaining/rate:.1f} h left" if rate and remaining else ""
+        print(f"Scenario {row['index']} {status} ({finished}/{sum(counts.values())}, "
+              f"{rate:.1f} scenarios/h{eta})")
+
+    def _failed(self, queue, criterion, dimension, job, error, row=None):
+        status = self.store.fail(job["key"], error, self.retries, row)
+        if status == "pending":
+            print(f"Scenario {job['position']} failed ({error}), queued again")
+            queue.put_nowait((criterion, dimension, [job]))
+        else:
+            self._progress({"index": job["position"]}, f"failed ({error})")
+
+    async def _dispatch(self, pool, queue, criterion, dimension, jobs):
+        """Solve one batch on ``pool``; returns the pool, or None if it had to be killed."""
+        self.store.mark_running([job["key"] for job in jobs])
+        group = [(job["position"], job["parameters"], job["solver"]) for job in jobs]
+        timeout = None if self.timeout is None else self.timeout*len(jobs)
+        try:
+            if not pool.started: # server start-up does not count against the timeout
+                await asyncio.to_thread(pool.start)
+            future = pool.submit(solve_group, group, criterion, dimension, self.outputs,
+                                 self.fields_directory, self.fields, self.template_directory, self.format)
+            rows = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except Exception as error:
+            pool.terminate()
+            if isinstance(error, asyncio.TimeoutError):
+                error = f"timed out after {timeout:g} s"
+            else:
+                error = f"client failed: {type(error).__name__}: {error}"
+            for job in jobs:
+                self._failed(queue, criterion, dimension, job, error)
+            return None
+        for job, row in zip(jobs, rows):
+            if row["status"] == "done":
+                self.store.finish(job["key"], row)
+                if self.index is not None:
+                    self.index.add_result({"name": job["name"], **row}, self.fields_directory)
+                self.solved += 1
+                self._progress(row, "done")
+            else:
+                self._failed(queue, criterion, dimension, job, row["error"], row)
+        return pool
+
+    async def _client(self, queue):
+        pool = None
+        busy = False
+        try:
+            while True:
+                criterion, dimension, jobs = await queue.get()
+                busy = True
+                try:
+                    if pool is None:
+                        pool = ClientPool(1, self.cores, self.backend_factory)
+                    pool = await self._dispatch(pool, queue, criterion, dimension, jobs)
+                finally:
+                    queue.task_done()
+                busy = False
+        finally:
+            if pool is not None:
+                if busy:
+                    pool.terminate()
+                else:
+                    pool.close()
+
+    async def run(self):
+        """Run until no job is pending; returns the job counts by status."""
+        self.start = time.perf_counter()
+        self.solved = 0
+        if self.store.reset_running():
+            print("Resuming jobs left running by the previous run")
+        jobs = self.store.pending()
+        print(f"{len(jobs)} jobs pending, {self.store.counts().get('done', 0)} done")
+        queue = asyncio.Queue()
+        for batch in self.batches(jobs):
+            queue.put_nowait(batch)
+        clients = [asyncio.create_task(self._client(queue))
+                   for _ in range(min(self.workers, queue.qsize()))]
+        try:
+            await queue.join()
+        finally:
+            for client in clients:
+                client.cancel()
+            await asyncio.gather(*clients, return_exceptions=True)
+        print(f"{self.solved} scenarios solved, {self.throughput():.1f} scenarios/h")
+        return self.store.counts()
+
+
+def run_queue(scenarios, store, output=None, workers=1, cores=None, retries=2, timeout=None,
+              batch=8, outputs=None, backend_factory=None, fields_directory=None, fields=None,
+              template_directory=None, index=None, format="npz"):
+    """
+    Add validated scenarios (see scenarios.py) to the job store file ``store``,
+    run every pending job and write all results to the CSV file ``output``.
+    Finished scenarios are also added to the result_index.ResultIndex ``index``.
+    """
+    unique, names = deduplicate(scenarios)
+    jobs = JobStore(store)
+    try:
+        print(f"{jobs.add(unique, names)} new jobs in {store}")
+        queue = JobQueue(jobs, workers, cores, retries, timeout, batch, outputs,
+                         backend_factory, fields_directory, fields, template_directory, index, format)
+        try:
+            counts = asyncio.run(queue.run())
+        except KeyboardInterrupt:
+            print(f"Interrupted, run again with {store} to resume")
+            raise
+        if output is not None:
+            jobs.export(output, outputs)
+        return counts
+    finally:
+        jobs.close()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Mesh convergence study driven by num_elem, max_elem and max_growth.
+
+Starting from the handle's mesh parameters, or ``coarsen`` levels below
+them, every level refines the mesh by ``ratio``: more elements along the
+storage edge, a smaller maximum element size and a growth rate closer to 1.
+Each level is meshed and solved, and the peak boundary quantities are
+compared with the previous level. Refinement stops once they change by less
+than ``tolerance``; the coarser mesh of that pair is the cheapest one that
+meets the tolerance, and can be coarser than the handle's own mesh. It is
+returned as scenario parameters for the sweep:
+
+    rows, mesh = mesh_convergence(handle, coarsen=2)
+    run_sweep(scenarios, "hoek-brown", "2d", mesh=mesh)
+"""
+
+import csv
+import time
+
+import numpy as np
+
+import extraction
+from instrumentation import MemorySampler
+
+# Column -> (selection, expression) whose peak absolute value is tracked
+DEFAULT_QUANTITIES = {
+    "peak_mises": ("storage_outer_bnd", "solid.mises"),
+    "peak_disp": ("storage_outer_bnd", "solid.disp"),
+}
+
+
+def refine(mesh, ratio):
+    """Mesh parameters refined by ``ratio``, or coarsened if it is below 1."""
+    return {
+        "number_of_elements": max(1, int(round(mesh["number_of_elements"]*ratio))),
+        "max_element_size": mesh["max_element_size"]/ratio,
+        "max_element_growth_rate": 1 + (mesh["max_element_growth_rate"] - 1)/ratio,
+    }
+
+
+def mesh_convergence(handle, levels=5, ratio=1.5, tolerance=0.02, quantities=None, start=None, coarsen=0):
+    """
+    Refine and solve until the quantities converge; returns (rows, mesh)
+    where ``mesh`` holds the chosen mesh parameters (scenario parameters,
+    see parameter_sweep.run_sweep), or None if the study did not converge
+    within ``levels`` levels. The first level is the mesh ``start`` (default
+    the handle's) coarsened ``coarsen`` times by ``ratio``.
+    """
+    quantities = DEFAULT_QUANTITIES if quantities is None else quantities
+    fields = {}
+    for selection, expression in quantities.values():
+        fields.setdefault(selection, []).append(expression)
+    start = handle.parameters if start is None else start
+    mesh = {name: start[name] for name in ("number_of_elements", "max_element_size", "max_element_growth_rate")}
+    for _ in range(coarsen):
+        mesh = refine(mesh, 1/ratio)
+    rows = []
+    for level in range(levels):
+        if level:
+            mesh = refine(mesh, ratio)
+        print(f"Mesh level {level}: {mesh}")
+        with MemorySampler() as memory:
+            start = time.perf_counter()
+            if not handle.update(solve=False, **mesh):
+                handle.java.component("comp1").mesh("mesh1").run()
+            mesh_time = time.perf_counter() - start
+            start = time.perf_counter()
+            handle.solve()
+            solve_time = time.perf_counter() - start
+        arrays = extraction.evaluate_fields(handle, fields)
+        row = {"level": level, **mesh,
+               "elements": handle.element_count(),
+               "dofs": handle.degrees_of_freedom(), "mesh_s": mesh_time,
+               "solve_s": solve_time, "peak_memory_mb": memory.peak}
+        for column, (selection, expression) in quantities.items():
+            row[column] = float(np.max(np.abs(arrays[f"{selection}/{expression}"])))
+        if rows:
+            row["change"] = max(abs(row[c] - rows[-1][c])/max(abs(row[c]), 1e-30)
+                                for c in quantities)
+        rows.append(row)
+        if row.get("change", np.inf) < tolerance:
+            chosen = rows[-2]
+            return rows, {name: chosen[name] for name in mesh}
+    return rows, None
+
+
+def write_report(rows, path):
+    columns = list(rows[-1]) if "change" in rows[-1] else list(rows[0])
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
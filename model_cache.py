@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed on-disk cache of built and solved hydrogen storage models.
+
+Models are stored as ``<key><suffix>`` in one directory, where the key is a
+hash of the criterion, model dimension, all scenario parameters, the
+thermal and multi-cavern modes, whether the model is solved and the version
+of the builder code. Files are written
+atomically, so the directory can be shared on scratch storage. Access time
+is tracked through the file modification time and the least recently used
+models are evicted once the directory grows past ``max_bytes``.
+
+Meshed templates share the directory. Only the geometry and mesh parameters
+(par1 without int_pressure, par4) change geometry and mesh, so a template
+is keyed on those alone and loaded for every material, load and criterion
+variant; the criterion is switched in the loaded model with
+H2StorageModel.set_criterion().
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import hydrogen_storage as hs
+
+
+def code_version():
+    """Hash of the builder source, so cached models are dropped when it changes."""
+    with open(hs.__file__, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:16]
+
+
+# Criterion templates are built with; set_criterion() switches it after loading
+TEMPLATE_CRITERION = "hoek-brown"
+
+
+def template_parameters(parameters=None):
+    """The geometry and mesh parameters of a scenario, the rest left at defaults."""
+    p = hs.scenario_parameters(parameters)
+    return {name: p[name] for name in sorted(hs.GEOMETRY_PARAMETERS | hs.MESH_PARAMETERS)}
+
+
+def template_key(model_dimension, parameters=None, thermal=False, caverns=1):
+    content = {"template": True, "model_dimension": model_dimension, "thermal": thermal,
+               "caverns": caverns, "parameters": template_parameters(parameters),
+               "code_version": code_version()}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def cache_key(criterion, model_dimension, parameters=None, solved=False, thermal=False, caverns=1):
+    p = hs.scenario_parameters(parameters)
+    content = {"criterion": criterion, "model_dimension": model_dimension, "thermal": thermal,
+               "caverns": caverns, "parameters": p, "solved": solved, "code_version": code_version()}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+class ModelCache:
+    """Directory of cached models with a size cap and LRU eviction."""
+
+    def __init__(self, directory, max_bytes=20*2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, suffix=".mph"):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key, suffix=".mph"):
+        """Path of the cached model, or None; marks the entry as recently used."""
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, model, suffix=".mph"):
+        """Save ``model`` (an mph or recorded model) under ``key``."""
+        path = self.path(key, suffix)
+        partial = os.path.join(self.directory, f"{key}.{os.getpid()}.partial{suffix}")
+        model.save(partial)
+        os.replace(partial, path)
+        self.evict(keep=path)
+        return path
+
+    def entries(self):
+        """(last use, size, path) of every cached model, oldest first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and ".partial" not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """Remove least recently used models until the cache fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def load_or_build(self, criterion, model_dimension, backend, parameters=None, solve=False,
+                      thermal=False, caverns=1):
+        """
+        Return an H2StorageModel for the scenario, loading it from the cache
+        when an identical model was built (and solved, if ``solve``) before.
+        """
+        suffix = backend.model_suffix
+        p = hs.scenario_parameters(parameters)
+        solved_key = cache_key(criterion, model_dimension, parameters, True, thermal, caverns)
+        built_key = cache_key(criterion, model_dimension, parameters, False, thermal, caverns)
+        for key in ((solved_key, built_key) if solve else (built_key, solved_key)):
+            path = self.get(key, suffix)
+            if path is not None:
+                start = time.perf_counter()
+                handle = hs.H2StorageModel(backend.load(path), criterion, model_dimension, p,
+                                           thermal=thermal, caverns=caverns)
+                print(f"Loaded cached model {key[:12]} in {time.perf_counter() - start:.1f} s")
+                if solve and key == built_key:
+                    handle.solve()
+                    self.put(solved_key, handle.model, suffix)
+                return handle
+        handle = hs.create_h2storagemodel(criterion, model_dimension, backend=backend,
+                                          parameters=parameters, save=False, thermal=thermal,
+                                          caverns=caverns)
+        if solve:
+            handle.solve()
+        self.put(solved_key if solve else built_key, handle.model, suffix)
+        return handle
+
+    def load_template(self, criterion, model_dimension, backend, parameters=None, thermal=False,
+                      caverns=1):
+        """
+        Return an unsolved H2StorageModel for the scenario, loaded from the
+        meshed template of its geometry and mesh parameters (built and cached
+        first if there is none) and switched to its criterion and parameters.
+        """
+        suffix = backend.model_suffix
+        key = template_key(model_dimension, parameters, thermal, caverns)
+        shape = template_parameters(parameters)
+        path = self.get(key, suffix)
+        if path is None:
+            handle = hs.create_h2storagemodel(TEMPLATE_CRITERION, model_dimension, backend=backend,
+                                              parameters=shape, save=False, thermal=thermal,
+                                              caverns=caverns)
+            if model_dimension == "3d":  # the 3D builder leaves meshing to the first solve
+                handle.java.component("comp1").mesh("mesh1").run()
+            self.put(key, handle.model, suffix)
+        else:
+            start = time.perf_counter()
+            handle = hs.H2StorageModel(backend.load(path), TEMPLATE_CRITERION, model_dimension,
+                                       hs.scenario_parameters(shape), thermal=thermal, caverns=caverns)
+            print(f"Loaded mesh template {key[:12]} in {time.perf_counter() - start:.1f} s")
+        handle.set_criterion(criterion)
+        handle.update(solve=False, **(parameters or {}))
+        return handle
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel parameter sweeps of the hydrogen storage model.
+
+Scenarios are dicts of the parameters returned by
+hydrogen_storage.default_parameters(), e.g. ``{"GSI": 60, "storage_depth": -150}``;
+anything not given keeps its default. grid() and latin_hypercube() generate
+them, run_sweep() builds and solves every scenario on a ClientPool and streams
+one row per scenario into a CSV table as the results come in.
+"""
+
+import csv
+import itertools
+import time
+from concurrent.futures import as_completed
+
+import numpy as np
+
+import extraction
+import hydrogen_storage as hs
+import solver_profiles
+from client_pool import ClientPool, cores_per_client
+from model_cache import ModelCache
+from staged_solve import StagedSolver, group_by_in_situ
+
+# Scalar results per scenario: column name -> (expression, reduction over the
+# evaluation points of the excavation study[, result selection]); placeholders
+# such as {radius} are filled in by extraction.expression().
+DEFAULT_OUTPUTS = {
+    "max_mises": ("solid.mises", "max"),
+    "max_disp": ("solid.disp", "max"),
+    "wall_convergence": (extraction.WALL_CONVERGENCE, "max", "storage_outer_bnd"),
+    "lining_stress": (extraction.LINING_STRESS, "max", "storage_outer_bnd"),
+    "plastic_zone": (extraction.PLASTIC_ZONE, "max"),
+}
+
+INTEGER_PARAMETERS = {"number_of_elements"}
+
+#############################
+# Scenario generation
+#############################
+def grid(**values):
+    """Full factorial grid, e.g. grid(GSI=[50, 75], storage_depth=[-100, -200])."""
+    _check_names(values)
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def latin_hypercube(bounds, samples, seed=None):
+    """
+    Latin hypercube sample of ``samples`` scenarios within ``bounds``,
+    e.g. latin_hypercube({"GSI": (40, 90), "internal_pressure": (20, 200)}, 100).
+    """
+    _check_names(bounds)
+    rng = np.random.default_rng(seed)
+    scenarios = [{} for _ in range(samples)]
+    for name, (low, high) in bounds.items():
+        strata = (rng.permutation(samples) + rng.random(samples)) / samples
+        values = low + strata*(high - low)
+        if name in INTEGER_PARAMETERS:
+            values = np.rint(values).astype(int)
+        for scenario, value in zip(scenarios, values.tolist()):
+            scenario[name] = value
+    return scenarios
+
+
+def _check_names(names):
+    unknown = set(names) - set(hs.default_parameters())
+    if unknown:
+        raise ValueError(f"Unknown scenario parameters: {', '.join(sorted(unknown))}")
+
+#############################
+# Running
+#############################
+def solve_group(backend, group, criterion, dimension, outputs=None, fields_directory=None,
+                fields=None, template_directory=None, format="npz"):
+    """
+    Build one model for a group of (index, scenario) pairs sharing the same
+    in-situ state, solve std1 once and std2 per scenario; returns table rows.
+    A third item (index, scenario, solver) sets the scenario's solver
+    profiles, which are recorded in the solver_<study> columns.
+    With ``fields_directory`` the result fields of each scenario are written
+    there in ``format`` (see extraction.py), and the model is removed from the client at
+    the end of the group. With ``template_directory`` the model is loaded
+    from a cached meshed template instead of being built (see model_cache.py).
+    """
+    outputs = DEFAULT_OUTPUTS if outputs is None else outputs
+    solver = None
+    rows = []
+    for index, scenario, *profiles in group:
+        row = {"index": index, "criterion": criterion, "dimension": dimension}
+        row.update(hs.scenario_parameters(scenario))
+        try:
+            profiles = solver_profiles.normalize(*profiles[:1])
+            row.update({f"solver_{study}": profiles[study] for study in solver_profiles.SCENARIO_STUDIES})
+            start = time.perf_counter()
+            if solver is None and template_directory is not None:
+                solver = StagedSolver(ModelCache(template_directory).load_template(
+                    criterion, dimension, backend, scenario))
+            elif solver is None:
+                solver = StagedSolver(hs.create_h2storagemodel(
+                    criterion, dimension, backend=backend, parameters=scenario, save=False))
+            row["build_s"] = time.perf_counter() - start
+            start = time.perf_counter()
+            model = solver.solve(scenario, profiles).model
+            row["solve_s"] = time.perf_counter() - start
+            if hasattr(model, "evaluate"):  # recorded models hold no solution
+                for column, (expression, reduction, *selection) in outputs.items():
+                    # datasets of sol2 itself; datasets()[-1] may be an extraction dataset
+                    dataset = extraction.solution_dataset(solver.handle, *selection[:1])
+                    expression = extraction.expression(expression, dimension)
+                    values = np.asarray(model.evaluate(expression, dataset=dataset))
+                    row[column] = float(getattr(np, reduction)(values))
+                if fields_directory is not None:
+                    extraction.extract(solver.handle, fields_directory, f"scenario_{index:06d}", fields, format)
+            row["status"] = "done"
+        except Exception as error:
+            row["status"] = "failed"
+            row["error"] = f"{type(error).__name__}: {error}"
+            if solver is not None:
+                solver.in_situ = None  # re-run std1 for the next scenario
+        rows.append(row)
+    if solver is not None:
+        backend.remove(solver.handle.model)
+    return rows
+
+
+def solve_scenario(backend, index, scenario, criterion, dimension, outputs=None):
+    """Build, solve and evaluate one scenario on ``backend``; returns a table row."""
+    return solve_group(backend, [(index, scenario)], criterion, dimension, outputs)[0]
+
+
+def iter_sweep(scenarios, criterion, dimension, workers=1, cores=None, outputs=None,
+               backend_factory=None, fields_directory=None, fields=None, axisymmetric=True,
+               solver=None, template_directory=None, format="npz", mesh=None):
+    """
+    Yield result rows in completion order while the sweep runs.
+
+    Scenarios sharing an in-situ state go to the same client, which solves
+    std1 once for all of them. ``cores`` is the share of each COMSOL client;
+    by default the machine's cores are split evenly between the ``workers``
+    clients. With ``axisymmetric`` 3D scenarios are solved on the
+    axisymmetric model where it is valid (see hs.solve_dimension); the
+    "dimension" column holds the model actually solved. ``solver`` sets the
+    solver profiles of every scenario (see solver_profiles.py).
+    ``template_directory`` caches meshed geometry shared by the scenarios.
+    ``format`` is the file format of the fields, "npz" or "parquet".
+    ``mesh`` (e.g. from mesh_convergence.mesh_convergence) sets the mesh
+    parameters of every scenario.
+    """
+    if mesh:
+        scenarios = [{**scenario, **mesh} for scenario in scenarios]
+    dimensions = [hs.solve_dimension(dimension, scenario) if axisymmetric else dimension
+                  for scenario in scenarios]
+    tasks = []
+    for solved in dict.fromkeys(dimensions):
+        subset = [(index, scenario) for index, (scenario, d) in enumerate(zip(scenarios, dimensions))
+                  if d == solved]
+        for group in group_by_in_situ([scenario for _, scenario in subset], criterion, solved):
+            tasks.append((criterion, solved, [(subset[i][0], scenario, solver)
+                                              for i, scenario in group]))
+    yield from iter_tasks(tasks, workers, cores, outputs, backend_factory, fields_directory, fields,
+                          template_directory, format)
+
+
+def iter_tasks(tasks, workers=1, cores=None, outputs=None, backend_factory=None,
+               fields_directory=None, fields=None, template_directory=None, format="npz"):
+    """Run (criterion, dimension, group) tasks with solve_group on a ClientPool; yield rows."""
+    if cores is None:
+        cores = cores_per_client(workers)
+    with ClientPool(size=workers, cores=cores, backend_factory=backend_factory) as pool:
+        futures = [pool.submit(solve_group, group, criterion, dimension, outputs,
+                               fields_directory, fields, template_directory, format)
+                   for criterion, dimension, group in tasks]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def result_columns(outputs=None):
+    outputs = DEFAULT_OUTPUTS if outputs is None else outputs
+    return (["index", "criterion", "dimension"] + list(hs.scenario_parameters())
+            + [f"solver_{study}" for study in solver_profiles.SCENARIO_STUDIES]
+            + list(outputs) + ["build_s", "solve_s", "status", "error"])
+
+
+def write_rows(rows, output, columns, total):
+    """Write rows to the CSV file ``output`` as they arrive; returns them as a list."""
+    written = []
+    with open(output, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            file.flush()
+            written.append(row)
+            print(f"Scenario {row['index']} {row['status']} ({len(written)}/{total})")
+    return written
+
+
+def run_sweep(scenarios, criterion, dimension, output="sweep.csv", workers=1, cores=None,
+              outputs=None, backend_factory=None, fields_directory=None, fields=None,
+              axisymmetric=True, solver=None, template_directory=None, format="npz", mesh=None):
+    """Run a sweep, appending rows to the CSV file ``output`` as they finish."""
+    scenarios = list(scenarios)
+    rows = iter_sweep(scenarios, criterion, dimension, workers, cores, outputs,
+                      backend_factory, fields_directory, fields, axisymmetric, solver,
+                      template_directory, format, mesh)
+    return write_rows(rows, output, result_columns(outputs), len(scenarios))
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Derived metrics of solved scenarios, computed with NumPy from exported fields.
+
+From the fields extraction.py writes per scenario (node coordinates and
+displacement components on storage_outer_bnd) this computes without COMSOL:
+
+* wall_convergence: largest inward radial displacement of the straight side
+  wall between the top and bottom arcs [m]
+* lining_stress: largest hoop stress of the lining on the side wall,
+  E_lining*u_r/r at each point, tension positive [MPa]
+* lining_utilization: lining_stress over the lining strength
+* crown_convergence, invert_convergence: largest displacement into the storage
+  along the top (qb1) and bottom (qb2) arcs, i.e. above storage_depth-arc_length
+  and below the floor + arc_length [m]; negative when the arc moves outwards
+* plastic_zone: extent of the plastic zone beyond the wall radius, measured
+  from the nearest storage axis of a multi-cavern layout [m]; needs solid.epe
+  on the whole model, which is only exported with ``fields=FIELDS``
+  (scenarios.py --plastic-fields), and is NaN otherwise
+
+The definitions match the COMSOL expressions of COMSOL_METRICS (and of
+parameter_sweep.DEFAULT_OUTPUTS where both exist), evaluated on the same
+points; cross_check() compares the two on a solved model. Each metric is a
+masked array reduction over one scenario's points; scenarios are
+streamed from the field files or memory-mapped index profiles one at a time,
+so a campaign of any size is processed in the memory of one scenario.
+
+    python scenarios.py site_a.yaml --fields fields/ --plastic-fields
+    python postprocess.py site_a.csv --fields fields/ --output derived.csv
+    python postprocess.py --index campaign_index --where "GSI < 60"
+    python postprocess.py --check hoek-brown 2d --cache model_cache
+"""
+
+import argparse
+import csv
+import os
+import sys
+
+import numpy as np
+
+import extraction
+import hydrogen_storage as hs
+from comsol_backend import MphBackend
+from model_cache import ModelCache
+from result_index import ResultIndex
+
+LINING_STRENGTH = 40 # MPa, lining hoop stress at a utilization of 1
+
+# Metric -> (COMSOL expression, selection); the metric is the max over the selection
+COMSOL_METRICS = {
+    "wall_convergence": (extraction.WALL_CONVERGENCE, "storage_outer_bnd"),
+    "lining_stress": (extraction.LINING_STRESS, "storage_outer_bnd"),
+    "lining_utilization": (f"({extraction.LINING_STRESS})/{{strength}}", "storage_outer_bnd"),
+    "crown_convergence": (f"if({{vertical}}>=storage_depth-arc_length, -{{vertical_displacement}}, "
+                          f"{extraction.NO_POINT:g})", "storage_outer_bnd"),
+    "invert_convergence": (f"if({{vertical}}<=storage_depth-storage_height+arc_length, {{vertical_displacement}}, "
+                           f"{extraction.NO_POINT:g})", "storage_outer_bnd"),
+    "plastic_zone": (extraction.PLASTIC_ZONE, None),
+}
+METRICS = tuple(COMSOL_METRICS)
+
+# Fields to export (extraction.extract(..., fields=FIELDS)) for every metric, including
+# plastic_zone; whole-model arrays, so not part of extraction.DEFAULT_FIELDS
+FIELDS = {**extraction.DEFAULT_FIELDS, "all": ["solid.epe"]}
+
+
+def required_fields(dimension, plastic=True):
+    """
+    Field names (as written by extraction.py) the metrics of a ``dimension``
+    model need; with ``plastic`` False those of the wall metrics only.
+    """
+    coordinates = extraction.COORDINATES[dimension]
+    boundary = coordinates + hs.DISPLACEMENT[dimension]
+    names = [f"storage_outer_bnd/{name}" for name in boundary]
+    if plastic:
+        names += [f"all/{name}" for name in coordinates + ["solid.epe"]]
+    return names
+
+
+def _field(fields, selection, name):
+    return np.ravel(fields[f"{selection}/{name}"])
+
+
+def _axis_offsets(dimension, coordinates, spacing, caverns=1):
+    """
+    Horizontal offsets of points (arrays of their ``coordinates``) from their
+    nearest storage axis, and their distance from it.
+    """
+    offsets = [coordinates[0]]
+    if dimension == "3d":
+        offsets.append(coordinates[1])
+    elif caverns > 1:
+        axes = np.array(hs.cavern_centres(caverns))*spacing
+        across = coordinates[0]
+        offsets = [across - axes[np.argmin(np.abs(across[:, None] - axes), axis=1)]]
+    return offsets, np.sqrt(sum(offset**2 for offset in offsets))
+
+#############################
+# Metrics
+#############################
+def metrics(dimension, parameters, fields, lining_strength=LINING_STRENGTH, caverns=1):
+    """
+    {metric: value} of one scenario of a ``dimension`` model of ``caverns``
+    storages; ``parameters`` are its scenario parameters (a result row or
+    handle.parameters) and ``fields`` the arrays of required_fields().
+    """
+    p = {name: float(parameters[name]) for name in
+         ("storage_diameter", "storage_height", "storage_depth", "arc_length", "youngs_modulus_lining",
+          "pillar_width")}
+    radius = p["storage_diameter"]/2
+    spacing = p["storage_diameter"] + p["pillar_width"]
+    coordinates = extraction.COORDINATES[dimension]
+    floor = p["storage_depth"] - p["storage_height"]
+
+    wall = [_field(fields, "storage_outer_bnd", name) for name in coordinates]
+    level = wall[-1]
+    side = (level >= floor + p["arc_length"]) & (level <= p["storage_depth"] - p["arc_length"])
+    offsets, distance = _axis_offsets(dimension, [values[side] for values in wall], spacing, caverns)
+    radial = sum(offset*_field(fields, "storage_outer_bnd", component)[side]
+                 for offset, component in zip(offsets, hs.DISPLACEMENT[dimension]))/distance
+    hoop = p["youngs_modulus_lining"]*1e3*radial/distance # GPa -> MPa
+    convergence = float(np.max(-radial)) if radial.size else np.nan
+    lining = float(np.max(hoop)) if hoop.size else np.nan
+
+    vertical = _field(fields, "storage_outer_bnd", hs.VERTICAL_DISPLACEMENT[dimension])
+    top = vertical[level >= p["storage_depth"] - p["arc_length"]]
+    bottom = vertical[level <= floor + p["arc_length"]]
+
+    extent = np.nan
+    if "all/solid.epe" in fields:
+        # max of (epe>0)*(distance - radius): elastic points count as 0
+        plastic = _field(fields, "all", "solid.epe") > 0
+        _, distance = _axis_offsets(dimension, [_field(fields, "all", name)[plastic] for name in coordinates],
+                                    spacing, caverns)
+        extent = distance.max() - radius if distance.size else 0.0
+        if distance.size < plastic.size:
+            extent = max(extent, 0.0)
+
+    return {"wall_convergence": convergence, "lining_stress": lining, "lining_utilization": lining/lining_strength,
+            "crown_convergence": float(-top.min()) if top.size else np.nan,
+            "invert_convergence": float(bottom.max()) if bottom.size else np.nan,
+            "plastic_zone": float(extent)}
+
+
+def load_directory(directory, row):
+    """
+    Fields of a result row from ``directory``/scenario_<index>.npz, or None
+    without the wall fields.
+    """
+    if row.get("status", "done") != "done" or row.get("index") in (None, ""):
+        return None
+    path = os.path.join(directory, f"scenario_{int(float(row['index'])):06d}.npz")
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if not set(required_fields(row["dimension"], plastic=False)) <= set(data.files):
+            return None
+        return {name: data[name] for name in required_fields(row["dimension"]) if name in data.files}
+
+
+def load_index(index, row):
+    """Fields of a ResultIndex row as memory-mapped profiles, or None without the wall fields."""
+    fields = {name: index.profile(row["id"], name) for name in required_fields(row["dimension"])}
+    if any(fields[name] is None for name in required_fields(row["dimension"], plastic=False)):
+        return None
+    return {name: array for name, array in fields.items() if array is not None}
+
+
+def iter_metrics(rows, load, lining_strength=LINING_STRENGTH):
+    """
+    Yield (row, metrics) for ``rows`` in order; ``load(row)`` returns the
+    fields of a row or None, which gives empty metrics. Only the fields of
+    the current scenario are held, so any number of scenarios fits in memory.
+    A ``caverns`` column gives the storages of layout rows.
+    """
+    for row in rows:
+        fields = load(row)
+        if fields is None:
+            yield row, {}
+        else:
+            caverns = int(float(row.get("caverns") or 1))
+            yield row, metrics(row["dimension"], row, fields, lining_strength, caverns)
+
+
+def cross_check(handle, lining_strength=LINING_STRENGTH, tolerance=1e-6):
+    """
+    Metrics of a solved model computed here from its fields and evaluated by
+    COMSOL; returns one {metric, numpy, comsol, match} per metric.
+    """
+    dimension = handle.model_dimension
+    computed = metrics(dimension, handle.parameters, extraction.evaluate_fields(handle, FIELDS),
+                       lining_strength, handle.caverns)
+    rows = []
+    for metric, (template, selection) in COMSOL_METRICS.items():
+        expression = extraction.expression(template, dimension, handle.caverns, strength=lining_strength)
+        dataset = extraction.solution_dataset(handle, selection)
+        value = float(np.max(handle.model.evaluate(expression, dataset=dataset)))
+        if value <= extraction.NO_POINT: # no point on the wall or arc
+            value = np.nan
+        match = np.isclose(computed[metric], value, rtol=tolerance, atol=1e-12, equal_nan=True)
+        rows.append({"metric": metric, "numpy": computed[metric], "comsol": value, "match": bool(match)})
+    return rows
+
+#############################
+# Command line
+#############################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Derived metrics of solved scenarios from their fields.")
+    parser.add_argument("table", nargs="?", help="result CSV (run_sweep, scenarios.py, JobStore.export)")
+    parser.add_argument("--fields", help="field directory (scenario_<index>.npz) of the table")
+    parser.add_argument("--index", help="result index directory; metrics are written back as columns")
+    parser.add_argument("--where", help="SQL condition selecting scenarios of the index")
+    parser.add_argument("--output", help="CSV of the rows with their metrics")
+    parser.add_argument("--lining-strength", type=float, default=LINING_STRENGTH, help="MPa")
+    parser.add_argument("--check", nargs=2, metavar=("CRITERION", "DIMENSION"),
+                        help="compare with COMSOL on a solved reference scenario")
+    parser.add_argument("--caverns", type=int, default=1, help="storages of the --check model (2d)")
+    parser.add_argument("--cache", help="model cache directory; repeated checks load the solved model")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--cores", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    if args.check:
+        criterion, dimension = args.check
+        with MphBackend(cores=args.cores, host=args.host, port=args.port) as backend:
+            if args.cache:
+                handle = ModelCache(args.cache).load_or_build(criterion, dimension, backend, solve=True,
+                                                              caverns=args.caverns)
+            else:
+                handle = hs.create_h2storagemodel(criterion, dimension, backend=backend, save=False,
+                                                  caverns=args.caverns)
+                handle.solve()
+            rows = cross_check(handle, args.lining_strength)
+        for row in rows:
+            print(f"{row['metric']:20s} {row['numpy']:14.6g} {row['comsol']:14.6g} "
+                  f"{'ok' if row['match'] else 'MISMATCH'}")
+        return 0 if all(row["match"] for row in rows) else 1
+
+    index = None
+    if args.index:
+        index = ResultIndex(args.index)
+        rows = index.query(args.where)
+        load = lambda row: load_index(index, row)
+        columns = list(rows[0]) if rows else []
+    elif args.table and args.fields:
+        file = open(args.table, newline="", encoding="utf-8")
+        reader = csv.DictReader(file)
+        rows, columns = reader, list(reader.fieldnames or [])
+        load = lambda row: load_directory(args.fields, row)
+    else:
+        parser.error("give a result table with --fields, an --index or --check")
+
+    output = open(args.output, "w", newline="", encoding="utf-8") if args.output else None
+    writer = None
+    if output is not None:
+        writer = csv.DictWriter(output, fieldnames=columns + [m for m in METRICS if m not in columns])
+        writer.writeheader()
+    count = done = 0
+    try:
+        for row, values in iter_metrics(rows, load, args.lining_strength):
+            count += 1
+            done += bool(values)
+            if index is not None and values:
+                index.update(row["id"], values)
+            if writer is not None:
+                writer.writerow({**row, **values})
+    finally:
+        if output is not None:
+            output.close()
+        if index is not None:
+            index.close()
+        else:
+            file.close()
+    print(f"Metrics of {done} of {count} scenarios")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
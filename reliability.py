@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Reliability analysis: probability of failure under rock mass uncertainty.
+
+The uncertain inputs (GSI, D_hoek, m_i, compressive_strength, cohesion,
+friction_angle or any other scenario parameter) are given marginal
+distributions and correlation coefficients. They are mapped to independent
+standard normals u, with the correlation applied to the normal scores (the
+Nataf model), and a scenario fails where the limit state
+
+    g = min over the limited outputs of (limit - value)/limit
+
+is negative, e.g. limits={"wall_convergence": 0.05, "plastic_zone": 10}.
+
+FORM finds the design point, the most probable failure point, with the
+HL-RF iteration. Its gradients are forward differences, and the n + 1 solves
+of one iteration run in parallel on a ClientPool. Importance sampling around
+the design point then corrects the FORM estimate Phi(-beta) and gives
+confidence bounds. Six variables typically take 20-40 FORM solves and a few
+tens of samples; crude Monte Carlo would need ~10^4 solves at Pf = 1e-3.
+
+    variables = RandomVariables({"GSI": ("truncnormal", 60, 8, 20, 100),
+                                 "compressive_strength": ("lognormal", 150, 30)},
+                                correlation={("GSI", "compressive_strength"): 0.5})
+    with Reliability(variables, {"wall_convergence": 0.05}, "hoek-brown", workers=4) as analysis:
+        report = analysis.run(samples=40)
+"""
+
+import numpy as np
+from scipy import stats
+
+import hydrogen_storage as hs
+from client_pool import ClientPool, cores_per_client
+from parameter_sweep import DEFAULT_OUTPUTS, solve_group
+
+#############################
+# Random inputs
+#############################
+def marginal(kind, *args):
+    """
+    Frozen scipy distribution: ("normal", mean, std), ("lognormal", mean,
+    std), ("uniform", low, high) or ("truncnormal", mean, std, low, high).
+    """
+    if kind == "normal":
+        mean, std = args
+        return stats.norm(mean, std)
+    if kind == "lognormal":
+        mean, std = args
+        sigma = np.sqrt(np.log(1 + (std/mean)**2))
+        return stats.lognorm(sigma, scale=mean*np.exp(-0.5*sigma**2))
+    if kind == "uniform":
+        low, high = args
+        return stats.uniform(low, high - low)
+    if kind == "truncnormal":
+        mean, std, low, high = args
+        return stats.truncnorm((low - mean)/std, (high - mean)/std, mean, std)
+    raise ValueError(f"Unknown distribution {kind!r}")
+
+
+class RandomVariables:
+    """
+    Scenario parameters with ``marginals`` {name: (kind, *args)} (see
+    marginal()) and ``correlation`` {(name, name): coefficient} between the
+    normal scores; unlisted pairs are uncorrelated.
+    """
+
+    def __init__(self, marginals, correlation=None):
+        unknown = set(marginals) - set(hs.default_parameters())
+        if unknown:
+            raise ValueError(f"Unknown scenario parameters: {', '.join(sorted(unknown))}")
+        self.names = list(marginals)
+        self.marginals = [marginal(*marginals[name]) for name in self.names]
+        matrix = np.eye(len(self.names))
+        for (a, b), coefficient in (correlation or {}).items():
+            i, j = self.names.index(a), self.names.index(b)
+            matrix[i, j] = matrix[j, i] = coefficient
+        try:
+            self.cholesky = np.linalg.cholesky(matrix)
+        except np.linalg.LinAlgError:
+            raise ValueError("The correlation matrix is not positive definite") from None
+        self.correlation = matrix
+
+    def to_physical(self, u):
+        """Parameter values at the rows of standard normal points ``u``."""
+        z = np.atleast_2d(u) @ self.cholesky.T
+        probabilities = stats.norm.cdf(z)
+        return np.column_stack([m.ppf(probabilities[:, i]) for i, m in enumerate(self.marginals)])
+
+    def scenario(self, x):
+        """Scenario dict of one row of parameter values."""
+        return dict(zip(self.names, (float(value) for value in x)))
+
+#############################
+# Analysis
+#############################
+class Reliability:
+    """
+    Probability that a scenario exceeds ``limits`` ({output: limit}, outputs
+    of parameter_sweep.DEFAULT_OUTPUTS or ``outputs``) when ``variables``
+    vary around the fixed ``parameters``. Solves run on ``workers`` COMSOL
+    clients with ``cores`` each (default an even share of the machine's
+    cores), each given a share of the points of a batch. Failed solves
+    count as failures unless ``failed_as_failure`` is False, then they are
+    left out.
+    """
+
+    def __init__(self, variables, limits, criterion, dimension="3d", parameters=None, workers=1,
+                 cores=None, backend_factory=None, template_directory=None, outputs=None,
+                 failed_as_failure=True):
+        for name in variables.names:
+            applies_to = hs.COMSOL_PARAMETERS[name][3]
+            if applies_to not in (None, criterion):
+                raise ValueError(f"{name} does not enter the {criterion} model")
+        outputs = DEFAULT_OUTPUTS if outputs is None else outputs
+        self.variables = variables
+        self.limits = limits
+        self.criterion = criterion
+        self.parameters = dict(parameters or {})
+        self.dimension = hs.solve_dimension(dimension, self.parameters)
+        self.workers = workers
+        self.cores = cores or cores_per_client(workers)
+        self.backend_factory = backend_factory
+        self.template_directory = template_directory
+        self.outputs = {name: outputs[name] for name in limits}
+        self.failed_as_failure = failed_as_failure
+        self.pool = None
+        self.values = {} # rounded u -> limit state
+        self.solves = 0
+        self.failed_solves = 0
+
+    def _solve(self, scenarios):
+        if self.pool is None:
+            self.pool = ClientPool(self.workers, self.cores, self.backend_factory)
+        chunks = np.array_split(np.arange(len(scenarios)), min(self.workers, len(scenarios)))
+        futures = [self.pool.submit(solve_group, [(int(i), scenarios[i]) for i in chunk],
+                                    self.criterion, self.dimension, self.outputs, None, None,
+                                    self.template_directory)
+                   for chunk in chunks]
+        rows = [row for future in futures for row in future.result()]
+        return sorted(rows, key=lambda row: row["index"])
+
+    def _limit_state(self, row):
+        if row["status"] != "done":
+            self.failed_solves += 1
+            return -1.0 if self.failed_as_failure else np.nan
+        values = [row.get(name) for name in self.limits]
+        if None in values:  # recorded models hold no solution
+            return np.nan
+        return min((limit - value)/limit for value, limit in zip(values, self.limits.values()))
+
+    def evaluate(self, u):
+        """Limit state at the rows of ``u``; points not solved before are solved in one parallel batch."""
+        u = np.atleast_2d(u)
+        keys = [tuple(np.round(point, 8)) for point in u]
+        new = [key for key in dict.fromkeys(keys) if key not in self.values]
+        if new:
+            x = self.variables.to_physical(np.array(new))
+            scenarios = [{**self.parameters, **self.variables.scenario(point)} for point in x]
+            for key, row in zip(new, self._solve(scenarios)):
+                self.values[key] = self._limit_state(row)
+            self.solves += len(new)
+        return np.array([self.values[key] for key in keys])
+
+    def form(self, max_iterations=10, tolerance=0.01, step=0.1):
+        """
+        Design point by the HL-RF iteration with forward differences of
+        ``step`` in u. Returns {"beta", "pf", "u", "design_point",
+        "iterations", "converged"}.
+        """
+        n = len(self.variables.names)
+        u = np.zeros(n)
+        scale = None
+        converged = False
+        for iteration in range(1, max_iterations + 1):
+            g = self.evaluate(np.vstack([u, u + step*np.eye(n)]))
+            if np.isnan(g).any():
+                raise RuntimeError("The limit state could not be evaluated (no solution)")
+            if scale is None:
+                scale = abs(g[0]) or 1.0
+                origin_safe = g[0] > 0
+            gradient = (g[1:] - g[0])/step
+            if not gradient.any():
+                raise RuntimeError("The limit state does not change with the random variables")
+            new = (gradient @ u - g[0])/(gradient @ gradient)*gradient
+            print(f"FORM iteration {iteration}: g {g[0]:.4g}, beta {np.linalg.norm(new):.3f} "
+                  f"({self.solves} solves)")
+            converged = (np.linalg.norm(new - u) < tolerance*max(1.0, np.linalg.norm(new))
+                         and abs(g[0]) < tolerance*scale)
+            u = new
+            if converged:
+                break
+        beta = np.linalg.norm(u) if origin_safe else -np.linalg.norm(u)
+        return {"beta": beta, "pf": stats.norm.cdf(-beta), "u": u,
+                "design_point": self.variables.scenario(self.variables.to_physical(u)[0]),
+                "iterations": iteration, "converged": converged}
+
+    def importance_sampling(self, centre=None, samples=40, confidence=0.95, seed=None):
+        """
+        Pf from ``samples`` points of a unit normal centred on ``centre`` in u
+        (the design point; None gives crude Monte Carlo) with ``confidence``
+        bounds from the normal approximation of the estimator. Without any
+        failing sample the upper bound is the zero-failure binomial bound
+        scaled by the largest weight.
+        """
+        n = len(self.variables.names)
+        centre = np.zeros(n) if centre is None else np.asarray(centre, dtype=float)
+        rng = np.random.default_rng(seed)
+        u = centre + rng.standard_normal((samples, n))
+        g = self.evaluate(u)
+        valid = ~np.isnan(g)
+        weights = np.exp(-u[valid] @ centre + 0.5*centre @ centre) # phi(u)/phi(u - centre)
+        terms = (g[valid] < 0)*weights
+        pf = terms.mean()
+        z = stats.norm.ppf(0.5 + confidence/2)
+        if terms.any():
+            error = terms.std(ddof=1)/np.sqrt(len(terms))
+            lower, upper = max(0.0, pf - z*error), pf + z*error
+        else:
+            error = 0.0
+            lower, upper = 0.0, -np.log(1 - confidence)/len(terms)*weights.max()
+        return {"pf": pf, "lower": lower, "upper": upper, "cov": error/pf if pf else np.inf,
+                "failures": int((g[valid] < 0).sum()), "samples": int(valid.sum())}
+
+    def run(self, samples=40, confidence=0.95, seed=None, **form_options):
+        """FORM, then importance sampling at its design point; returns and prints a report."""
+        form = self.form(**form_options)
+        sampling = self.importance_sampling(form["u"], samples, confidence, seed)
+        report = {"beta": form["beta"], "pf_form": form["pf"], "design_point": form["design_point"],
+                  "form_converged": form["converged"], **sampling, "confidence": confidence,
+                  "solves": self.solves, "failed_solves": self.failed_solves}
+        print(f"beta {report['beta']:.3f}, FORM Pf {report['pf_form']:.3g}")
+        print(f"Pf {report['pf']:.3g} ({confidence:.0%} bounds {report['lower']:.3g} - "
+              f"{report['upper']:.3g}), {report['failures']}/{report['samples']} samples failed")
+        print(f"{report['solves']} solves, {report['failed_solves']} did not converge")
+        print("Design point: " + ", ".join(f"{name} {value:.4g}"
+                                          for name, value in report["design_point"].items()))
+        return report
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
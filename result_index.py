@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Index of solved scenarios: parameters, scalar outputs and result profiles.
+
+A ResultIndex is a directory with an SQLite table of one row per scenario
+(key, name, criterion, dimension, status, every scenario parameter and every
+scalar output as its own column) and one raw float64 file per profile, e.g.
+``storage_outer_bnd/solid.mises`` as written by extraction.py. Profiles are
+appended as scenarios come in and read back through memory maps, so queries
+need neither COMSOL nor the model files:
+
+    index = ResultIndex("campaign_index")
+    rows = index.query("GSI < 60 AND lining_stress > ?", (20,), order="lining_stress DESC")
+    mises = index.profile(rows[0]["id"], "storage_outer_bnd/solid.mises")
+    index.aggregate("AVG(wall_convergence)", group_by="criterion")
+
+Scenarios are keyed with job_queue.job_key, so adding a scenario again
+replaces its row. Rows are added as they finish by
+``scenarios.py --index DIR``, or afterwards from result tables and field
+directories:
+
+    python result_index.py campaign_index --add sweep.csv --fields fields/
+    python result_index.py campaign_index --where "GSI < 60 AND lining_stress > 20"
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+import extraction
+import hydrogen_storage as hs
+import solver_profiles
+from job_queue import job_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    name TEXT,
+    criterion TEXT,
+    dimension TEXT,
+    status TEXT,
+    added REAL
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    scenario INTEGER,
+    name TEXT,
+    offset INTEGER,
+    length INTEGER,
+    shape TEXT,
+    PRIMARY KEY (scenario, name)
+);
+"""
+
+# Row fields that are not columns of their own
+_SKIPPED = {"index", "key", "id", "added"}
+
+
+def _number(value):
+    """Float of numeric CSV text, other values unchanged."""
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value if value else None
+    return value
+
+
+def _file_name(profile):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", profile) + ".f64"
+
+
+class ResultIndex:
+    """SQLite scenario table plus memory-mapped profile arrays in ``directory``."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.connection = sqlite3.connect(os.path.join(directory, "index.sqlite"))
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.columns = {row["name"] for row in self.connection.execute("PRAGMA table_info(scenarios)")}
+
+    def _add_columns(self, values):
+        # no declared type: numbers stay numbers whatever the first value seen was
+        for column in values:
+            if column not in self.columns:
+                self.connection.execute(f'ALTER TABLE scenarios ADD COLUMN "{column}"')
+                self.columns.add(column)
+
+    def add(self, row, profiles=None):
+        """
+        Add a result row (see parameter_sweep.result_columns) and optionally
+        its profiles ({name: array}, e.g. extraction.load_fields()); returns
+        the scenario id.
+        """
+        row = {column: _number(value) for column, value in row.items()}
+        # floats throughout, so rows read back from CSV or the index get the same key
+        parameters = {name: float(row[name]) for name in hs.default_parameters()
+                      if isinstance(row.get(name), (int, float, np.number))}
+        solver = {study: row[f"solver_{study}"] for study in solver_profiles.SCENARIO_STUDIES
+                  if row.get(f"solver_{study}")}
+        key = job_key(row["criterion"], row["dimension"], parameters, solver)
+        # empty values (outputs of failed scenarios) are left NULL
+        values = {column: value for column, value in row.items()
+                  if column not in _SKIPPED and value is not None}
+        with self.connection:
+            self._add_columns(values)
+            values.update(key=key, added=time.time())
+            previous = self.connection.execute("SELECT id FROM scenarios WHERE key = ?", (key,)).fetchone()
+            if previous is not None:
+                self.connection.execute("DELETE FROM scenarios WHERE id = ?", (previous["id"],))
+                self.connection.execute("DELETE FROM profiles WHERE scenario = ?", (previous["id"],))
+                values["id"] = previous["id"]
+            columns = ", ".join(f'"{column}"' for column in values)
+            cursor = self.connection.execute(
+                f"INSERT INTO scenarios ({columns}) VALUES ({', '.join('?'*len(values))})",
+                [float(value) if isinstance(value, np.number) else value for value in values.values()])
+            scenario = cursor.lastrowid
+            for name, array in (profiles or {}).items():
+                self._append_profile(scenario, name, np.asarray(array))
+        return scenario
+
+    def update(self, scenario, values):
+        """Set columns of scenario ``scenario``, e.g. derived metrics; profiles are kept."""
+        with self.connection:
+            self._add_columns(values)
+            assignments = ", ".join(f'"{column}" = ?' for column in values)
+            self.connection.execute(
+                f"UPDATE scenarios SET {assignments} WHERE id = ?",
+                [float(value) if isinstance(value, np.number) else value for value in values.values()]
+                + [scenario])
+
+    def _append_profile(self, scenario, name, array):
+        """Append ``array`` to the profile file; replaced profiles stay as unused bytes."""
+        path = os.path.join(self.directory, _file_name(name))
+        with open(path, "ab") as file:
+            offset = file.tell()//8
+            np.ascontiguousarray(array, dtype="<f8").tofile(file)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO profiles (scenario, name, offset, length, shape) VALUES (?, ?, ?, ?, ?)",
+            (scenario, name, offset, int(array.size), json.dumps(array.shape)))
+
+    def query(self, where=None, parameters=(), columns="*", order=None, limit=None):
+        """Scenario rows as dicts, filtered by the SQL condition ``where``."""
+        statement = f"SELECT {columns} FROM scenarios"
+        if where:
+            statement += f" WHERE {where}"
+        if order:
+            statement += f" ORDER BY {order}"
+        if limit is not None:
+            statement += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self.connection.execute(statement, parameters)]
+
+    def aggregate(self, expression, where=None, parameters=(), group_by=None):
+        """
+        Aggregate ``expression`` (e.g. "MAX(lining_stress)"), per value of the
+        ``group_by`` columns if given.
+        """
+        columns = f"{group_by}, {expression}" if group_by else expression
+        statement = f"SELECT {columns} FROM scenarios"
+        if where:
+            statement += f" WHERE {where}"
+        if group_by:
+            statement += f" GROUP BY {group_by} ORDER BY {group_by}"
+        rows = [tuple(row) for row in self.connection.execute(statement, parameters)]
+        if group_by:
+            return rows
+        return rows[0][0] if len(rows[0]) == 1 else rows[0]
+
+    def profile_names(self):
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT name FROM profiles ORDER BY name")]
+
+    def _memmap(self, name):
+        path = os.path.join(self.directory, _file_name(name))
+        return np.memmap(path, dtype="<f8", mode="r")
+
+    def profile(self, scenario, name):
+        """Read-only view of one scenario's profile, or None if it has none."""
+        entry = self.connection.execute(
+            "SELECT offset, length, shape FROM profiles WHERE scenario = ? AND name = ?",
+            (scenario, name)).fetchone()
+        if entry is None:
+            return None
+        values = self._memmap(name)[entry["offset"]:entry["offset"] + entry["length"]]
+        return values.reshape(json.loads(entry["shape"]))
+
+    def profiles(self, name, where=None, parameters=()):
+        """{scenario id: view} of profile ``name`` for the scenarios matching ``where``."""
+        statement = ("SELECT profiles.scenario, offset, length, shape FROM profiles"
+                     " JOIN scenarios ON scenarios.id = profiles.scenario WHERE profiles.name = ?")
+        if where:
+            statement += f" AND ({where})"
+        entries = self.connection.execute(statement, (name,) + tuple(parameters)).fetchall()
+        if not entries:
+            return {}
+        values = self._memmap(name)
+        return {entry["scenario"]: values[entry["offset"]:entry["offset"] + entry["length"]]
+                .reshape(json.loads(entry["shape"])) for entry in entries}
+
+    def add_result(self, row, fields_directory=None):
+        """Add a result row with the fields solve_group wrote for it to ``fields_directory``, if any."""
+        fields = None
+        if fields_directory is not None and row.get("index") not in (None, ""):
+            path = os.path.join(fields_directory, f"scenario_{int(float(row['index'])):06d}.npz")
+            if os.path.exists(path):
+                fields = extraction.load_fields(path)
+        return self.add(row, fields)
+
+    def import_table(self, path, fields_directory=None):
+        """
+        Add every row of a result CSV (run_sweep, scenarios.py, JobStore.export)
+        and its fields; returns the number of rows.
+        """
+        count = 0
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                self.add_result(row, fields_directory)
+                count += 1
+        return count
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM scenarios").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+#############################
+# Command line
+#############################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query an index of solved scenarios.")
+    parser.add_argument("index", help="index directory")
+    parser.add_argument("--add", nargs="+", default=[], help="result CSV tables to add")
+    parser.add_argument("--fields", help="field directory (scenario_<index>.npz) of the added tables")
+    parser.add_argument("--where", help='SQL condition, e.g. "GSI < 60 AND lining_stress > 20"')
+    parser.add_argument("--columns", default="id, name, criterion, dimension, status")
+    parser.add_argument("--order")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--aggregate", help='e.g. "COUNT(*), AVG(lining_stress)"')
+    parser.add_argument("--group-by")
+    args = parser.parse_args(argv)
+
+    index = ResultIndex(args.index)
+    try:
+        for path in args.add:
+            print(f"{index.import_table(path, args.fields)} scenarios added from {path}")
+        if args.aggregate:
+            result = index.aggregate(args.aggregate, args.where, group_by=args.group_by)
+            if not args.group_by:
+                result = [result if isinstance(result, tuple) else (result,)]
+            for row in result:
+                print(", ".join(str(value) for value in row))
+        elif args.where or not args.add:
+            rows = index.query(args.where, columns=args.columns, order=args.order, limit=args.limit)
+            writer = csv.writer(sys.stdout)
+            if rows:
+                writer.writerow(rows[0])
+            writer.writerows(row.values() for row in rows)
+            print(f"{len(rows)} of {len(index)} scenarios")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
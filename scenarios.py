@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Declarative scenario files and the batch command line entry point.
+
+A scenario file (YAML or JSON) is either a list of scenarios or a mapping
+with optional ``defaults`` and a ``scenarios`` list:
+
+    defaults:
+      criterion: hoek-brown
+      dimension: 3d
+      storage_depth: -150
+    scenarios:
+      - name: base
+      - name: weak rock
+        GSI: 55
+      - internal_pressure: 120
+        lining_thickness: 30
+
+Every scenario may set ``name``, ``criterion``, ``dimension``, ``solver`` (a
+profile of solver_profiles.py, or a mapping of study to profile such as
+``{std1: iterative-low-memory, std2: plasticity-robust}``) and any
+parameter of hydrogen_storage.default_parameters(). 3D scenarios are solved
+on the axisymmetric model where that is valid, unless --full-3d is given.
+Identical scenarios are
+solved once, and scenarios are ordered so that those sharing geometry and
+mesh, and then the in-situ state, run one after another on the same model.
+
+    python scenarios.py site_a.yaml --output site_a.csv --workers 8 --cores 8
+
+With --store the scenarios go through the resumable job queue of
+job_queue.py instead; run the same command again to resume.
+"""
+
+import argparse
+import json
+import math
+import os
+
+import hydrogen_storage as hs
+import solver_profiles
+from parameter_sweep import iter_tasks, result_columns, write_rows
+from staged_solve import in_situ_key
+
+CRITERIA = hs.CRITERIA
+DIMENSIONS = hs.MODEL_DIMENSIONS
+
+#############################
+# Schema
+#############################
+def validate(scenario, position=0):
+    """Check one scenario mapping and split it into name, criterion, dimension, solver and parameters."""
+    if not isinstance(scenario, dict):
+        raise ValueError(f"Scenario {position}: expected a mapping, got {type(scenario).__name__}")
+    scenario = dict(scenario)
+    name = str(scenario.pop("name", f"scenario_{position}"))
+    criterion = scenario.pop("criterion", "mohr-coulomb")
+    dimension = scenario.pop("dimension", "3d")
+    try:
+        solver = solver_profiles.normalize(scenario.pop("solver", None))
+    except (TypeError, ValueError) as error:
+        raise ValueError(f"Scenario {name}: {error}") from None
+    if criterion not in CRITERIA:
+        raise ValueError(f"Scenario {name}: criterion must be one of {CRITERIA}, got {criterion!r}")
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Scenario {name}: dimension must be one of {DIMENSIONS}, got {dimension!r}")
+    defaults = hs.default_parameters()
+    for key, value in scenario.items():
+        if key not in defaults:
+            raise ValueError(f"Scenario {name}: unknown parameter {key!r}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Scenario {name}: {key} must be a number, got {value!r}")
+    return {"name": name, "criterion": criterion, "dimension": dimension, "solver": solver,
+            "parameters": scenario}
+
+
+def parse_scenarios(data):
+    """Validated scenarios from the loaded content of a scenario file."""
+    if isinstance(data, dict):
+        defaults = data.get("defaults") or {}
+        entries = data.get("scenarios") or []
+    else:
+        defaults, entries = {}, data
+    if not isinstance(entries, list):
+        raise ValueError("Scenario file: 'scenarios' must be a list")
+    return [validate({**defaults, **(entry or {})}, position)
+            for position, entry in enumerate(entries)]
+
+
+def load_scenarios(path):
+    with open(path, encoding="utf-8") as file:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            data = yaml.safe_load(file)
+        else:
+            data = json.load(file)
+    return parse_scenarios(data)
+
+#############################
+# Planning
+#############################
+def use_axisymmetric(scenarios):
+    """Scenarios with "3d" replaced by "2daxi" wherever the axisymmetric model is valid."""
+    resolved = [{**scenario, "dimension": hs.solve_dimension(scenario["dimension"], scenario["parameters"])}
+                for scenario in scenarios]
+    changed = sum(a["dimension"] != b["dimension"] for a, b in zip(scenarios, resolved))
+    if changed:
+        print(f"{changed} 3D scenarios solved on the axisymmetric model")
+    return resolved
+
+
+def _identity(scenario):
+    p = hs.scenario_parameters(scenario["parameters"])
+    return (scenario["criterion"], scenario["dimension"], tuple(sorted(scenario["solver"].items())),
+            tuple(sorted(p.items())))
+
+
+def deduplicate(scenarios):
+    """Unique scenarios and, per unique scenario, the names of all scenarios it stands for."""
+    unique = {}
+    for scenario in scenarios:
+        unique.setdefault(_identity(scenario), (scenario, []))[1].append(scenario["name"])
+    return [scenario for scenario, _ in unique.values()], [names for _, names in unique.values()]
+
+
+def reuse_key(scenario):
+    """
+    Sort key putting shared geometry/mesh first, then equal solver profiles
+    and shared in-situ state, together.
+    """
+    p = hs.scenario_parameters(scenario["parameters"])
+    shape = tuple(p[name] for name in sorted(hs.GEOMETRY_PARAMETERS | hs.MESH_PARAMETERS))
+    in_situ = in_situ_key(scenario["criterion"], scenario["dimension"], scenario["parameters"])
+    return (scenario["criterion"], scenario["dimension"], shape,
+            tuple(sorted(scenario["solver"].items())), repr(in_situ), tuple(sorted(p.items())))
+
+
+def plan(scenarios, workers=1):
+    """
+    Tasks (criterion, dimension, [(index, parameters, solver)]) for parameter_sweep.iter_tasks.
+
+    Each task reuses one model for scenarios of equal geometry and mesh. Tasks
+    larger than an even share of the work are split so all workers stay busy.
+    """
+    order = sorted(range(len(scenarios)), key=lambda i: reuse_key(scenarios[i]))
+    share = max(1, math.ceil(len(scenarios)/max(workers, 1)))
+    tasks = []
+    for i in order:
+        scenario = scenarios[i]
+        key = reuse_key(scenario)[:3]
+        if tasks and tasks[-1][0] == key and len(tasks[-1][1]) < share:
+            tasks[-1][1].append((i, scenario["parameters"], scenario["solver"]))
+        else:
+            tasks.append((key, [(i, scenario["parameters"], scenario["solver"])]))
+    return [(key[0], key[1], group) for key, group in tasks]
+
+
+def run(scenarios, output, workers=1, cores=None, fields_directory=None, backend_factory=None,
+        template_directory=None, index=None, fields=None, format="npz"):
+    """
+    Deduplicate, plan and solve scenarios, streaming rows to the CSV file
+    ``output`` and, if given, to the result_index.ResultIndex ``index``.
+    """
+    unique, names = deduplicate(scenarios)
+    print(f"{len(scenarios)} scenarios, {len(unique)} unique")
+    tasks = plan(unique, workers)
+
+    def named(rows):
+        for row in rows:
+            row["name"] = "; ".join(names[row["index"]])
+            if index is not None:
+                index.add_result(row, fields_directory)
+            yield row
+    rows = iter_tasks(tasks, workers, cores, backend_factory=backend_factory,
+                      fields_directory=fields_directory, fields=fields,
+                      template_directory=template_directory, format=format)
+    return write_rows(named(rows), output, ["name"] + result_columns(), len(unique))
+
+#############################
+# Command line
+#############################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve the hydrogen storage scenarios in a YAML/JSON file.")
+    parser.add_argument("scenarios", help="scenario file (.yaml, .yml or .json)")
+    parser.add_argument("-o", "--output", help="result table, default <scenarios>.csv")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="concurrent COMSOL clients")
+    parser.add_argument("-c", "--cores", type=int, help="cores per client, default an even share")
+    parser.add_argument("--fields", help="directory for per-scenario result fields")
+    parser.add_argument("--plastic-fields", action="store_true",
+                        help="also write solid.epe on the whole model, for the plastic zone of postprocess.py")
+    parser.add_argument("--format", choices=("npz", "parquet"), default="npz",
+                        help="file format of the fields; --index and postprocess.py read npz")
+    parser.add_argument("--templates", help="directory caching meshed geometry across material variants")
+    parser.add_argument("--index", help="result index directory the solved scenarios are added to")
+    parser.add_argument("--full-3d", action="store_true",
+                        help="solve 3D scenarios on the 3D model even where axisymmetric is valid")
+    parser.add_argument("--store", help="SQLite job store; resumes the jobs already in it")
+    parser.add_argument("--retries", type=int, default=2, help="attempts after a failure (with --store)")
+    parser.add_argument("--timeout", type=float, help="seconds per scenario (with --store)")
+    parser.add_argument("--dry-run", action="store_true", help="validate and print the plan only")
+    parser.add_argument("--record", action="store_true",
+                        help="build with the recording backend instead of COMSOL (no solutions)")
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenarios)
+    if not args.full_3d:
+        scenarios = use_axisymmetric(scenarios)
+    if args.dry_run:
+        unique, _ = deduplicate(scenarios)
+        for criterion, dimension, group in plan(unique, args.workers):
+            print(f"{criterion} {dimension}: {', '.join(unique[i]['name'] for i, *_ in group)}")
+        return
+    output = args.output or os.path.splitext(args.scenarios)[0] + ".csv"
+    backend_factory = None
+    if args.record:
+        from comsol_backend import RecordingBackend
+        backend_factory = RecordingBackend
+    fields = None
+    if args.plastic_fields:
+        from postprocess import FIELDS as fields
+    index = None
+    if args.index:
+        from result_index import ResultIndex
+        index = ResultIndex(args.index)
+    try:
+        if args.store:
+            from job_queue import run_queue
+            run_queue(scenarios, args.store, output, args.workers, args.cores, args.retries,
+                      args.timeout, backend_factory=backend_factory, fields_directory=args.fields,
+                      fields=fields, template_directory=args.templates, index=index, format=args.format)
+        else:
+            run(scenarios, output, args.workers, args.cores, args.fields, backend_factory,
+                args.templates, index, fields, args.format)
+    finally:
+        if index is not None:
+            index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Closed-form pre-screen of cavern designs before the FEM model is built.
+
+Every input is broadcast with NumPy, so millions of combinations are screened
+in one call. The estimate is deliberately simple:
+
+* in-situ stress from the overburden, sigma_v = rho_rock*g*z, and the
+  laterally constrained horizontal stress sigma_h = nu/(1-nu)*sigma_v (the
+  roller boundaries of the FEM model give the same ratio);
+* elastic stresses at the wall of the storage, a vertical-axis solid of
+  revolution (the 2daxi/3D model): at the side wall the long vertical
+  cylinder solution, hoop stress 2*sigma_h - p with p radial and sigma_v
+  along the axis; at the roof the pole of a spherical cavity, tangential
+  stress ((24*sigma_h - (3 + 15*nu)*sigma_v)/(2*(7 - 5*nu)) - p/2 in every
+  horizontal direction with p normal to the roof;
+* hoop stress in the lining from the share of p it carries when it is
+  bonded to elastic rock;
+* factor of safety (strength deviator over acting deviator) in shear under
+  Hoek-Brown (a = 0.5, as in the FEM) or Mohr-Coulomb, with a tension
+  cutoff: tensile stresses are taken as released by cracking, so the shear
+  check counts them as zero, and a minor stress beyond the rock mass
+  tensile strength is flagged by ``tensile_wall`` / ``tensile_roof``.
+
+Stresses are in MPa, compression positive. Inputs use the units of the
+module globals in hydrogen_storage (depth in m, pressure in bar, lining
+thickness in cm, moduli in GPa).
+"""
+
+import numpy as np
+
+import hydrogen_storage as hs
+
+GRAVITY = 9.81 # m/s^2
+
+
+def _inputs(parameters):
+    p = hs.default_parameters()
+    unknown = set(parameters) - set(p)
+    if unknown:
+        raise ValueError(f"Unknown scenario parameters: {', '.join(sorted(unknown))}")
+    p.update(parameters)
+    names = list(p)
+    return dict(zip(names, np.broadcast_arrays(*(np.asarray(p[n], dtype=float) for n in names))))
+
+
+def in_situ_stress(depth, rho_rock, poissons_ratio):
+    """Vertical and horizontal in-situ stress [MPa] at ``depth`` metres below surface."""
+    sigma_v = rho_rock*GRAVITY*depth*1e-6
+    return sigma_v, poissons_ratio/(1 - poissons_ratio)*sigma_v
+
+
+def lining_hoop_stress(pressure, radius, lining_thickness, youngs_modulus_lining,
+                       youngs_modulus, poissons_ratio):
+    """Hoop stress [MPa, tension positive] in a thin lining bonded to elastic rock."""
+    t = lining_thickness*1e-2
+    lining_compliance = radius/(t*youngs_modulus_lining)
+    rock_compliance = (1 + poissons_ratio)/youngs_modulus
+    lining_pressure = pressure*rock_compliance/(lining_compliance + rock_compliance)
+    return lining_pressure*radius/t
+
+
+def hoek_brown_strength(sigma_3, compressive_strength, m_hoek, s_hoek):
+    """Major principal stress at failure for minor principal stress ``sigma_3``."""
+    root = m_hoek*sigma_3/compressive_strength + s_hoek
+    return sigma_3 + compressive_strength*np.sqrt(np.clip(root, 0, None))
+
+
+def mohr_coulomb_strength(sigma_3, cohesion, friction_angle):
+    """Major principal stress at failure for minor principal stress ``sigma_3``."""
+    sin_phi = np.sin(np.radians(friction_angle))
+    n_phi = (1 + sin_phi)/(1 - sin_phi)
+    return n_phi*sigma_3 + 2*cohesion*np.sqrt(n_phi)
+
+
+def tensile_strength(criterion, p):
+    """Uniaxial tensile strength [MPa, positive] of the rock mass."""
+    if criterion == "hoek-brown":
+        m_hoek, s_hoek = hs.hoek_brown_constants(p["GSI"], p["D_hoek"], p["m_i"])
+        return s_hoek*p["compressive_strength"]/m_hoek
+    if criterion == "mohr-coulomb":
+        sin_phi = np.sin(np.radians(p["friction_angle"]))
+        return 2*p["cohesion"]*np.sqrt((1 - sin_phi)/(1 + sin_phi))
+    raise ValueError(f"Unknown criterion: {criterion}")
+
+
+def _factor_of_safety(criterion, stresses, p):
+    """Shear factor of safety with tensile stresses cut off at zero, and the tension flag."""
+    tensile = np.min(stresses, axis=0) < -tensile_strength(criterion, p)
+    stresses = np.maximum(stresses, 0)
+    sigma_1 = np.max(stresses, axis=0)
+    sigma_3 = np.min(stresses, axis=0)
+    if criterion == "hoek-brown":
+        m_hoek, s_hoek = hs.hoek_brown_constants(p["GSI"], p["D_hoek"], p["m_i"])
+        strength = hoek_brown_strength(sigma_3, p["compressive_strength"], m_hoek, s_hoek)
+    else:
+        strength = mohr_coulomb_strength(sigma_3, p["cohesion"], p["friction_angle"])
+    deviator = np.maximum(sigma_1 - sigma_3, 1e-12)
+    return (strength - sigma_3)/deviator, tensile
+
+
+def screen(criterion, **parameters):
+    """
+    Screen designs given as scenario parameters (scalars or arrays), e.g.
+    screen("hoek-brown", GSI=np.linspace(40, 90, 1000), storage_depth=-200).
+    Returns a dict of arrays with the stresses, the shear factors of safety
+    and tension flags of the side wall and roof, and ``factor_of_safety``,
+    the lower of the two.
+    """
+    if criterion not in ("hoek-brown", "mohr-coulomb"):
+        raise ValueError(f"Unknown criterion: {criterion}")
+    p = _inputs(parameters)
+    pressure = p["internal_pressure"]*0.1
+    nu = p["poissons_ratio"]
+    roof_depth = -p["storage_depth"]
+    wall_depth = roof_depth + p["storage_height"]/2
+    radius = p["storage_diameter"]/2
+
+    sigma_v_wall, sigma_h_wall = in_situ_stress(wall_depth, p["rho_rock"], nu)
+    sigma_v_roof, sigma_h_roof = in_situ_stress(roof_depth, p["rho_rock"], nu)
+    wall = 2*sigma_h_wall - pressure
+    roof = (24*sigma_h_roof - (3 + 15*nu)*sigma_v_roof)/(2*(7 - 5*nu)) - pressure/2
+    fs_wall, tensile_wall = _factor_of_safety(criterion, np.stack([wall, pressure, sigma_v_wall]), p)
+    fs_roof, tensile_roof = _factor_of_safety(criterion, np.stack([roof, roof, pressure]), p)
+    return {
+        "sigma_v": sigma_v_wall,
+        "sigma_h": sigma_h_wall,
+        "sigma_theta_wall": wall,
+        "sigma_theta_roof": roof,
+        "lining_hoop_stress": lining_hoop_stress(pressure, radius, p["lining_thickness"],
+                                                 p["youngs_modulus_lining"]*1e3,
+                                                 p["youngs_modulus"]*1e3, p["poissons_ratio"]),
+        "fs_wall": fs_wall,
+        "fs_roof": fs_roof,
+        "tensile_wall": tensile_wall,
+        "tensile_roof": tensile_roof,
+        "factor_of_safety": np.minimum(fs_wall, fs_roof),
+    }
+
+
+def borderline(result, low=1.0, high=2.0):
+    """
+    Mask of designs too close to call without FEM: a factor of safety within
+    [low, high], or above it with rock in tension, which only the FEM (with
+    the lining) resolves.
+    """
+    fs = result["factor_of_safety"]
+    tensile = result["tensile_wall"] | result["tensile_roof"]
+    return (fs >= low) & ((fs <= high) | tensile)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Named solver profiles for the studies of the hydrogen storage model.
+
+By default COMSOL generates a solver sequence per study, which on the 3D
+model is usually a direct solver whose memory grows steeply with the DOFs.
+A profile replaces the linear solver and nonlinear settings of one study:
+
+* "default": COMSOL's generated sequence, unchanged.
+* "direct-fast": PARDISO, the fastest choice when memory is not the limit.
+* "iterative-low-memory": GMRES preconditioned with smoothed aggregation AMG,
+  a fraction of the direct solver's memory; meant for the (nearly) elastic
+  in-situ stage std1.
+* "plasticity-robust": MUMPS with a damped Newton for highly nonlinear
+  problems, more iterations and a fresh Jacobian every iteration; meant for
+  std2 when the rock yields.
+
+Profiles are chosen per study, e.g. {"std1": "iterative-low-memory", "std2":
+"plasticity-robust"}, with H2StorageModel.set_solver_profile() or the
+``solver`` of a scenario (see scenarios.py), and recorded with the results.
+"""
+
+# Study -> (solution tag, solver node) of its sequence
+STUDY_SOLVERS = {"std1": ("sol1", "s1"), "std2": ("sol2", "s1"),
+                 "std3": ("sol3", "t1"), "std4": ("sol4", "t1")}
+
+# Studies a scenario's profiles apply to
+SCENARIO_STUDIES = ("std1", "std2")
+
+
+def _direct_fast(solver):
+    direct = solver.create("d_fast", "Direct")
+    direct.set("linsolver", "pardiso")
+    solver.feature("fc1").set("linsolver", "d_fast")
+
+
+def _iterative_low_memory(solver):
+    iterative = solver.create("i_lowmem", "Iterative")
+    iterative.set("linsolver", "gmres")
+    iterative.set("prefuntype", "right")
+    iterative.set("itrestart", 100)
+    iterative.set("rhob", 400)
+    iterative.create("mg1", "Multigrid").set("prefun", "saamg")
+    solver.feature("fc1").set("linsolver", "i_lowmem")
+
+
+def _plasticity_robust(solver):
+    direct = solver.create("d_robust", "Direct")
+    direct.set("linsolver", "mumps")
+    nonlinear = solver.feature("fc1")
+    nonlinear.set("linsolver", "d_robust")
+    nonlinear.set("dtech", "hnlin") # damped Newton for highly nonlinear problems
+    nonlinear.set("jtech", "onevery")
+    nonlinear.set("maxiter", 100)
+    nonlinear.set("minsteph", 1e-6)
+
+
+PROFILES = {
+    "default": None,
+    "direct-fast": _direct_fast,
+    "iterative-low-memory": _iterative_low_memory,
+    "plasticity-robust": _plasticity_robust,
+}
+
+
+def normalize(profiles=None):
+    """{study: profile} for SCENARIO_STUDIES from None, a profile name or a partial mapping."""
+    if profiles is None:
+        profiles = {}
+    elif isinstance(profiles, str):
+        profiles = {study: profiles for study in SCENARIO_STUDIES}
+    unknown = set(profiles) - set(STUDY_SOLVERS)
+    if unknown:
+        raise ValueError(f"Unknown studies for solver profiles: {', '.join(sorted(unknown))}")
+    for profile in profiles.values():
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown solver profile {profile!r}, expected one of {tuple(PROFILES)}")
+    return {study: profiles.get(study, "default") for study in SCENARIO_STUDIES} | profiles
+
+
+def apply(java, study, profile):
+    """
+    Replace the solver sequence of ``study`` by a fresh one configured with
+    ``profile``. This drops the study's current solution.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown solver profile {profile!r}, expected one of {tuple(PROFILES)}")
+    solution, solver = STUDY_SOLVERS.get(study, (f"sol_{study}", "s1"))
+    if solution in list(java.sol().tags()):
+        java.sol().remove(solution)
+    sequence = java.sol().create(solution)
+    sequence.study(study)
+    sequence.attach(study)
+    sequence.createAutoSequence(study)
+    if PROFILES[profile] is not None:
+        PROFILES[profile](sequence.feature(solver))
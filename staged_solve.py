@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Stage-chained solving of the in-situ (std1) and excavation (std2) studies.
+
+std1 computes the gravity equilibrium before excavation into sol1, which
+std2 reads through iss1 and uses as its initial values. sol1 only depends on
+the geology, geometry and mesh, so scenarios that differ only in internal
+pressure or lining are grouped and solved on one model with std1 run once
+per group.
+"""
+
+import hydrogen_storage as hs
+import solver_profiles
+
+# Parameters that only enter the excavation study (bndl1, tl1 and the lining) or
+# the thermal studies after it
+EXCAVATION_PARAMETERS = {"internal_pressure", "rho_lining", "youngs_modulus_lining",
+                         "poissons_ratio_lining", "lining_thickness"} | hs.THERMAL_PARAMETERS
+
+
+def in_situ_key(criterion, model_dimension, parameters=None):
+    """Key that is equal for scenarios sharing the same in-situ solution sol1."""
+    p = hs.scenario_parameters(parameters)
+    return (criterion, model_dimension) + tuple(
+        (name, p[name]) for name, (_, _, _, applies_to) in hs.COMSOL_PARAMETERS.items()
+        if name not in EXCAVATION_PARAMETERS and applies_to in (None, criterion))
+
+
+def group_by_in_situ(scenarios, criterion, model_dimension):
+    """Group (index, scenario) pairs by in-situ key, keeping first-seen order."""
+    groups = {}
+    for index, scenario in enumerate(scenarios):
+        key = in_situ_key(criterion, model_dimension, scenario)
+        groups.setdefault(key, []).append((index, scenario))
+    return list(groups.values())
+
+
+class StagedSolver:
+    """
+    Re-solve one H2StorageModel for many scenarios, running std1 only when
+    the in-situ state changes and std2 for every scenario.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.in_situ = None
+        self.in_situ_solves = 0
+        self.excavation_solves = 0
+
+    def solve(self, scenario=None, solver=None):
+        """Solve ``scenario`` with the solver profiles ``solver`` (see solver_profiles.normalize)."""
+        inputs = hs.default_parameters()
+        inputs.update(scenario or {})
+        self.handle.update(solve=False, **inputs)
+        for study, profile in solver_profiles.normalize(solver).items():
+            if self.handle.set_solver_profile(study, profile) and study == "std1":
+                self.in_situ = None  # sol1 was dropped with the old sequence
+        key = in_situ_key(self.handle.criterion, self.handle.model_dimension, inputs)
+        if key != self.in_situ:
+            print("Solving in-situ stage std1...", end=" ")
+            self.handle.solve("std1")
+            self.in_situ = key
+            self.in_situ_solves += 1
+            print("Done")
+        print("Solving excavation stage std2...", end=" ")
+        self.handle.solve("std2")
+        self.excavation_solves += 1
+        print("Done")
+        return self.handle
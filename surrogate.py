@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Gaussian process surrogate of the FEM results for instant design queries.
+
+A Surrogate is fitted to the rows of a sweep table (parameter_sweep.run_sweep,
+scenarios.py) over the DESIGN_VARIABLES and predicts the OUTPUTS with a
+standard deviation. One GP per output with an anisotropic squared
+exponential kernel is fitted by maximising the log marginal likelihood;
+predictions are a few small matrix products: tens of microseconds for a
+single query, about ten microseconds per design and output in large batches.
+
+suggest() picks the next FEM runs where the surrogate is least certain, and
+the command line writes them as a scenario file:
+
+    python surrogate.py sweep.csv --suggest 20 --output next.json
+    python scenarios.py next.json --workers 4
+"""
+
+import argparse
+import csv
+import json
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+from scipy.optimize import minimize
+
+from parameter_sweep import latin_hypercube
+
+DESIGN_VARIABLES = ("GSI", "storage_depth", "internal_pressure", "storage_diameter",
+                    "lining_thickness", "youngs_modulus_lining")
+OUTPUTS = ("lining_stress", "plastic_zone", "wall_convergence")
+
+#############################
+# Gaussian process
+#############################
+class GaussianProcess:
+    """
+    GP regression on inputs scaled to the unit cube and standardised targets.
+    Hyperparameters (one length scale per input, signal and noise variance)
+    are fitted with L-BFGS-B from ``restarts`` starting points.
+    """
+
+    def __init__(self, restarts=3, seed=0):
+        self.restarts = restarts
+        self.seed = seed
+
+    def _kernel(self, a, b, lengths, signal):
+        a, b = a/lengths, b/lengths
+        d2 = (a*a).sum(axis=1)[:, None] + (b*b).sum(axis=1)[None, :] - 2*a @ b.T
+        return signal*np.exp(-0.5*np.maximum(d2, 0.0))
+
+    def _nll(self, theta, x, y):
+        """Negative log marginal likelihood and its gradient in log hyperparameters."""
+        lengths, signal, noise = np.exp(theta[:-2]), np.exp(theta[-2]), np.exp(theta[-1])
+        kernel = self._kernel(x, x, lengths, signal)
+        try:
+            factor = cho_factor(kernel + (noise + 1e-10)*np.eye(len(x)), lower=True)
+        except np.linalg.LinAlgError:
+            return 1e25, np.zeros_like(theta)
+        alpha = cho_solve(factor, y)
+        nll = 0.5*y @ alpha + np.log(np.diag(factor[0])).sum() + 0.5*len(x)*np.log(2*np.pi)
+        w = np.outer(alpha, alpha) - cho_solve(factor, np.eye(len(x)))
+        wk = w*kernel
+        gradient = np.empty_like(theta)
+        for i in range(len(lengths)):
+            d = x[:, i]/lengths[i]
+            gradient[i] = -0.5*(wk*(d[:, None] - d[None, :])**2).sum()
+        gradient[-2] = -0.5*wk.sum()
+        gradient[-1] = -0.5*noise*np.trace(w)
+        return nll, gradient
+
+    def fit(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.low = x.min(axis=0)
+        self.span = np.where(x.max(axis=0) > self.low, x.max(axis=0) - self.low, 1.0)
+        self.mean, self.scale = y.mean(), y.std() or 1.0
+        self.x = (x - self.low)/self.span
+        z = (y - self.mean)/self.scale
+        dims = x.shape[1]
+        bounds = [(np.log(1e-2), np.log(1e2))]*dims + [(np.log(1e-2), np.log(1e2)),
+                                                       (np.log(1e-8), np.log(1.0))]
+        rng = np.random.default_rng(self.seed)
+        best = None
+        for attempt in range(self.restarts):
+            start = np.r_[np.log(np.full(dims, 0.5)), 0.0, np.log(1e-3)]
+            if attempt:
+                start = np.array([rng.uniform(low, high) for low, high in bounds])
+            result = minimize(self._nll, start, args=(self.x, z), jac=True, method="L-BFGS-B",
+                              bounds=bounds)
+            if best is None or result.fun < best.fun:
+                best = result
+        self.theta = best.x
+        self.lengths = np.exp(best.x[:-2])
+        self.signal, self.noise = np.exp(best.x[-2]), np.exp(best.x[-1])
+        k = self._kernel(self.x, self.x, self.lengths, self.signal) + (self.noise + 1e-10)*np.eye(len(x))
+        self.cholesky = np.linalg.cholesky(k)
+        self.alpha = cho_solve((self.cholesky, True), z)
+        self.inverse = cho_solve((self.cholesky, True), np.eye(len(x)))
+        return self
+
+    def predict(self, x, extra=None, noise=True):
+        """
+        Mean and standard deviation at the rows of ``x``. The deviation
+        includes the fitted noise (mesh and solver scatter) unless ``noise``
+        is False. ``extra`` are further inputs assumed observed (their values
+        do not matter for the deviation), used by suggest() to spread a batch.
+        """
+        x = (np.atleast_2d(np.asarray(x, dtype=float)) - self.low)/self.span
+        ks = self._kernel(x, self.x, self.lengths, self.signal)
+        mean = self.mean + self.scale*(ks @ self.alpha)
+        if extra is None:
+            variance = self.signal - ((ks @ self.inverse)*ks).sum(axis=1)
+        else:
+            known = np.vstack([self.x, (np.atleast_2d(extra) - self.low)/self.span])
+            k = self._kernel(known, known, self.lengths, self.signal) + (self.noise + 1e-10)*np.eye(len(known))
+            v = solve_triangular(np.linalg.cholesky(k), self._kernel(known, x, self.lengths, self.signal),
+                                 lower=True)
+            variance = self.signal - (v*v).sum(axis=0)
+        if noise:
+            variance = variance + self.noise
+        return mean, self.scale*np.sqrt(np.maximum(variance, 0.0))
+
+    def to_dict(self):
+        return {"theta": self.theta, "low": self.low, "span": self.span, "x": self.x,
+                "alpha": self.alpha, "inverse": self.inverse, "mean": self.mean,
+                "scale": self.scale}
+
+    @classmethod
+    def from_dict(cls, data):
+        gp = cls()
+        gp.theta = np.asarray(data["theta"])
+        gp.lengths = np.exp(gp.theta[:-2])
+        gp.signal, gp.noise = np.exp(gp.theta[-2]), np.exp(gp.theta[-1])
+        for name in ("low", "span", "x", "alpha", "inverse"):
+            setattr(gp, name, np.asarray(data[name]))
+        gp.mean, gp.scale = float(data["mean"]), float(data["scale"])
+        return gp
+
+#############################
+# Surrogate of the sweep outputs
+#############################
+def load_rows(path):
+    """Solved rows of a sweep table as dicts of floats where possible."""
+    rows = []
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            if row.get("status", "done") != "done":
+                continue
+            for key, value in row.items():
+                try:
+                    row[key] = float(value)
+                except (TypeError, ValueError):
+                    pass
+            rows.append(row)
+    return rows
+
+
+class Surrogate:
+    """One GaussianProcess per output, fitted on sweep result rows."""
+
+    def __init__(self, variables=DESIGN_VARIABLES, outputs=OUTPUTS):
+        self.variables = tuple(variables)
+        self.outputs = tuple(outputs)
+        self.models = {}
+
+    def fit(self, rows, restarts=3):
+        """Fit on ``rows`` (dicts, e.g. from load_rows); rows missing an output are skipped for it."""
+        for output in self.outputs:
+            usable = [row for row in rows if isinstance(row.get(output), float)
+                      and np.isfinite(row[output])]
+            if len(usable) < 2:
+                raise ValueError(f"Not enough solved rows with {output!r} to fit")
+            x = [[row[name] for name in self.variables] for row in usable]
+            self.models[output] = GaussianProcess(restarts).fit(x, [row[output] for row in usable])
+        return self
+
+    def _design_matrix(self, designs):
+        if isinstance(designs, dict):
+            return np.column_stack(np.broadcast_arrays(*(np.asarray(designs[name], dtype=float)
+                                                         for name in self.variables)))
+        return np.asarray(designs, dtype=float)
+
+    def predict(self, designs):
+        """
+        {output: (mean, std)} for ``designs``, either a dict of broadcastable
+        arrays keyed by the design variables or an array with one column each.
+        """
+        x = self._design_matrix(designs)
+        return {output: model.predict(x) for output, model in self.models.items()}
+
+    def uncertainty(self, x, extra=None):
+        """Sum over outputs of the standard deviation relative to the output's spread."""
+        return sum(model.predict(x, extra, noise=False)[1]/model.scale
+                   for model in self.models.values())
+
+    def save(self, path):
+        data = {"variables": np.array(self.variables), "outputs": np.array(self.outputs)}
+        for output, model in self.models.items():
+            data.update({f"{output}/{key}": value for key, value in model.to_dict().items()})
+        np.savez(path, **data)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            surrogate = cls(data["variables"].tolist(), data["outputs"].tolist())
+            for output in surrogate.outputs:
+                surrogate.models[output] = GaussianProcess.from_dict(
+                    {key.split("/", 1)[1]: data[key] for key in data.files
+                     if key.startswith(output + "/")})
+        return surrogate
+
+
+def suggest(surrogate, bounds, count=10, candidates=2000, seed=None):
+    """
+    ``count`` designs within ``bounds`` ({variable: (low, high)}) where the
+    surrogate is least certain. Candidates are a Latin hypercube; after each
+    pick the surrogate treats that design as solved, so the batch spreads out
+    instead of clustering around one uncertain spot.
+    """
+    pool = latin_hypercube(bounds, candidates, seed)
+    x = np.array([[design[name] for name in surrogate.variables] for design in pool], dtype=float)
+    chosen = []
+    for _ in range(min(count, len(pool))):
+        extra = x[chosen] if chosen else None
+        score = surrogate.uncertainty(x, extra)
+        score[chosen] = -np.inf
+        chosen.append(int(np.argmax(score)))
+    return [pool[i] for i in chosen]
+
+#############################
+# Command line
+#############################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit the surrogate to a sweep table and suggest new runs.")
+    parser.add_argument("table", help="sweep result CSV")
+    parser.add_argument("--save", help="write the fitted surrogate to this .npz file")
+    parser.add_argument("--suggest", type=int, default=0, help="number of new scenarios to suggest")
+    parser.add_argument("--output", default="suggested.json", help="scenario file for the suggestions")
+    parser.add_argument("--criterion", default="hoek-brown")
+    parser.add_argument("--dimension", default="3d")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    rows = load_rows(args.table)
+    surrogate = Surrogate().fit(rows)
+    print(f"Fitted on {len(rows)} scenarios")
+    for output, model in surrogate.models.items():
+        lengths = ", ".join(f"{name} {length:.2g}" for name, length in zip(surrogate.variables, model.lengths))
+        print(f"  {output}: noise {np.sqrt(model.noise)*model.scale:.3g}, length scales {lengths}")
+    if args.save:
+        surrogate.save(args.save)
+    if args.suggest:
+        bounds = {name: (min(row[name] for row in rows), max(row[name] for row in rows))
+                  for name in surrogate.variables}
+        designs = suggest(surrogate, bounds, args.suggest, seed=args.seed)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"defaults": {"criterion": args.criterion, "dimension": args.dimension},
+                       "scenarios": [{"name": f"suggested_{i}", **design}
+                                     for i, design in enumerate(designs)]}, file, indent=1)
+        print(f"{len(designs)} suggested scenarios written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
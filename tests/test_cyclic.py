@@ -0,0 +1,31 @@
+import numpy as np
+
+import cyclic
+import hydrogen_storage as hs
+from comsol_backend import RecordingBackend
+
+
+def _handle():
+    return hs.create_h2storagemodel("hoek-brown", "2d", backend=RecordingBackend(), save=False)
+
+
+def test_recorded_schedule_loads_back(tmp_path):
+    times, pressures = cyclic.cycle_schedule(40, 180, cycles=2, steps_per_cycle=4)
+    steps = cyclic.CyclicStudy(_handle(), chunk=3).run(times, pressures, tmp_path)
+    assert steps == 8
+    history, fields = cyclic.load_history(tmp_path)
+    assert np.allclose(history["pressure_bar"], pressures)
+    assert np.isnan(history["max_lining_stress"]).all()
+    assert fields == {}
+
+
+def test_cyclic_studies_are_created_once(tmp_path):
+    handle = _handle()
+    times, pressures = cyclic.cycle_schedule(40, 180, cycles=1, steps_per_cycle=4)
+    cyclic.CyclicStudy(handle).run(times, pressures, tmp_path / "first")
+    cyclic.CyclicStudy(handle, jacobian="onevery").run(times, pressures, tmp_path / "second",
+                                                       solve_excavation=False)
+    created = [args[0] for steps, name, args in handle.model.log if name == "create"]
+    assert created.count("cyc1") == created.count("cyc2") == 1
+    solver = handle.model.tree["children"]["sol"]["sol_cyc1"]["children"]["feature"]["s1"]
+    assert solver["children"]["feature"]["fc1"]["properties"]["jtech"] == "onevery"
@@ -0,0 +1,51 @@
+"""
+Recorded model trees of the default 2d and 3d Hoek-Brown and Mohr-Coulomb
+models, compared with the references in tests/golden. After an intended
+change of the builder, rewrite them with ``PYTHONPATH=. python
+tests/test_golden_trees.py`` and review the diff.
+"""
+
+import json
+import os
+
+import pytest
+
+import hydrogen_storage as hs
+from comsol_backend import RecordingBackend
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+MODELS = [(criterion, dimension) for criterion in ("hoek-brown", "mohr-coulomb") for dimension in ("2d", "3d")]
+
+
+def _tree(criterion, dimension):
+    handle = hs.create_h2storagemodel(criterion, dimension, backend=RecordingBackend(), save=False)
+    return json.loads(json.dumps(handle.model.tree)) # tuples as lists, like the stored tree
+
+
+def _path(criterion, dimension):
+    return os.path.join(GOLDEN, f"{criterion}_{dimension}.json")
+
+
+def _differences(tree, reference, path=""):
+    """Paths of the nodes and properties where ``tree`` differs from ``reference``."""
+    if isinstance(tree, dict) and isinstance(reference, dict):
+        return [difference for key in sorted(set(tree) | set(reference), key=str)
+                for difference in _differences(tree.get(key), reference.get(key), f"{path}/{key}")]
+    return [] if tree == reference else [path]
+
+
+@pytest.mark.parametrize("criterion, dimension", MODELS)
+def test_recorded_tree_matches_reference(criterion, dimension):
+    with open(_path(criterion, dimension), encoding="utf-8") as file:
+        reference = json.load(file)
+    differences = _differences(_tree(criterion, dimension), reference)
+    assert not differences, f"{len(differences)} differences, first: {differences[:10]}"
+
+
+if __name__ == "__main__":
+    os.makedirs(GOLDEN, exist_ok=True)
+    for criterion, dimension in MODELS:
+        with open(_path(criterion, dimension), "w", encoding="utf-8") as file:
+            json.dump(_tree(criterion, dimension), file, indent=1, sort_keys=True)
+            file.write("\n")
+        print(f"Wrote {_path(criterion, dimension)}")
@@ -0,0 +1,12 @@
+import model_cache
+
+
+def test_keys_separate_thermal_and_layout_models():
+    keys = {model_cache.cache_key("hoek-brown", "2d"),
+            model_cache.cache_key("hoek-brown", "2d", thermal=True),
+            model_cache.cache_key("hoek-brown", "2d", caverns=3),
+            model_cache.cache_key("hoek-brown", "2d", solved=True)}
+    assert len(keys) == 4
+    templates = {model_cache.template_key("2d"), model_cache.template_key("2d", thermal=True),
+                 model_cache.template_key("2d", caverns=3)}
+    assert len(templates) == 3
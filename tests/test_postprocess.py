@@ -0,0 +1,98 @@
+import numpy as np
+
+import extraction
+import hydrogen_storage as hs
+import postprocess
+
+PARAMETERS = hs.default_parameters()
+RADIUS = hs.storage_diameter/2
+
+
+def _fields(x, epe, y=None):
+    """Wall fields of a 2D storage plus plastic strain at the domain points ``x``."""
+    top, bottom = hs.storage_depth, hs.storage_depth - hs.storage_height
+    # top arc, side wall from its upper to its lower end, bottom arc
+    level = np.array([top, top - hs.arc_length/2, top - hs.arc_length, (top + bottom)/2, bottom + hs.arc_length,
+                      bottom])
+    fields = {"storage_outer_bnd/x": np.full(6, RADIUS), "storage_outer_bnd/y": level,
+              "storage_outer_bnd/u": np.array([0.0, -0.009, -0.004, -0.006, 0.001, 0.0]),
+              "storage_outer_bnd/v": np.array([-0.01, -0.008, 0.0, 0.001, 0.003, 0.002])}
+    x = np.asarray(x, dtype=float)
+    fields.update({"all/x": x, "all/y": np.full(x.shape, -120.0) if y is None else y,
+                   "all/solid.epe": np.asarray(epe, dtype=float)})
+    return fields
+
+
+def test_wall_and_arc_metrics():
+    values = postprocess.metrics("2d", PARAMETERS, _fields([0, 30], [0, 0]))
+    # side wall only: the -0.009 on the top arc does not count
+    assert values["wall_convergence"] == 0.006
+    # largest hoop stress, the tension of the point moving outwards
+    assert np.isclose(values["lining_stress"], hs.youngs_modulus_lining*1e3*0.001/RADIUS)
+    assert np.isclose(values["lining_utilization"], values["lining_stress"]/postprocess.LINING_STRENGTH)
+    assert values["crown_convergence"] == 0.01
+    assert values["invert_convergence"] == 0.003
+    assert values["plastic_zone"] == 0
+
+
+def test_wall_metrics_in_compression():
+    fields = _fields([0], [0])
+    fields["storage_outer_bnd/u"] = np.array([0.0, 0.0, -0.004, -0.006, -0.002, 0.0])
+    values = postprocess.metrics("2d", PARAMETERS, fields)
+    assert np.isclose(values["lining_stress"], -hs.youngs_modulus_lining*1e3*0.002/RADIUS)
+
+
+def test_wall_convergence_is_radial_in_3d():
+    level = hs.storage_depth - hs.storage_height/2
+    angle = np.array([0, np.pi/4, np.pi/2])
+    fields = {"storage_outer_bnd/x": RADIUS*np.cos(angle), "storage_outer_bnd/y": RADIUS*np.sin(angle),
+              "storage_outer_bnd/z": np.full(3, level),
+              # 5 mm inwards at each point, plus a tangential 1 mm that must not count
+              "storage_outer_bnd/u": -0.005*np.cos(angle) - 0.001*np.sin(angle),
+              "storage_outer_bnd/v": -0.005*np.sin(angle) + 0.001*np.cos(angle),
+              "storage_outer_bnd/w": np.zeros(3)}
+    values = postprocess.metrics("3d", PARAMETERS, fields)
+    assert np.isclose(values["wall_convergence"], 0.005)
+    assert np.isclose(values["lining_stress"], -hs.youngs_modulus_lining*1e3*0.005/RADIUS)
+
+
+def test_wall_convergence_towards_the_nearest_storage_axis():
+    spacing = hs.storage_diameter + hs.pillar_width
+    fields = _fields([0], [0])
+    # 3 caverns: the wall of the outer storage that faces the middle one, moving in +x into its storage
+    fields["storage_outer_bnd/x"] = np.full(6, spacing - RADIUS)
+    fields["storage_outer_bnd/u"] = np.array([0.0, 0.0, 0.002, 0.007, 0.001, 0.0])
+    values = postprocess.metrics("2d", PARAMETERS, fields, caverns=3)
+    assert np.isclose(values["wall_convergence"], 0.007)
+
+
+def test_plastic_zone_from_the_storage_axis():
+    values = postprocess.metrics("2d", PARAMETERS, _fields([RADIUS + 1, RADIUS + 4, 80], [0.01, 0.02, 0]))
+    assert np.isclose(values["plastic_zone"], 4)
+
+
+def test_plastic_zone_from_the_nearest_storage_of_a_layout():
+    spacing = hs.storage_diameter + hs.pillar_width
+    # 3 caverns: axes at 0 and spacing; the yielded point is 3 m beyond the outer storage's wall
+    x = [spacing - RADIUS - 3, spacing + RADIUS + 10]
+    values = postprocess.metrics("2d", PARAMETERS, _fields(x, [0.01, 0]), caverns=3)
+    assert np.isclose(values["plastic_zone"], 3)
+
+
+def test_plastic_zone_needs_the_domain_fields():
+    fields = {name: array for name, array in _fields([0], [0]).items() if not name.startswith("all/")}
+    assert np.isnan(postprocess.metrics("2d", PARAMETERS, fields)["plastic_zone"])
+
+
+def test_domain_fields_are_opt_in():
+    assert "all" not in extraction.DEFAULT_FIELDS
+    assert "all" in postprocess.FIELDS
+
+
+def test_iter_metrics_streams_rows(tmp_path):
+    rows = [{"index": 0, "dimension": "2d", "status": "done", **PARAMETERS},
+            {"index": 1, "dimension": "2d", "status": "failed", **PARAMETERS}]
+    extraction.write_fields(_fields([RADIUS + 2], [0.01]), tmp_path, "scenario_000000")
+    results = list(postprocess.iter_metrics(rows, lambda row: postprocess.load_directory(tmp_path, row)))
+    assert np.isclose(results[0][1]["plastic_zone"], 2)
+    assert results[1][1] == {}
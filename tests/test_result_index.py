@@ -0,0 +1,46 @@
+import csv
+
+import hydrogen_storage as hs
+from result_index import ResultIndex
+
+
+def _write_table(path, rows):
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _row(index, status, **values):
+    return {"index": index, "criterion": "hoek-brown", "dimension": "2d", "status": status,
+            **hs.default_parameters(), **values}
+
+
+def test_failed_first_row_keeps_outputs_numeric(tmp_path):
+    _write_table(tmp_path / "sweep.csv", [
+        _row(0, "failed", GSI=50, lining_stress="", error="RuntimeError: no convergence"),
+        _row(1, "done", GSI=55, lining_stress=5.0, error=""),
+        _row(2, "done", GSI=60, lining_stress=30.0, error=""),
+    ])
+    index = ResultIndex(tmp_path / "index")
+    try:
+        assert index.import_table(tmp_path / "sweep.csv") == 3
+        rows = index.query("lining_stress > ?", (20,))
+        assert [row["GSI"] for row in rows] == [60]
+        assert index.aggregate("MAX(lining_stress)") == 30
+        assert index.aggregate("AVG(lining_stress)") == 17.5
+        assert index.query("status = 'failed'")[0]["lining_stress"] is None
+    finally:
+        index.close()
+
+
+def test_adding_a_scenario_again_replaces_it(tmp_path):
+    index = ResultIndex(tmp_path / "index")
+    try:
+        index.add(_row(0, "done", lining_stress=5))
+        index.add({key: str(value) for key, value in _row(0, "done", lining_stress=7).items()})
+        assert len(index) == 1
+        assert index.query()[0]["lining_stress"] == 7
+    finally:
+        index.close()
@@ -0,0 +1,36 @@
+import numpy as np
+
+import hydrogen_storage as hs
+import screening
+
+
+def test_default_hoek_brown_design_is_safe_in_shear():
+    result = screening.screen("hoek-brown")
+    assert result["factor_of_safety"] > 1
+
+
+def test_default_mohr_coulomb_design_is_not_zeroed_by_tension():
+    # the wall and roof are in tension, which is flagged instead of giving FS = 0;
+    # the shear check then sees the gas pressure against the rock mass UCS 2c*sqrt(N_phi)
+    result = screening.screen("mohr-coulomb")
+    assert result["sigma_theta_wall"] < 0 and result["tensile_wall"]
+    sin_phi = np.sin(np.radians(hs.friction_angle))
+    ucs = 2*hs.cohesion*np.sqrt((1 + sin_phi)/(1 - sin_phi))
+    assert np.isclose(result["fs_wall"], ucs/(hs.internal_pressure*0.1))
+
+
+def test_mohr_coulomb_design_with_default_geometry_is_safe_when_strong_enough():
+    result = screening.screen("mohr-coulomb", cohesion=2)
+    assert result["factor_of_safety"] > 1
+
+
+def test_side_wall_uses_the_vertical_cylinder_solution():
+    result = screening.screen("hoek-brown", internal_pressure=0, storage_depth=-1000)
+    assert np.isclose(result["sigma_theta_wall"], 2*result["sigma_h"])
+    assert not result["tensile_wall"]
+
+
+def test_broadcasts_arrays():
+    result = screening.screen("hoek-brown", GSI=np.linspace(40, 90, 11), storage_depth=[[-100], [-300]])
+    assert result["factor_of_safety"].shape == (2, 11)
+    assert screening.borderline(result).shape == (2, 11)